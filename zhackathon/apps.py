@@ -5,3 +5,8 @@ from django.apps import AppConfig
 
 class ZhackathonConfig(AppConfig):
     name = "zhackathon"  # os.path.realpath(__name__).split(os.sep)[-2]
+
+    def ready(self):
+        from . import (  # noqa: F401 pylint: disable=import-outside-toplevel,unused-import
+            signals,
+        )
@@ -1,7 +1,12 @@
 import os
 
-from django.core.asgi import get_asgi_application
+import django
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "zhackathon.settings")
 
-application = get_asgi_application()
+# Like django.core.asgi.get_asgi_application(), with a handler streaming the ticketing events.
+django.setup(set_prefix=False)
+
+from zhackathon.streams import ASGIHandler  # pylint: disable=wrong-import-position
+
+application = ASGIHandler()
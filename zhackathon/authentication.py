@@ -0,0 +1,34 @@
+from django.core.cache import caches
+from django.db import transaction
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+# Cache of the users of the verified tokens, by token key (see settings.CACHES).
+TOKEN_CACHE_ALIAS = "tokens"
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    Authenticates API clients from an "Authorization: Token {key}" header, and keeps the user of each verified token in
+    the "tokens" cache for its TIMEOUT, so that their following requests run no authentication query at all. Tokens
+    are evicted when deleted, e.g. on logout, and when their user is saved, e.g. on a password change (see signals).
+    """
+
+    def authenticate_credentials(self, key):
+        cache = caches[TOKEN_CACHE_ALIAS]
+        if (user := cache.get(key)) is not None:
+            return user, Token(key=key, user=user)
+
+        user, token = super().authenticate_credentials(key)
+        cache.set(key, user)
+        return user, token
+
+
+def evict_tokens_on_commit(keys):
+    """
+    Evicts cached tokens once the transaction revoking them commits: a request verifying one in between would cache
+    it again otherwise.
+    """
+    keys = list(keys)
+    if keys:
+        transaction.on_commit(lambda: caches[TOKEN_CACHE_ALIAS].delete_many(keys))
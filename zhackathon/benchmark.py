@@ -0,0 +1,819 @@
+import asyncio
+import logging
+import math
+import random
+import re
+import threading
+import time
+import uuid
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from fnmatch import fnmatch
+from typing import NamedTuple, Optional
+
+from asgiref.sync import ThreadSensitiveContext, async_to_sync, sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import connections, transaction
+from django.test import AsyncClient, Client, override_settings
+from rest_framework.test import APIClient
+
+from . import search
+from .cache import response_cache
+from .models import (
+    Change,
+    Comment,
+    Festival,
+    FestivalFacet,
+    Postcode,
+    Rating,
+    RatingHistogram,
+    Ticketing,
+)
+from .urls import router
+
+# The benchmark runs in a database of its own, created next to the development one.
+DATABASE_NAME = settings.BASE_DIR / "benchmark_db.sqlite3"
+ID_PREFIX = "BENCH"
+PASSWORD = "zhackathon-benchmark"
+DISCIPLINES = ("Musique", "Cinéma, audiovisuel", "Arts visuels, arts numériques", "Livre, littérature", "Cirque")
+PERIODS = ("Printemps", "Saison estivale", "Après-saison", "Saison hivernale")
+REGIONS = ("Bretagne", "Occitanie", "Grand Est", "Normandie", "Hauts-de-France", "Île-de-France", "Corse")
+WORDS = ("jazz", "rock", "lumière", "conte", "danse", "cirque", "images", "océan", "montagne", "nuit", "été", "voix")
+# Popularity follows a power law, so some festivals and comments get most of the traffic as in real data.
+SKEW = 0.8
+
+
+class Call(NamedTuple):
+    method: str
+    path: str
+    data: Optional[dict] = None
+    # Authenticated user of the request, or None for an anonymous one.
+    user: Optional[User] = None
+    # Logs in again before the request, for requests ending the session.
+    relogin: bool = False
+
+
+class Dataset:
+    """
+    Synthetic festivals, users, comments, likes and ratings generated from a seed, so that two runs with the same
+    parameters benchmark the same data. Rows are bulk inserted in batches and the aggregates, facets and search index
+    that the signals and viewsets usually maintain are written along with them, then the festival neighbours are built.
+    """
+
+    def __init__(self, seed=0):
+        self.random = random.Random(seed)
+        self.admin = None
+        self.festival_ids = []
+        self.comment_ids = []
+        self.ticketing_names = []
+        self.last_change = 0
+        self.used = set()
+
+    def allocate(self, total, buckets, maximum):
+        """
+        Splits total items over buckets with a power law, each bucket holding at most maximum items.
+        """
+        if not buckets:
+            return []
+        weights = [1 / (rank + 1) ** SKEW for rank in range(buckets)]
+        self.random.shuffle(weights)
+        scale = total / sum(weights)
+        return [min(maximum, round(weight * scale)) for weight in weights]
+
+    def generate(self, festivals, users, comments, likes, ratings, batch_size=5000):
+        self.admin = User.objects.create_superuser(f"{ID_PREFIX.lower()}-admin", password=PASSWORD)
+        User.objects.create_user(f"{ID_PREFIX.lower()}-login", password=PASSWORD)
+
+        user_ids = []
+        for start in range(0, users, batch_size):
+            created = User.objects.bulk_create(
+                User(username=f"{ID_PREFIX.lower()}-{index}", password="!")
+                for index in range(start, min(users, start + batch_size))
+            )
+            user_ids += [user.pk for user in created]
+
+        coordinates = {
+            code: (latitude, longitude)
+            for code, latitude, longitude in Postcode.objects.filter(code__regex=r"^[0-9]{2}$").values_list()
+        }
+        departments = sorted(coordinates) or ["35"]
+
+        comment_counts = self.allocate(comments, festivals, comments)
+        rating_counts = self.allocate(ratings, festivals, len(user_ids))
+        like_counts = iter(self.allocate(likes, sum(comment_counts), len(user_ids)))
+
+        weights = settings.LEADERBOARD_SETTINGS["TRENDING_WEIGHTS"]
+        rows = {Festival: [], Ticketing: [], Comment: [], Comment.liked_by.through: [], Rating: [], RatingHistogram: []}
+        for index in range(festivals):
+            festival = self.generate_festival(index, self.random.choice(departments), coordinates)
+            rows[Festival].append(festival)
+            rows[Ticketing].append(
+                Ticketing(
+                    name=f"{festival.pk}-pass", festival=festival, total_tickets=10**6, available_tickets=10**6
+                )
+            )
+
+            festival_likes = 0
+            for _ in range(comment_counts[index]):
+                comment = Comment(
+                    id=uuid.UUID(int=self.random.getrandbits(128), version=4),
+                    author_id=self.random.choice(user_ids),
+                    festival=festival,
+                    content=" ".join(self.random.choices(WORDS, k=12)),
+                    like_count=next(like_counts),
+                )
+                rows[Comment].append(comment)
+                rows[Comment.liked_by.through] += [
+                    Comment.liked_by.through(comment_id=comment.pk, user_id=user_id)
+                    for user_id in self.random.sample(user_ids, comment.like_count)
+                ]
+                festival_likes += comment.like_count
+
+            histogram = Counter()
+            for user_id in self.random.sample(user_ids, rating_counts[index]):
+                rating = Rating(user_id=user_id, festival=festival, rating=self.random.randint(1, Rating.MAX_RATING))
+                rows[Rating].append(rating)
+                histogram[rating.rating] += 1
+            festival.rating_count = sum(histogram.values())
+            festival.rating_sum = sum(rating * count for rating, count in histogram.items())
+            festival.average_rating = festival.rating_sum / festival.rating_count if festival.rating_count else None
+            if festival.rating_count:
+                festival.bayesian_rating = Festival.get_bayesian_rating(festival.rating_count, festival.rating_sum)
+            # All of the activity happened now.
+            activity = (
+                weights["comment"] * comment_counts[index]
+                + weights["like"] * festival_likes
+                + weights["rating"] * festival.rating_count
+            )
+            festival.trending_key = Festival.get_trending_key(activity) if activity else None
+            rows[RatingHistogram] += [
+                RatingHistogram(festival=festival, rating=rating, count=count) for rating, count in histogram.items()
+            ]
+
+            if sum(map(len, rows.values())) >= batch_size or index == festivals - 1:
+                self.flush(rows, batch_size)
+
+        call_command("build_recommendations", verbosity=0)
+        self.load()
+
+    def generate_festival(self, index, department, coordinates):
+        festival = Festival(
+            id=f"{ID_PREFIX}{index:07d}",
+            name=f"Festival {' '.join(self.random.sample(WORDS, 2))} {index}",
+            discipline=self.random.choice(DISCIPLINES),
+            description=" ".join(self.random.choices(WORDS, k=30)),
+            period=self.random.choice(PERIODS),
+            region=REGIONS[int(department) % len(REGIONS)],
+            department=f"Département {department}",
+            commune=f"Commune {self.random.randrange(1000)}",
+            postcode=f"{department}{self.random.randrange(1000):03d}",
+        )
+        if department in coordinates:
+            latitude, longitude = coordinates[department]
+            festival.latitude = latitude + self.random.uniform(-0.3, 0.3)
+            festival.longitude = longitude + self.random.uniform(-0.3, 0.3)
+        return festival
+
+    def flush(self, rows, batch_size):
+        with transaction.atomic():
+            for model, instances in rows.items():
+                model.objects.bulk_create(instances, batch_size=batch_size)
+            FestivalFacet.update_counts(Counter(FestivalFacet.get_key(vars(festival)) for festival in rows[Festival]))
+            search.index_festivals(rows[Festival])
+            for model in (Festival, Ticketing, Comment, Rating):
+                Change.record(model, [instance.pk for instance in rows[model]])
+        for instances in rows.values():
+            instances.clear()
+
+    def load(self):
+        """
+        Loads the ids requests are built from, from a dataset generated by this run or a previous one.
+        """
+        self.admin = User.objects.get(username=f"{ID_PREFIX.lower()}-admin")
+        self.festival_ids = list(Festival.objects.filter(pk__startswith=ID_PREFIX).values_list("pk", flat=True))
+        self.random.shuffle(self.festival_ids)
+        # Comment ids are random, so the first ones by id are a uniform sample.
+        self.comment_ids = list(Comment.objects.order_by("pk").values_list("pk", flat=True)[:10000])
+        self.ticketing_names = [f"{festival_id}-pass" for festival_id in self.festival_ids[:1000]]
+        self.last_change = Change.objects.order_by("-seq").values_list("seq", flat=True).first() or 0
+        self.raters = list(User.objects.filter(rating__isnull=False).distinct().order_by("pk")[:100]) or [self.admin]
+        response_cache.cache.clear()
+
+    def exists(self):
+        return User.objects.filter(username=f"{ID_PREFIX.lower()}-admin").exists()
+
+    def take(self, ids, count):
+        """
+        Picks count ids not yet taken by another endpoint, for requests which can only be sent once per object.
+        """
+        taken = [pk for pk in ids if pk not in self.used][:count]
+        self.used.update(taken)
+        return taken
+
+
+ENDPOINTS = {}
+
+
+def endpoint(name):
+    def decorator(func):
+        ENDPOINTS[name] = func
+        return func
+
+    return decorator
+
+
+def get_routed_actions():
+    """
+    Names, as {basename}-{action}, every action routed by the API router.
+    """
+    names = set()
+    for _, viewset, basename in router.registry:
+        actions = {"list", "create", "retrieve", "update", "partial_update", "destroy"}
+        actions = {action for action in actions if hasattr(viewset, action)}
+        actions |= {action.__name__ for action in viewset.get_extra_actions()}
+        names |= {f"{basename}-{action}" for action in actions}
+    return names
+
+
+@endpoint("festivals-list")
+def festivals_list(dataset: Dataset, count):
+    queries = ["", "?ordering=-average_rating", "?min_rating=3", *(f"?discipline={value}" for value in DISCIPLINES)]
+    return [Call("GET", f"/api/festivals/{dataset.random.choice(queries)}", user=dataset.admin) for _ in range(count)]
+
+
+@endpoint("festivals-retrieve")
+def festivals_retrieve(dataset: Dataset, count):
+    return [
+        Call("GET", f"/api/festivals/{dataset.random.choice(dataset.festival_ids)}/", user=dataset.admin)
+        for _ in range(count)
+    ]
+
+
+@endpoint("festivals-rating")
+def festivals_rating(dataset: Dataset, count):
+    return [
+        Call("GET", f"/api/festivals/{dataset.random.choice(dataset.festival_ids)}/rating/", user=dataset.admin)
+        for _ in range(count)
+    ]
+
+
+@endpoint("festivals-comments")
+def festivals_comments(dataset: Dataset, count):
+    return [
+        Call("GET", f"/api/festivals/{dataset.random.choice(dataset.festival_ids)}/comments/", user=dataset.admin)
+        for _ in range(count)
+    ]
+
+
+@endpoint("festivals-facets")
+def festivals_facets(dataset: Dataset, count):
+    queries = ["", *(f"?discipline={value}" for value in DISCIPLINES), *(f"?region={value}" for value in REGIONS)]
+    return [
+        Call("GET", f"/api/festivals/facets/{dataset.random.choice(queries)}", user=dataset.admin) for _ in range(count)
+    ]
+
+
+@endpoint("festivals-top")
+def festivals_top(dataset: Dataset, count):
+    queries = ["", *(f"?discipline={value}" for value in DISCIPLINES), *(f"?region={value}" for value in REGIONS)]
+    return [
+        Call("GET", f"/api/festivals/top/{dataset.random.choice(queries)}", user=dataset.admin) for _ in range(count)
+    ]
+
+
+@endpoint("festivals-trending")
+def festivals_trending(dataset: Dataset, count):
+    queries = ["", *(f"?discipline={value}" for value in DISCIPLINES), *(f"?region={value}" for value in REGIONS)]
+    return [
+        Call("GET", f"/api/festivals/trending/{dataset.random.choice(queries)}", user=dataset.admin)
+        for _ in range(count)
+    ]
+
+
+@endpoint("festivals-similar")
+def festivals_similar(dataset: Dataset, count):
+    return [
+        Call("GET", f"/api/festivals/{dataset.random.choice(dataset.festival_ids)}/similar/", user=dataset.admin)
+        for _ in range(count)
+    ]
+
+
+@endpoint("festivals-overview")
+def festivals_overview(dataset: Dataset, count):
+    return [
+        Call("GET", f"/api/festivals/{dataset.random.choice(dataset.festival_ids)}/overview/", user=dataset.admin)
+        for _ in range(count)
+    ]
+
+
+@endpoint("festivals-ticketings_stream")
+def festivals_ticketings_stream(dataset: Dataset, count):
+    # The first event only, which is all the test clients get.
+    return [
+        Call(
+            "GET",
+            f"/api/festivals/{dataset.random.choice(dataset.festival_ids)}/ticketings/stream/",
+            user=dataset.admin,
+        )
+        for _ in range(count)
+    ]
+
+
+@endpoint("festivals-export")
+def festivals_export(dataset: Dataset, count):
+    queries = ["format=csv", "format=ndjson", *(f"format=csv&discipline={value}" for value in DISCIPLINES)]
+    return [
+        Call("GET", f"/api/festivals/export/?{dataset.random.choice(queries)}", user=dataset.admin)
+        for _ in range(count)
+    ]
+
+
+@endpoint("festivals-search")
+def festivals_search(dataset: Dataset, count):
+    return [
+        Call("GET", f"/api/festivals/search/?q={dataset.random.choice(WORDS)}", user=dataset.admin)
+        for _ in range(count)
+    ]
+
+
+@endpoint("festivals-nearby")
+def festivals_nearby(dataset: Dataset, count):
+    festivals = Festival.objects.filter(pk__in=dataset.festival_ids[:100], postcode__isnull=False)
+    postcodes = list(festivals.values_list("postcode", flat=True)) or ["35000"]
+    return [
+        Call("GET", f"/api/festivals/nearby/?postcode={dataset.random.choice(postcodes)}", user=dataset.admin)
+        for _ in range(count)
+    ]
+
+
+@endpoint("festivals-create")
+def festivals_create(dataset: Dataset, count):
+    return [
+        Call("POST", "/api/festivals/", {"name": "Festival", "discipline": "Musique"}, dataset.admin)
+        for _ in range(count)
+    ]
+
+
+@endpoint("festivals-update")
+def festivals_update(dataset: Dataset, count):
+    return [
+        Call(
+            "PUT",
+            f"/api/festivals/{dataset.random.choice(dataset.festival_ids)}/",
+            {"name": f"Festival {dataset.random.choice(WORDS)}", "discipline": dataset.random.choice(DISCIPLINES)},
+            dataset.admin,
+        )
+        for _ in range(count)
+    ]
+
+
+@endpoint("festivals-partial_update")
+def festivals_partial_update(dataset: Dataset, count):
+    return [
+        Call(
+            "PATCH",
+            f"/api/festivals/{dataset.random.choice(dataset.festival_ids)}/",
+            {"description": " ".join(dataset.random.choices(WORDS, k=30))},
+            dataset.admin,
+        )
+        for _ in range(count)
+    ]
+
+
+@endpoint("festivals-destroy")
+def festivals_destroy(dataset: Dataset, count):
+    festivals = [
+        Festival.objects.create(id=f"{ID_PREFIX}-{uuid.uuid4().hex[:12]}", name="Festival", discipline="Musique")
+        for _ in range(count)
+    ]
+    return [Call("DELETE", f"/api/festivals/{festival.pk}/", user=dataset.admin) for festival in festivals]
+
+
+@endpoint("comments-list")
+def comments_list(dataset: Dataset, count):
+    return [
+        Call("GET", f"/api/comments/?festival={dataset.random.choice(dataset.festival_ids)}", user=dataset.admin)
+        for _ in range(count)
+    ]
+
+
+@endpoint("comments-export")
+def comments_export(dataset: Dataset, count):
+    return [
+        Call(
+            "GET",
+            f"/api/comments/export/?festival={dataset.random.choice(dataset.festival_ids)}&format=ndjson",
+            user=dataset.admin,
+        )
+        for _ in range(count)
+    ]
+
+
+@endpoint("comments-create")
+def comments_create(dataset: Dataset, count):
+    return [
+        Call(
+            "POST",
+            "/api/comments/",
+            {
+                "festival": dataset.random.choice(dataset.festival_ids),
+                "content": " ".join(dataset.random.choices(WORDS)),
+            },
+            dataset.admin,
+        )
+        for _ in range(count)
+    ]
+
+
+def create_comments(dataset: Dataset, count):
+    return Comment.objects.bulk_create(
+        Comment(author=dataset.admin, festival_id=dataset.random.choice(dataset.festival_ids), content="Comment")
+        for _ in range(count)
+    )
+
+
+@endpoint("comments-update")
+def comments_update(dataset: Dataset, count):
+    return [
+        Call("PUT", f"/api/comments/{comment.pk}/", {"content": "Updated"}, dataset.admin)
+        for comment in create_comments(dataset, count)
+    ]
+
+
+@endpoint("comments-partial_update")
+def comments_partial_update(dataset: Dataset, count):
+    return [
+        Call("PATCH", f"/api/comments/{comment.pk}/", {"content": "Updated"}, dataset.admin)
+        for comment in create_comments(dataset, count)
+    ]
+
+
+@endpoint("comments-destroy")
+def comments_destroy(dataset: Dataset, count):
+    return [
+        Call("DELETE", f"/api/comments/{comment.pk}/", user=dataset.admin)
+        for comment in create_comments(dataset, count)
+    ]
+
+
+@endpoint("comments-like")
+def comments_like(dataset: Dataset, count):
+    return [
+        Call("POST", f"/api/comments/{comment_id}/like/", user=dataset.admin)
+        for comment_id in dataset.take(dataset.comment_ids, count)
+    ]
+
+
+@endpoint("comments-unlike")
+def comments_unlike(dataset: Dataset, count):
+    comments = Comment.objects.filter(pk__in=dataset.take(dataset.comment_ids, count))
+    for comment in comments:
+        comment.like(dataset.admin)
+    return [Call("DELETE", f"/api/comments/{comment.pk}/unlike/", user=dataset.admin) for comment in comments]
+
+
+@endpoint("comments-likes")
+def comments_likes(dataset: Dataset, count):
+    return [
+        Call("GET", f"/api/comments/{dataset.random.choice(dataset.comment_ids)}/likes/", user=dataset.admin)
+        for _ in range(count)
+    ]
+
+
+@endpoint("ratings-list")
+def ratings_list(dataset: Dataset, count):
+    return [
+        Call("GET", f"/api/ratings/?festival={dataset.random.choice(dataset.festival_ids)}", user=dataset.admin)
+        for _ in range(count)
+    ]
+
+
+@endpoint("ratings-export")
+def ratings_export(dataset: Dataset, count):
+    return [
+        Call("GET", f"/api/ratings/export/?festival={dataset.random.choice(dataset.festival_ids)}", user=dataset.admin)
+        for _ in range(count)
+    ]
+
+
+@endpoint("ratings-create")
+def ratings_create(dataset: Dataset, count):
+    return [
+        Call("POST", "/api/ratings/", {"festival": festival_id, "rating": dataset.random.randint(1, 5)}, dataset.admin)
+        for festival_id in dataset.take(dataset.festival_ids, count)
+    ]
+
+
+def create_ratings(dataset: Dataset, count):
+    ratings = []
+    for festival_id in dataset.take(dataset.festival_ids, count):
+        ratings.append(Rating.objects.create(user=dataset.admin, festival_id=festival_id, rating=3))
+    return ratings
+
+
+@endpoint("ratings-update")
+def ratings_update(dataset: Dataset, count):
+    return [
+        Call("PUT", f"/api/ratings/{rating.pk}/", {"festival": rating.festival_id, "rating": 4}, dataset.admin)
+        for rating in create_ratings(dataset, count)
+    ]
+
+
+@endpoint("ratings-partial_update")
+def ratings_partial_update(dataset: Dataset, count):
+    return [
+        Call("PATCH", f"/api/ratings/{rating.pk}/", {"rating": 1}, dataset.admin)
+        for rating in create_ratings(dataset, count)
+    ]
+
+
+@endpoint("ratings-destroy")
+def ratings_destroy(dataset: Dataset, count):
+    return [
+        Call("DELETE", f"/api/ratings/{rating.pk}/", user=dataset.admin) for rating in create_ratings(dataset, count)
+    ]
+
+
+@endpoint("ticketings-reserve")
+def ticketings_reserve(dataset: Dataset, count):
+    return [
+        Call(
+            "POST",
+            f"/api/ticketings/{dataset.random.choice(dataset.ticketing_names)}/reserve/",
+            {"quantity": 1},
+            dataset.admin,
+        )
+        for _ in range(count)
+    ]
+
+
+@endpoint("changes-list")
+def changes_list(dataset: Dataset, count):
+    # Clients syncing from scratch, and clients catching up from anywhere in the log.
+    return [
+        Call(
+            "GET",
+            f"/api/changes/?since={dataset.random.choice([0, dataset.random.randrange(dataset.last_change + 1)])}",
+            user=dataset.admin,
+        )
+        for _ in range(count)
+    ]
+
+
+@endpoint("cache-stats")
+def cache_stats(dataset: Dataset, count):
+    return [Call("GET", "/api/cache/stats/", user=dataset.admin) for _ in range(count)]
+
+
+@endpoint("user-create")
+def user_create(dataset: Dataset, count):
+    return [
+        Call(
+            "POST",
+            "/api/user/",
+            {
+                "username": name,
+                "email": f"{name}@zhackathon.fr",
+                "password": PASSWORD,
+                "password_confirmation": PASSWORD,
+            },
+        )
+        for name in (f"{ID_PREFIX.lower()}-new-{uuid.uuid4().hex[:12]}" for _ in range(count))
+    ]
+
+
+@endpoint("user-login")
+def user_login(dataset: Dataset, count):
+    return [
+        Call("PUT", "/api/user/login/", {"username": f"{ID_PREFIX.lower()}-login", "password": PASSWORD})
+        for _ in range(count)
+    ]
+
+
+@endpoint("user-token")
+def user_token(dataset: Dataset, count):
+    return [
+        Call("POST", "/api/user/token/", {"username": f"{ID_PREFIX.lower()}-login", "password": PASSWORD})
+        for _ in range(count)
+    ]
+
+
+@endpoint("user-batch")
+def user_batch(dataset: Dataset, count):
+    return [
+        Call(
+            "POST",
+            "/api/user/batch/",
+            {
+                "users": [
+                    {"username": name, "email": f"{name}@zhackathon.fr", "password": PASSWORD}
+                    for name in (f"{ID_PREFIX.lower()}-batch-{uuid.uuid4().hex[:12]}" for _ in range(10))
+                ]
+            },
+            dataset.admin,
+        )
+        for _ in range(count)
+    ]
+
+
+@endpoint("user-logout")
+def user_logout(dataset: Dataset, count):
+    return [Call("DELETE", "/api/user/logout/", user=dataset.admin, relogin=True) for _ in range(count)]
+
+
+@endpoint("user-recommendations")
+def user_recommendations(dataset: Dataset, count):
+    return [Call("GET", "/api/user/recommendations/", user=dataset.random.choice(dataset.raters)) for _ in range(count)]
+
+
+def percentile(values, rank):
+    """
+    Nearest-rank percentile of sorted values.
+    """
+    return values[max(0, math.ceil(rank / 100 * len(values)) - 1)]
+
+
+class Runner:
+    """
+    Sends the calls of each endpoint through the test client and measures the latency of every request, and its number
+    of queries as reported by the Server-Timing header of the metrics middleware. Requests are sent from concurrency
+    threads, each with its own clients and database connection, or with asgi=True as concurrent tasks of a single
+    event loop going through the ASGI handler, like the requests of one ASGI worker.
+    """
+
+    def __init__(self, concurrency=1, warmup=5, asgi=False):
+        self.concurrency = concurrency
+        self.warmup = warmup
+        self.asgi = asgi
+        self.local = threading.local()
+
+    def get_client(self, call: Call):
+        if call.user is None:
+            return APIClient(raise_request_exception=False)
+
+        clients = self.local.__dict__.setdefault("clients", {})
+        if call.user.pk not in clients or call.relogin:
+            clients[call.user.pk] = APIClient(raise_request_exception=False)
+            clients[call.user.pk].force_login(call.user)
+        return clients[call.user.pk]
+
+    def send(self, call: Call):
+        client = self.get_client(call)
+        started_at = time.perf_counter()
+        response = getattr(client, call.method.lower())(call.path, call.data, **self.get_format(call))
+        # Streamed responses, i.e. exports, are only done once their content is.
+        response.getvalue()
+        return time.perf_counter() - started_at, get_queries(response), response.status_code
+
+    def send_all(self, calls):
+        try:
+            return [self.send(call) for call in calls]
+        finally:
+            if threading.current_thread() is not threading.main_thread():
+                connections.close_all()
+
+    @staticmethod
+    def get_format(call: Call):
+        return {} if call.method == "GET" else {"format": "json"}
+
+    @staticmethod
+    def get_cookies(calls):
+        """
+        Logs in the users of the calls beforehand, since the session cookies of an async client cannot be set up
+        from the event loop.
+        """
+        sessions, cookies = {}, []
+        for call in calls:
+            if call.user is not None and (call.relogin or call.user.pk not in sessions):
+                client = Client()
+                client.force_login(call.user)
+                sessions[call.user.pk] = client.cookies
+            cookies.append(sessions[call.user.pk] if call.user is not None else {})
+        return cookies
+
+    async def asend(self, call: Call, cookies):
+        client = AsyncClient(raise_request_exception=False)
+        client.cookies.update(cookies)
+        data = {} if call.data is None else {"data": call.data, "content_type": "application/json"}
+
+        started_at = time.perf_counter()
+        response = await getattr(client, call.method.lower())(call.path, **data)
+        response.getvalue()
+        return time.perf_counter() - started_at, get_queries(response), response.status_code
+
+    async def asend_all(self, calls, cookies):
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def send(call, cookies):
+            async with semaphore:
+                if self.concurrency == 1:
+                    return await self.asend(call, cookies)
+                # Like the ASGI handler, runs the sync code of each request in a thread of its own.
+                async with ThreadSensitiveContext():
+                    try:
+                        return await self.asend(call, cookies)
+                    finally:
+                        await sync_to_async(connections.close_all)()
+
+        return await asyncio.gather(*(send(call, cookie) for call, cookie in zip(calls, cookies)))
+
+    def run(self, dataset: Dataset, patterns=("*",), requests=100):
+        # Server errors are counted in the report, their tracebacks would only drown it.
+        logger = logging.getLogger("django.request")
+        level, _ = logger.level, logger.setLevel(logging.CRITICAL)
+        try:
+            with override_settings(
+                METRICS_SETTINGS={**settings.METRICS_SETTINGS, "ENABLED": True, "SERVER_TIMING": True}
+            ):
+                return self.run_endpoints(dataset, patterns, requests)
+        finally:
+            logger.setLevel(level)
+
+    def run_endpoints(self, dataset: Dataset, patterns, requests):
+        report = {}
+        for name, build in ENDPOINTS.items():
+            if not any(fnmatch(name, pattern) for pattern in patterns):
+                continue
+
+            calls = build(dataset, self.warmup + requests)
+            warmup, calls = calls[: self.warmup], calls[self.warmup :]
+
+            if self.asgi:
+                async_to_sync(self.asend_all)(warmup, self.get_cookies(warmup))
+                cookies = self.get_cookies(calls)
+                started_at = time.perf_counter()
+                results = async_to_sync(self.asend_all)(calls, cookies)
+            elif self.concurrency == 1:
+                self.send_all(warmup)
+                started_at = time.perf_counter()
+                results = self.send_all(calls)
+            else:
+                self.send_all(warmup)
+                started_at = time.perf_counter()
+                with ThreadPoolExecutor(self.concurrency) as executor:
+                    shares = executor.map(
+                        self.send_all, (calls[index :: self.concurrency] for index in range(self.concurrency))
+                    )
+                    results = [result for share in shares for result in share]
+            elapsed = time.perf_counter() - started_at
+
+            report[name] = summarize(calls, results, elapsed)
+        return report
+
+
+def get_queries(response):
+    if match := re.search(r'desc="(\d+) queries"', response.get("Server-Timing", "")):
+        return int(match[1])
+    return None
+
+
+def summarize(calls, results, elapsed):
+    latencies = sorted(latency * 1000 for latency, _, _ in results)
+    queries = [count for _, count, _ in results if count is not None]
+    statuses = Counter(str(status) for _, _, status in results)
+    return {
+        "method": calls[0].method if calls else None,
+        "requests": len(results),
+        "errors": sum(count for status, count in statuses.items() if int(status) >= 400),
+        "statuses": dict(sorted(statuses.items())),
+        "throughput": round(len(results) / elapsed, 2) if elapsed else None,
+        "latency_ms": {
+            "mean": round(sum(latencies) / len(latencies), 3) if latencies else None,
+            "p50": round(percentile(latencies, 50), 3) if latencies else None,
+            "p95": round(percentile(latencies, 95), 3) if latencies else None,
+            "p99": round(percentile(latencies, 99), 3) if latencies else None,
+            "max": round(latencies[-1], 3) if latencies else None,
+        },
+        "queries": {
+            "mean": round(sum(queries) / len(queries), 2) if queries else None,
+            "max": max(queries, default=None),
+        },
+    }
+
+
+def compare(report, baseline, tolerance=0.2, min_delta_ms=1.0):
+    """
+    Lists the regressions of a report against a baseline: endpoints which disappeared, started failing, run more
+    queries, or whose p95 latency grew by more than tolerance (and min_delta_ms, to ignore noise on fast endpoints).
+    """
+    regressions = []
+    for name, expected in baseline["endpoints"].items():
+        if name not in report["endpoints"]:
+            regressions.append(f"{name}: missing from the report")
+            continue
+
+        actual = report["endpoints"][name]
+        if actual["errors"] > expected["errors"]:
+            regressions.append(f"{name}: {actual['errors']} error(s) instead of {expected['errors']}")
+        if (actual["queries"]["max"] or 0) > (expected["queries"]["max"] or 0):
+            regressions.append(
+                f"{name}: up to {actual['queries']['max']} queries instead of {expected['queries']['max']}"
+            )
+
+        p95, expected_p95 = actual["latency_ms"]["p95"], expected["latency_ms"]["p95"]
+        if p95 is not None and expected_p95 is not None:
+            if p95 > expected_p95 * (1 + tolerance) and p95 - expected_p95 > min_delta_ms:
+                regressions.append(f"{name}: p95 latency of {p95:.1f}ms instead of {expected_p95:.1f}ms")
+    return regressions
@@ -0,0 +1,234 @@
+import asyncio
+import threading
+import time
+import uuid
+from functools import wraps
+from hashlib import blake2b
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.http import http_date, parse_etags, parse_http_date_safe
+
+from . import metrics, routers
+
+CACHE_ALIAS = "responses"
+
+
+class ResponseCache:
+    """
+    Caches rendered GET responses under namespaces such as "festival:{pk}". Each namespace has a random version token
+    which is part of the keys of its entries: invalidating a namespace replaces the token, so all of its entries become
+    unreachable at once (and are evicted by the backend later) without having to enumerate them.
+    """
+
+    def __init__(self, alias=CACHE_ALIAS):
+        self.alias = alias
+        self.hits = 0
+        self.misses = 0
+        # Namespaces to invalidate again once the replicas caught up, and when.
+        self.delayed = {}
+        self.lock = threading.Lock()
+        self.timer = None
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def get_versions(self, namespaces):
+        keys = [f"version:{namespace}" for namespace in namespaces]
+        versions = self.cache.get_many(keys)
+        for key in keys:
+            if key not in versions:
+                versions[key] = uuid.uuid4().hex
+                if not self.cache.add(key, versions[key], timeout=None):
+                    versions[key] = self.cache.get(key, versions[key])
+        return [versions[key] for key in keys]
+
+    async def aget_versions(self, namespaces):
+        keys = [f"version:{namespace}" for namespace in namespaces]
+        versions = await self.cache.aget_many(keys)
+        for key in keys:
+            if key not in versions:
+                versions[key] = uuid.uuid4().hex
+                if not await self.cache.aadd(key, versions[key], timeout=None):
+                    versions[key] = await self.cache.aget(key, versions[key])
+        return [versions[key] for key in keys]
+
+    def invalidate(self, *namespaces):
+        self.cache.set_many({f"version:{namespace}": uuid.uuid4().hex for namespace in namespaces}, timeout=None)
+
+    def invalidate_on_commit(self, *namespaces):
+        """
+        Invalidates right away, and once more when the current transaction commits, so that a response rendered
+        from the not yet committed state in the meantime cannot stay cached. With read replicas, invalidates a last
+        time once they caught up, for the responses rendered from a replica which did not have the change yet.
+        """
+        self.invalidate(*namespaces)
+        transaction.on_commit(lambda: self.invalidate(*namespaces))
+        if routers.get_replicas():
+            lag = settings.DATABASE_ROUTING["MAX_REPLICATION_LAG"]
+            transaction.on_commit(lambda: self.invalidate_later(namespaces, lag))
+
+    def invalidate_later(self, namespaces, delay):
+        """
+        Invalidates the namespaces in delay seconds, from a single timer thread, the invalidations of a namespace
+        changed repeatedly in the meantime coalescing into one.
+        """
+        deadline = time.monotonic() + delay
+        with self.lock:
+            for namespace in namespaces:
+                self.delayed[namespace] = deadline
+            if self.timer is None:
+                self.schedule(delay)
+
+    def schedule(self, delay):
+        self.timer = threading.Timer(delay, self.invalidate_delayed)
+        self.timer.daemon = True
+        self.timer.start()
+
+    def invalidate_delayed(self):
+        now = time.monotonic()
+        with self.lock:
+            due = [namespace for namespace, deadline in self.delayed.items() if deadline <= now]
+            for namespace in due:
+                del self.delayed[namespace]
+            self.timer = None
+            if self.delayed:
+                self.schedule(min(self.delayed.values()) - now)
+        if due:
+            self.invalidate(*due)
+
+    def get_key(self, request, namespaces):
+        return self.format_key(request, self.get_versions(namespaces))
+
+    async def aget_key(self, request, namespaces):
+        return self.format_key(request, await self.aget_versions(namespaces))
+
+    @staticmethod
+    def format_key(request, versions):
+        authenticator = type(request.successful_authenticator).__name__
+        # The absolute URL: paginated responses link to their other pages on the host and scheme of the request.
+        variant = f"{request.build_absolute_uri()}|{request.accepted_media_type}|{authenticator}"
+        digest = blake2b(variant.encode(), digest_size=16).hexdigest()
+        return f"response:{':'.join(versions)}:{digest}"
+
+    def get_stats(self):
+        total = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "hit_ratio": self.hits / total if total else None}
+
+
+response_cache = ResponseCache()
+
+
+def cache_response(*namespaces):
+    """
+    Caches the rendered 200 responses of a viewset action, sync or async, under the given namespaces, formatted with
+    the URL kwargs, and answers conditional requests with 304 Not Modified. Authentication and permissions are still
+    checked on every request since they run before the action.
+    """
+
+    def decorator(func):
+        if asyncio.iscoroutinefunction(func):
+
+            @wraps(func)
+            async def async_wrapper(self, request, *args, **kwargs):
+                if request.accepted_renderer.format != "json":
+                    return await func(self, request, *args, **kwargs)
+
+                key, entry = await alookup(request, namespaces, kwargs)
+                if entry is not None:
+                    return respond(request, entry, "HIT")
+
+                response = await func(self, request, *args, **kwargs)
+                if (entry := await astore(self, request, key, response)) is None:
+                    return response
+                return respond(request, entry, "MISS")
+
+            return async_wrapper
+
+        @wraps(func)
+        def wrapper(self, request, *args, **kwargs):
+            if request.accepted_renderer.format != "json":
+                return func(self, request, *args, **kwargs)
+
+            key, entry = lookup(request, namespaces, kwargs)
+            if entry is not None:
+                return respond(request, entry, "HIT")
+
+            response = func(self, request, *args, **kwargs)
+            if (entry := store(self, request, key, response)) is None:
+                return response
+            return respond(request, entry, "MISS")
+
+        return wrapper
+
+    return decorator
+
+
+def lookup(request, namespaces, kwargs):
+    key = response_cache.get_key(request, [namespace.format(**kwargs) for namespace in namespaces])
+    if (entry := response_cache.cache.get(key)) is not None:
+        response_cache.hits += 1
+    return key, entry
+
+
+async def alookup(request, namespaces, kwargs):
+    key = await response_cache.aget_key(request, [namespace.format(**kwargs) for namespace in namespaces])
+    if (entry := await response_cache.cache.aget(key)) is not None:
+        response_cache.hits += 1
+    return key, entry
+
+
+def store(view, request, key, response):
+    """
+    Caches a rendered copy of the response and returns the cache entry, unless the response cannot be cached.
+    """
+    if (entry := render_entry(view, request, response)) is not None:
+        response_cache.cache.set(key, entry)
+    return entry
+
+
+async def astore(view, request, key, response):
+    if (entry := render_entry(view, request, response)) is not None:
+        await response_cache.cache.aset(key, entry)
+    return entry
+
+
+def render_entry(view, request, response):
+    response_cache.misses += 1
+    if response.status_code != 200:
+        return None
+
+    renderer = request.accepted_renderer
+    with metrics.timer("render"):
+        content = renderer.render(response.data, request.accepted_media_type, view.get_renderer_context())
+    return {
+        "content": content,
+        "content_type": f"{request.accepted_media_type}; charset={renderer.charset}"
+        if renderer.charset
+        else request.accepted_media_type,
+        "etag": f'"{blake2b(content, digest_size=16).hexdigest()}"',
+        "last_modified": int(time.time()),
+    }
+
+
+def respond(request, entry, status):
+    if is_not_modified(request, entry):
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(entry["content"], content_type=entry["content_type"])
+    response["ETag"] = entry["etag"]
+    response["Last-Modified"] = http_date(entry["last_modified"])
+    response["X-Cache"] = status
+    return response
+
+
+def is_not_modified(request, entry):
+    if if_none_match := request.headers.get("If-None-Match"):
+        etags = parse_etags(if_none_match)
+        return "*" in etags or entry["etag"] in etags or f"W/{entry['etag']}" in etags
+
+    if_modified_since = parse_http_date_safe(request.headers.get("If-Modified-Since", ""))
+    return if_modified_since is not None and entry["last_modified"] <= if_modified_since
@@ -1,8 +1,16 @@
-from django_filters import filterset
+from django_filters import filters, filterset
 
 from . import models
 
 
+class FestivalFilterSet(filterset.FilterSet):
+    min_rating = filters.NumberFilter(field_name="average_rating", lookup_expr="gte")
+
+    class Meta:
+        model = models.Festival
+        fields = ["min_rating", *models.FestivalFacet.DIMENSIONS]
+
+
 class CommentFilterSet(filterset.FilterSet):
     class Meta:
         model = models.Comment
@@ -0,0 +1,146 @@
+import csv
+import math
+import threading
+from collections import defaultdict
+from pathlib import Path
+
+from django.db.models import CharField, Max, Value
+
+from .models import Change, ChangeHorizon, Festival, Postcode
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+POSTCODES_FILE = Path(__file__).resolve().parent / "data" / "postcodes.csv"
+
+
+def haversine(latitude1, longitude1, latitude2, longitude2):
+    latitude1, longitude1, latitude2, longitude2 = map(math.radians, (latitude1, longitude1, latitude2, longitude2))
+    a = (
+        math.sin((latitude2 - latitude1) / 2) ** 2
+        + math.cos(latitude1) * math.cos(latitude2) * math.sin((longitude2 - longitude1) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+
+def read_postcodes(path=POSTCODES_FILE):
+    with open(path, encoding="utf-8", newline="") as file:
+        for row in csv.DictReader(file):
+            yield Postcode(code=row["postcode"], latitude=float(row["latitude"]), longitude=float(row["longitude"]))
+
+
+class GridIndex:
+    """
+    Buckets points into cells of cell_size degrees, so a radius query only measures the points of the few cells
+    overlapping the bounding box of the circle instead of every point.
+    """
+
+    def __init__(self, cell_size=0.25):
+        self.cell_size = cell_size
+        self.cells = defaultdict(dict)
+        self.points = {}
+        self.lock = threading.Lock()
+
+    def _get_cell(self, latitude, longitude):
+        return math.floor(latitude / self.cell_size), math.floor(longitude / self.cell_size)
+
+    def add(self, key, latitude, longitude):
+        with self.lock:
+            self._remove(key)
+            if latitude is not None and longitude is not None:
+                self.points[key] = (latitude, longitude)
+                self.cells[self._get_cell(latitude, longitude)][key] = (latitude, longitude)
+
+    def remove(self, key):
+        with self.lock:
+            self._remove(key)
+
+    def _remove(self, key):
+        if (point := self.points.pop(key, None)) is not None:
+            cell = self._get_cell(*point)
+            del self.cells[cell][key]
+            if not self.cells[cell]:
+                del self.cells[cell]
+
+    def nearby(self, latitude, longitude, radius_km):
+        """
+        Returns the (distance in km, key) pairs of the points within radius_km, closest first.
+        """
+        latitude_span = radius_km / KM_PER_DEGREE
+        longitude_span = radius_km / (KM_PER_DEGREE * max(math.cos(math.radians(latitude)), 1e-6))
+        min_row, min_column = self._get_cell(latitude - latitude_span, longitude - longitude_span)
+        max_row, max_column = self._get_cell(latitude + latitude_span, longitude + longitude_span)
+
+        results = []
+        with self.lock:
+            for row in range(min_row, max_row + 1):
+                for column in range(min_column, max_column + 1):
+                    for key, point in self.cells.get((row, column), {}).items():
+                        if (distance := haversine(latitude, longitude, *point)) <= radius_km:
+                            results.append((distance, key))
+
+        return sorted(results)
+
+
+class FestivalIndex(GridIndex):
+    """
+    Grid of the festival coordinates, loaded from the database on first use. Before each query, it replays the
+    festival changes logged since (see models.Change), whichever process wrote them, and loads everything again once
+    the tombstones it has not seen yet were compacted away. SQLite commits the changes in the order of their sequence
+    numbers, so none is skipped.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Sequence number of the latest change applied, None until loaded.
+        self.seq = None
+        self.refresh_lock = threading.Lock()
+
+    def load(self):
+        seq = Change.objects.aggregate(seq=Max("seq"))["seq"] or 0
+        points = Festival.objects.filter(latitude__isnull=False).values_list("id", "latitude", "longitude")
+        with self.lock:
+            self.cells.clear()
+            self.points.clear()
+        for key, latitude, longitude in points:
+            self.add(key, latitude, longitude)
+        self.seq = seq
+
+    def refresh(self):
+        with self.refresh_lock:
+            if self.seq is None:
+                self.load()
+                return
+
+            # Changes of every model, read by sequence number rather than through the index on model, and the horizon,
+            # with a null model, once it passed the changes applied.
+            horizon = ChangeHorizon.objects.filter(pk=1, seq__gt=self.seq).values_list(
+                "seq", Value(None, CharField()), Value(None, CharField())
+            )
+            changes = list(
+                Change.objects.filter(seq__gt=self.seq)
+                .values_list("seq", "model", "object_id")
+                .union(horizon, all=True)
+            )
+            if any(model is None for _, model, _ in changes):
+                self.load()
+                return
+            if not changes:
+                return
+
+            self.seq = max(seq for seq, _, _ in changes)
+            keys = {key for _, model, key in changes if model == Festival._meta.model_name}
+            points = {
+                key: (latitude, longitude)
+                for key, latitude, longitude in Festival.objects.filter(pk__in=keys).values_list(
+                    "id", "latitude", "longitude"
+                )
+            }
+            for key in keys:
+                self.add(key, *points.get(key, (None, None)))
+
+    def nearby(self, latitude, longitude, radius_km):
+        self.refresh()
+        return super().nearby(latitude, longitude, radius_km)
+
+
+festival_index = FestivalIndex()
@@ -0,0 +1,206 @@
+import atexit
+import logging
+import threading
+from collections import Counter, defaultdict
+from functools import reduce
+from itertools import islice
+from operator import or_
+
+from django.apps import apps
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import connection, models, transaction
+from django.db.models.functions import Coalesce
+
+logger = logging.getLogger(__name__)
+
+# Number of (comment, user) pairs written per statement.
+BATCH_SIZE = 500
+
+
+class LikeBuffer:
+    """
+    Write-behind buffer of the likes and unlikes of this process, used when LIKE_SETTINGS["WRITE_BEHIND"] is enabled.
+    Intents are coalesced per (comment, user): the last one wins, and one restoring the stored state cancels the
+    pending one out. A background thread writes them with a few statements every FLUSH_INTERVAL seconds, as soon as
+    FLUSH_SIZE pairs are pending, and at exit. Like counts read in the meantime add the delta of the pending intents.
+    The flushes also add the buffered likes to the trending scores, with one update per festival rather than per like.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # Only one flush runs at a time, from the background thread or at exit.
+        self.flush_lock = threading.Lock()
+        # Whether each (comment id, user id) pair ends up liked, for the pairs whose stored state differs. Pairs being
+        # written move from pending to flushing.
+        self.pending = {}
+        self.flushing = {}
+        # Like count delta of each comment, over the pending and flushing pairs.
+        self.deltas = Counter()
+        self.thread = None
+        self.wakeup = threading.Event()
+        self.stopping = threading.Event()
+
+    def add(self, comment_id, user_id, liked):
+        key = (comment_id, user_id)
+        stored = None
+        while True:
+            with self.lock:
+                if key in self.pending:
+                    # A pending intent always differs from the state it was buffered over.
+                    if self.pending[key] != liked:
+                        self.remove(key)
+                    size = len(self.pending)
+                    break
+                if (base := self.flushing.get(key, stored)) is not None:
+                    if liked != base:
+                        self.pending[key] = liked
+                        self.deltas[comment_id] += 1 if liked else -1
+                    size = len(self.pending)
+                    break
+            stored = (
+                apps.get_model("zhackathon", "Comment")
+                .liked_by.through.objects.filter(comment_id=comment_id, user_id=user_id)
+                .exists()
+            )
+
+        self.start()
+        if size >= settings.LIKE_SETTINGS["FLUSH_SIZE"]:
+            self.wakeup.set()
+
+    def remove(self, key):
+        liked = self.pending.pop(key)
+        self.deltas[key[0]] -= 1 if liked else -1
+        if not self.deltas[key[0]]:
+            del self.deltas[key[0]]
+
+    def get_delta(self, comment_id):
+        with self.lock:
+            return self.deltas.get(comment_id, 0)
+
+    def is_liked(self, comment_id, user_id, stored):
+        """
+        Whether the user likes the comment, given whether the stored likes say so, once the buffered intents apply.
+        """
+        key = (comment_id, user_id)
+        with self.lock:
+            return self.pending.get(key, self.flushing.get(key, stored))
+
+    def flush(self):
+        """
+        Writes the pending intents, and returns the number of pairs written. On failure, they stay buffered for the
+        next flush.
+        """
+        with self.flush_lock:
+            with self.lock:
+                self.flushing, self.pending = self.pending, {}
+            if not self.flushing:
+                return 0
+
+            try:
+                self.write(self.flushing)
+            except Exception:  # pylint: disable=broad-except
+                logger.exception("Could not write %d buffered likes, retrying at the next flush", len(self.flushing))
+                with self.lock:
+                    for key, liked in self.flushing.items():
+                        # A newer intent on the pair restores its stored state.
+                        if key in self.pending:
+                            del self.pending[key]
+                        else:
+                            self.pending[key] = liked
+                    self.flushing = {}
+                return 0
+
+            with self.lock:
+                for (comment_id, _), liked in self.flushing.items():
+                    self.deltas[comment_id] -= 1 if liked else -1
+                    if not self.deltas[comment_id]:
+                        del self.deltas[comment_id]
+                written, self.flushing = len(self.flushing), {}
+            return written
+
+    @staticmethod
+    def write(intents):
+        comment_model = apps.get_model("zhackathon", "Comment")
+        through = comment_model.liked_by.through
+        items = iter(intents.items())
+        activity = Counter()
+
+        with transaction.atomic():
+            while batch := list(islice(items, BATCH_SIZE)):
+                comment_ids = {comment_id for (comment_id, _), _ in batch}
+                user_ids = {user_id for (_, user_id), _ in batch}
+                # The comments and users deleted since are skipped.
+                festival_ids = dict(
+                    comment_model.objects.filter(pk__in=comment_ids).order_by().values_list("pk", "festival_id")
+                )
+                user_ids = set(User.objects.filter(pk__in=user_ids).values_list("pk", flat=True))
+                batch = [(key, liked) for key, liked in batch if key[0] in festival_ids and key[1] in user_ids]
+
+                through.objects.bulk_create(
+                    [
+                        through(comment_id=comment_id, user_id=user_id)
+                        for (comment_id, user_id), liked in batch
+                        if liked
+                    ],
+                    ignore_conflicts=True,
+                )
+                unliked = defaultdict(list)
+                for (comment_id, user_id), liked in batch:
+                    if not liked:
+                        unliked[comment_id].append(user_id)
+                if unliked:
+                    through.objects.filter(
+                        reduce(or_, (models.Q(comment_id=pk, user_id__in=users) for pk, users in unliked.items()))
+                    ).delete()
+
+                # Counted from the stored likes, which other processes may have written too.
+                likes = through.objects.filter(comment_id=models.OuterRef("pk")).values("comment_id")
+                comment_model.objects.filter(pk__in=festival_ids).update(
+                    like_count=Coalesce(models.Subquery(likes.annotate(count=models.Count("pk")).values("count")), 0)
+                )
+                activity.update(festival_ids[comment_id] for (comment_id, _), liked in batch if liked)
+
+            apps.get_model("zhackathon", "Festival").record_activity(activity, "like")
+
+    def start(self):
+        with self.lock:
+            if self.thread is not None:
+                return
+            self.thread = threading.Thread(target=self.run, name="like-buffer", daemon=True)
+            self.thread.start()
+        atexit.unregister(self.stop)
+        atexit.register(self.stop)
+
+    def run(self):
+        try:
+            while not self.stopping.is_set():
+                self.wakeup.wait(settings.LIKE_SETTINGS["FLUSH_INTERVAL"])
+                self.wakeup.clear()
+                # A failed flush must not stop the thread, or the likes would never be written anymore.
+                try:
+                    self.flush()
+                except Exception:  # pylint: disable=broad-except
+                    logger.exception("Could not flush the buffered likes")
+        finally:
+            connection.close()
+            # So that start() runs a new thread if this one ever stops on its own.
+            with self.lock:
+                if self.thread is threading.current_thread():
+                    self.thread = None
+
+    def stop(self):
+        """
+        Stops the background thread and writes what is still buffered, on a graceful shutdown.
+        """
+        with self.lock:
+            thread, self.thread = self.thread, None
+        if thread is not None:
+            self.stopping.set()
+            self.wakeup.set()
+            thread.join()
+            self.stopping.clear()
+        self.flush()
+
+
+like_buffer = LikeBuffer()
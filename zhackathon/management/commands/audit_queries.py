@@ -0,0 +1,183 @@
+import re
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, models, transaction
+from django.test.utils import CaptureQueriesContext, override_settings
+from rest_framework.filters import OrderingFilter
+from rest_framework.test import APIClient
+
+from zhackathon.cache import CACHE_ALIAS
+from zhackathon.models import Festival, FestivalFacet
+from zhackathon.urls import router
+
+# Query parameters of the list actions which take some, built from a sample object of their viewset.
+ACTION_PARAMETERS = {
+    "festivals-facets": lambda festival: [
+        {},
+        *({dimension: getattr(festival, dimension)} for dimension in FestivalFacet.DIMENSIONS),
+        {"min_rating": festival.average_rating},
+    ],
+    "festivals-top": lambda festival: [{}, {"region": festival.region}, {"discipline": festival.discipline}],
+    "festivals-trending": lambda festival: [{}, {"region": festival.region}, {"discipline": festival.discipline}],
+    "festivals-search": lambda festival: [{"q": festival.name.split()[0]}],
+    "festivals-nearby": lambda festival: [
+        Festival.objects.exclude(latitude=None).values("latitude", "longitude").first() or {"latitude": None}
+    ],
+    # Exports read a whole table by design, only their filtered shapes are audited.
+    "festivals-export": lambda festival: [{"region": festival.region}, {"discipline": festival.discipline}],
+    "comments-export": lambda comment: [{"festival": comment.festival_id}],
+    "ratings-export": lambda rating: [{"festival": rating.festival_id}],
+}
+# Plan steps reading a whole table, without any index: "SCAN comment", or "SCAN TABLE comment" before SQLite 3.36.
+TABLE_SCAN = re.compile(r"^SCAN (?:TABLE )?(\w+)(?: AS \w+)?$")
+TEMP_BTREE = re.compile(r"^USE TEMP B-TREE FOR (.+)$")
+TABLE = re.compile(r'FROM "(\w+)"')
+
+
+def get_parameters(viewset, name, action, sample):
+    """
+    Lists the query parameters to audit an action with: none, every filter and every ordering.
+    """
+    if name in ACTION_PARAMETERS:
+        return ACTION_PARAMETERS[name](sample) if sample is not None else []
+    if action != "list":
+        return [{}]
+
+    parameters = [{}]
+    if filterset_class := getattr(viewset, "filterset_class", None):
+        for filter_name, field in filterset_class.base_filters.items():
+            value = viewset.queryset.exclude(**{field.field_name: None}).values_list(field.field_name, flat=True)
+            # The most frequent value, which spans several pages.
+            value = value.annotate(total=models.Count("pk")).order_by("-total").first()
+            if value is not None:
+                parameters.append({filter_name: value})
+
+    if OrderingFilter in viewset.filter_backends:
+        parameters += [{"ordering": f"{prefix}{field}"} for field in viewset.ordering_fields for prefix in ("", "-")]
+    return parameters
+
+
+def get_requests():
+    """
+    Yields the name and URL of every GET request to audit, on the first object of each viewset.
+    """
+    for prefix, viewset, basename in router.registry:
+        sample = viewset.queryset.order_by("pk").first() if viewset.queryset is not None else None
+        lookup = getattr(sample, viewset.lookup_field, None)
+
+        routes = []
+        if hasattr(viewset, "list"):
+            routes.append(("list", f"/api/{prefix}/"))
+        if hasattr(viewset, "retrieve") and lookup is not None:
+            routes.append(("retrieve", f"/api/{prefix}/{lookup}/"))
+        for action in viewset.get_extra_actions():
+            if "get" not in action.mapping:
+                continue
+            if not action.detail:
+                routes.append((action.__name__, f"/api/{prefix}/{action.url_path}/"))
+            elif lookup is not None:
+                routes.append((action.__name__, f"/api/{prefix}/{lookup}/{action.url_path}/"))
+
+        for action, path in routes:
+            name = f"{basename}-{action}"
+            for parameters in get_parameters(viewset, name, action, sample):
+                if None not in parameters.values():
+                    query = urlencode(parameters)
+                    yield name, f"{path}?{query}" if query else path
+
+
+def explain(sql):
+    with connection.cursor() as cursor:
+        cursor.execute(f"EXPLAIN QUERY PLAN {sql}")
+        return [row[-1] for row in cursor.fetchall()]
+
+
+def get_findings(sql, plan):
+    """
+    Flags the full table scans of filtered or unbounded queries, since the others stop after a page of rows, the
+    temporary B-trees sorting rows, but for the sorts of grouped rows which only sort the groups, and the ones grouping
+    the rows of a full table or index scan.
+    """
+    findings = []
+    scans = any(step.startswith("SCAN ") and "VIRTUAL TABLE" not in step for step in plan)
+    for step in plan:
+        if match := TABLE_SCAN.match(step):
+            if " WHERE " in sql or " LIMIT " not in sql:
+                findings.append(f"full scan of {match[1]}")
+        elif match := TEMP_BTREE.match(step):
+            if (match[1] == "ORDER BY" and " GROUP BY " not in sql) or (match[1] != "ORDER BY" and scans):
+                findings.append(f"temp B-tree for {match[1]}")
+    return findings
+
+
+class Command(BaseCommand):
+    help = (
+        "Sends every GET endpoint, with each filter and ordering, and runs EXPLAIN QUERY PLAN on the queries they "
+        "execute, reporting full table scans and temporary B-tree sorts."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--ignore-table",
+            action="append",
+            dest="ignored_tables",
+            default=["festival_facet", "rating_histogram"],
+            help="Table whose queries are not audited, e.g. because it stays small (repeatable).",
+        )
+
+    def handle(self, *args, **options):
+        if connection.vendor != "sqlite":
+            raise CommandError("EXPLAIN QUERY PLAN is only supported on SQLite")
+
+        findings = 0
+        # The response cache would hide the queries of the requests.
+        caches = {**settings.CACHES, CACHE_ALIAS: {"BACKEND": "django.core.cache.backends.dummy.DummyCache"}}
+        with override_settings(CACHES=caches), transaction.atomic():
+            client = APIClient()
+            client.force_authenticate(User.objects.create_superuser("audit-queries", None, None))
+
+            for name, path in get_requests():
+                findings += self.audit(client, name, path, options)
+
+                # The following page of a keyset pagination queries with the cursor of the first page.
+                response = client.get(path)
+                data = None if response.streaming else response.json()
+                if isinstance(data, dict) and isinstance(next_link := data.get("next"), str):
+                    findings += self.audit(client, name, next_link, options)
+
+            transaction.set_rollback(True)
+
+        if findings:
+            raise CommandError(f"{findings} finding(s)")
+        self.stdout.write(self.style.SUCCESS("No full table scan nor temporary B-tree"))
+
+    def audit(self, client, name, path, options):
+        # A first request loads the in-process indexes, which then serve the audited one.
+        client.get(path)
+        with CaptureQueriesContext(connection) as context:
+            response = client.get(path)
+            # Exports run their query while their content streams.
+            response.getvalue()
+        if response.status_code >= 400:
+            self.stderr.write(self.style.WARNING(f"{name} GET {path} failed with {response.status_code}, skipped"))
+            return 0
+
+        findings = 0
+        for query in context.captured_queries:
+            table = TABLE.search(query["sql"])
+            if not query["sql"].startswith("SELECT") or table is None or table[1] in options["ignored_tables"]:
+                continue
+
+            plan = explain(query["sql"])
+            problems = get_findings(query["sql"], plan)
+            findings += len(problems)
+
+            if problems or options["verbosity"] > 1:
+                style = self.style.ERROR if problems else self.style.SQL_KEYWORD
+                self.stdout.write(style(f"{name} GET {path}: {', '.join(problems) or 'ok'}"))
+                self.stdout.write(f"  {query['sql']}")
+                self.stdout.writelines(f"  - {step}" for step in plan)
+        return findings
@@ -0,0 +1,147 @@
+import json
+import time
+from fnmatch import fnmatch
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.test.utils import (
+    override_settings,
+    setup_test_environment,
+    teardown_test_environment,
+)
+
+from zhackathon import benchmark
+from zhackathon.cache import CACHE_ALIAS
+from zhackathon.models import Comment, Festival, Rating
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmarks every API endpoint in-process on a synthetic dataset, in a database of its own, and reports the "
+        "latency percentiles, throughput and number of queries of each one."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--festivals", type=int, default=1000, help="Number of synthetic festivals.")
+        parser.add_argument("--users", type=int, default=500, help="Number of synthetic users.")
+        parser.add_argument("--comments", type=int, default=10000, help="Number of synthetic comments.")
+        parser.add_argument("--likes", type=int, default=20000, help="Number of synthetic comment likes.")
+        parser.add_argument("--ratings", type=int, default=5000, help="Number of synthetic ratings.")
+        parser.add_argument("--batch-size", type=int, default=5000, help="Number of rows inserted per query.")
+        parser.add_argument("--seed", type=int, default=0, help="Seed of the dataset and of the requests.")
+        parser.add_argument("--requests", type=int, default=100, help="Number of measured requests per endpoint.")
+        parser.add_argument("--warmup", type=int, default=5, help="Number of unmeasured requests per endpoint.")
+        parser.add_argument("--concurrency", type=int, default=1, help="Number of threads sending requests.")
+        parser.add_argument(
+            "--asgi",
+            action="store_true",
+            help="Send the requests as concurrent tasks through the ASGI handler, which serves the async read path.",
+        )
+        parser.add_argument(
+            "--endpoint",
+            action="append",
+            dest="endpoints",
+            help="Only benchmark the endpoints matching this pattern, e.g. 'festivals-*' (repeatable).",
+        )
+        parser.add_argument(
+            "--no-cache", action="store_true", help="Disable the response cache to measure the database path."
+        )
+        parser.add_argument(
+            "--keepdb",
+            action="store_true",
+            help="Keep the benchmark database, and reuse the dataset it already holds instead of generating it.",
+        )
+        parser.add_argument("--output", help="File the JSON report is written to.")
+        parser.add_argument("--baseline", help="JSON report to compare with, failing on regressions.")
+        parser.add_argument(
+            "--tolerance", type=float, default=0.2, help="Relative p95 latency growth tolerated against the baseline."
+        )
+
+    def handle(self, *args, **options):
+        if options["users"] < 1:
+            raise CommandError("At least one user is needed")
+        if unknown := [
+            pattern
+            for pattern in options["endpoints"] or []
+            if not any(fnmatch(name, pattern) for name in benchmark.ENDPOINTS)
+        ]:
+            raise CommandError(f"No endpoint matches {', '.join(unknown)}")
+
+        connection = connections[DEFAULT_DB_ALIAS]
+        connection.settings_dict["TEST"] = {**connection.settings_dict["TEST"], "NAME": benchmark.DATABASE_NAME}
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, keepdb=options["keepdb"])
+        setup_test_environment()
+
+        try:
+            caches = {**settings.CACHES}
+            if options["no_cache"]:
+                caches[CACHE_ALIAS] = {"BACKEND": "django.core.cache.backends.dummy.DummyCache"}
+            with override_settings(CACHES=caches):
+                report = self.run(options)
+        finally:
+            teardown_test_environment()
+            connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=options["keepdb"])
+
+        self.print_report(report)
+        if options["output"]:
+            with open(options["output"], "w", encoding="utf-8") as file:
+                json.dump(report, file, indent=2)
+                file.write("\n")
+
+        if options["baseline"]:
+            with open(options["baseline"], encoding="utf-8") as file:
+                regressions = benchmark.compare(report, json.load(file), options["tolerance"])
+            for regression in regressions:
+                self.stdout.write(self.style.ERROR(f"regression: {regression}"))
+            if regressions:
+                raise CommandError(f"{len(regressions)} regression(s) against {options['baseline']}")
+            self.stdout.write(self.style.SUCCESS("No regression against the baseline"))
+
+    def run(self, options):
+        dataset = benchmark.Dataset(options["seed"])
+        if dataset.exists():
+            dataset.load()
+        else:
+            started_at = time.perf_counter()
+            dataset.generate(
+                options["festivals"],
+                options["users"],
+                options["comments"],
+                options["likes"],
+                options["ratings"],
+                options["batch_size"],
+            )
+            self.stdout.write(f"Generated the dataset in {time.perf_counter() - started_at:.2f}s")
+
+        runner = benchmark.Runner(options["concurrency"], options["warmup"], options["asgi"])
+        endpoints = runner.run(dataset, options["endpoints"] or ["*"], options["requests"])
+
+        return {
+            "parameters": {
+                key: options[key]
+                for key in ("seed", "requests", "warmup", "concurrency", "asgi", "no_cache", "endpoints")
+            },
+            "dataset": {
+                "festivals": Festival.objects.count(),
+                "users": User.objects.count(),
+                "comments": Comment.objects.count(),
+                "likes": Comment.liked_by.through.objects.count(),
+                "ratings": Rating.objects.count(),
+            },
+            "endpoints": endpoints,
+        }
+
+    def print_report(self, report):
+        self.stdout.write(
+            f"{'endpoint':<28}{'requests':>9}{'errors':>8}{'req/s':>10}"
+            f"{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'queries':>9}"
+        )
+        for name, result in report["endpoints"].items():
+            latency = result["latency_ms"]
+            self.stdout.write(
+                f"{name:<28}{result['requests']:>9}{result['errors']:>8}{result['throughput'] or 0:>10.1f}"
+                f"{latency['p50'] or 0:>10.2f}{latency['p95'] or 0:>10.2f}{latency['p99'] or 0:>10.2f}"
+                f"{result['queries']['max'] or 0:>9}"
+            )
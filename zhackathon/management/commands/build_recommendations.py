@@ -0,0 +1,118 @@
+import heapq
+import math
+import time
+from collections import Counter, defaultdict
+from itertools import groupby
+from operator import itemgetter
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from zhackathon.cache import response_cache
+from zhackathon.models import FestivalNeighbour, Rating
+
+
+def get_user_vectors(max_user_ratings):
+    """
+    Streams the ratings of each user as (festival id, rating minus the average rating of the user) pairs, a sparse row
+    of the user-festival matrix, from the (user, festival) index. Users rating a single festival say nothing about
+    similarities, and the few rating most festivals would cost a quadratic number of pairs, so both are skipped.
+    """
+    ratings = Rating.objects.order_by("user_id").values_list("user_id", "festival_id", "rating").iterator(10000)
+    for _, rows in groupby(ratings, key=itemgetter(0)):
+        rows = [(festival_id, rating) for _, festival_id, rating in rows]
+        if 2 <= len(rows) <= max_user_ratings:
+            mean = sum(rating for _, rating in rows) / len(rows)
+            yield [(festival_id, rating - mean) for festival_id, rating in rows]
+
+
+class Command(BaseCommand):
+    help = (
+        "Computes the adjusted cosine similarity of every pair of festivals rated by the same users, and stores the "
+        "most similar neighbours of each festival, which the similar festivals and recommendations are read from."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--neighbours", type=int, default=20, help="Number of neighbours kept per festival.")
+        parser.add_argument(
+            "--min-support", type=int, default=2, help="Number of users two festivals need to be rated by in common."
+        )
+        parser.add_argument(
+            "--max-user-ratings", type=int, default=1000, help="Users with more ratings than this are skipped."
+        )
+        parser.add_argument(
+            "--block-size",
+            type=int,
+            default=1000,
+            help="Number of festivals whose similarities are accumulated per pass over the ratings, which bounds the "
+            "memory used: one pass per block, each holding the similarities of its festivals only.",
+        )
+
+    def handle(self, *args, **options):
+        started_at = time.perf_counter()
+
+        # First pass: the norm of each festival column.
+        norms = Counter()
+        for vector in get_user_vectors(options["max_user_ratings"]):
+            for festival_id, value in vector:
+                norms[festival_id] += value * value
+
+        festival_ids = sorted(festival_id for festival_id, norm in norms.items() if norm > 0)
+        neighbours = 0
+        for start in range(0, len(festival_ids), options["block_size"]):
+            block = set(festival_ids[start : start + options["block_size"]])
+            neighbours += self.build_block(block, norms, options)
+            if options["verbosity"] > 1:
+                self.stdout.write(f"{start + len(block)}/{len(festival_ids)} festivals")
+
+        # Festivals without any usable rating anymore.
+        stale = sorted(
+            set(FestivalNeighbour.objects.values_list("festival_id", flat=True).distinct()) - set(festival_ids)
+        )
+        with transaction.atomic():
+            for start in range(0, len(stale), options["block_size"]):
+                FestivalNeighbour.objects.filter(festival__in=stale[start : start + options["block_size"]]).delete()
+            response_cache.invalidate_on_commit("festivals")
+
+        if options["verbosity"]:
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f"Stored {neighbours} neighbours of {len(festival_ids)} festival(s) in "
+                    f"{time.perf_counter() - started_at:.1f}s"
+                )
+            )
+
+    @staticmethod
+    def build_block(block, norms, options):
+        """
+        Accumulates the dot products of the festivals of the block with every other one over a pass on the ratings,
+        then replaces their stored neighbours by the top ones.
+        """
+        products = defaultdict(Counter)
+        supports = defaultdict(Counter)
+        for vector in get_user_vectors(options["max_user_ratings"]):
+            for festival_id, value in vector:
+                if festival_id not in block:
+                    continue
+                festival_products, festival_supports = products[festival_id], supports[festival_id]
+                for other_id, other_value in vector:
+                    if other_id != festival_id:
+                        festival_products[other_id] += value * other_value
+                        festival_supports[other_id] += 1
+
+        rows = []
+        for festival_id, festival_products in products.items():
+            similarities = (
+                (product / math.sqrt(norms[festival_id] * norms[other_id]), other_id)
+                for other_id, product in festival_products.items()
+                if supports[festival_id][other_id] >= options["min_support"] and product > 0
+            )
+            rows += [
+                FestivalNeighbour(festival_id=festival_id, neighbour_id=other_id, similarity=similarity)
+                for similarity, other_id in heapq.nlargest(options["neighbours"], similarities)
+            ]
+
+        with transaction.atomic():
+            FestivalNeighbour.objects.filter(festival__in=block).delete()
+            FestivalNeighbour.objects.bulk_create(rows, batch_size=1000)
+        return len(rows)
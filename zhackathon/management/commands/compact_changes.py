@@ -0,0 +1,67 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import models, transaction
+from django.utils import timezone
+
+from zhackathon.models import Change, ChangeHorizon, Comment, Rating, Ticketing
+
+# Models whose objects go with their festival, whose tombstone stands for theirs (see signals.record_deletion).
+CHILD_MODELS = (Comment, Rating, Ticketing)
+
+
+class Command(BaseCommand):
+    help = (
+        "Compacts the change log: deletes the changes superseded by a later change of the same object or by the "
+        "tombstone of their festival, then the tombstones older than CHANGE_LOG_SETTINGS['TOMBSTONE_RETENTION'] days, which clients which synced before them "
+        "can no longer catch up from."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size", type=int, default=10000, help="Number of sequence numbers compacted per transaction."
+        )
+
+    def handle(self, *args, **options):
+        later = Change.objects.filter(
+            model=models.OuterRef("model"), object_id=models.OuterRef("object_id"), seq__gt=models.OuterRef("seq")
+        )
+        superseded = Change.objects.filter(models.Exists(later))
+        last = Change.objects.aggregate(last=models.Max("seq"))["last"] or 0
+
+        compacted = orphaned = 0
+        # Short transactions, between which the requests keep writing.
+        for start in range(0, last, options["batch_size"]):
+            with transaction.atomic():
+                compacted += superseded.filter(seq__gt=start, seq__lte=start + options["batch_size"]).delete()[0]
+                orphaned += self.delete_orphans(start, start + options["batch_size"])
+
+        retention = timedelta(days=settings.CHANGE_LOG_SETTINGS["TOMBSTONE_RETENTION"])
+        expired = Change.objects.filter(deleted=True, changed_at__lt=timezone.now() - retention)
+        with transaction.atomic():
+            if horizon := expired.aggregate(horizon=models.Max("seq"))["horizon"]:
+                ChangeHorizon.objects.update_or_create(pk=1, defaults={"seq": horizon})
+            pruned = expired.filter(seq__lte=horizon or 0).delete()[0]
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Deleted {compacted} superseded change(s), {orphaned} change(s) of deleted festivals and {pruned} "
+                f"expired tombstone(s), horizon at {ChangeHorizon.get()}"
+            )
+        )
+
+    @staticmethod
+    def delete_orphans(start, end):
+        """
+        Deletes the changes of the comments, ratings and ticketings deleted with their festival: these have no
+        tombstone of their own, their objects are gone, and the one of the festival comes later in the log.
+        """
+        deleted = 0
+        for model in CHILD_MODELS:
+            changes = Change.objects.filter(model=model._meta.model_name, deleted=False, seq__gt=start, seq__lte=end)
+            object_ids = set(changes.values_list("object_id", flat=True))
+            stored = {str(pk) for pk in model.objects.filter(pk__in=object_ids).values_list("pk", flat=True)}
+            if orphans := object_ids - stored:
+                deleted += changes.filter(object_id__in=orphans).delete()[0]
+        return deleted
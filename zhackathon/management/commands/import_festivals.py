@@ -0,0 +1,203 @@
+import json
+import re
+import time
+from collections import Counter
+from hashlib import blake2b
+from itertools import islice
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from zhackathon import search
+from zhackathon.cache import response_cache
+from zhackathon.models import Change, Festival, FestivalFacet, Postcode
+
+# Festival fields and the keys they are read from in the open data export of data.culture.gouv.fr.
+SOURCE_FIELDS = {
+    "id": "identifiant",
+    "name": "nom_du_festival",
+    "discipline": "discipline_dominante",
+    "website": "site_internet_du_festival",
+    "period": "periode_principale_de_deroulement_du_festival",
+    "region": "region_principale_de_deroulement",
+    "department": "departement_principal_de_deroulement",
+    "commune": "commune_principale_de_deroulement",
+    "postcode": "code_postal_de_la_commune_principale_de_deroulement",
+}
+# Festival fields only read from the records carrying them: fixtures may have a description, the open data export has
+# none, so its records keep the stored one.
+OPTIONAL_FIELDS = ("description",)
+POSTCODE_PATTERN = re.compile("^[0-9]{5}$")
+
+
+def iter_json_array(file, chunk_size=1 << 16):
+    """
+    Yields the items of a top-level JSON array one at a time, holding at most a chunk and one item in memory.
+    """
+    decoder = json.JSONDecoder()
+    buffer, eof = "", False
+
+    while True:
+        buffer = buffer.lstrip()
+        if buffer.startswith((",", "[")):
+            buffer = buffer[1:].lstrip()
+        if buffer.startswith("]"):
+            return
+
+        try:
+            item, end = decoder.raw_decode(buffer)
+        except json.JSONDecodeError as exc:
+            if eof:
+                if buffer:
+                    raise CommandError(f"Invalid JSON: {exc}") from exc
+                return
+            chunk = file.read(chunk_size)
+            eof = not chunk
+            buffer += chunk
+            continue
+
+        yield item
+        buffer = buffer[end:]
+
+
+def iter_ndjson(file):
+    for line in file:
+        if line.strip():
+            yield json.loads(line)
+
+
+def to_festival(record):
+    """
+    Maps an open data record, either raw or wrapped in "fields", or a loaddata fixture entry to festival fields.
+    """
+    if "model" in record and "pk" in record:
+        fields = {"id": record["pk"], **record["fields"]}
+    else:
+        source = record.get("fields", record)
+        fields = {field: source.get(key) for field, key in SOURCE_FIELDS.items()}
+
+    if not fields.get("id") or not fields.get("name"):
+        return None
+
+    fields = {
+        **{field: fields.get(field) for field in SOURCE_FIELDS},
+        **{field: fields[field] for field in OPTIONAL_FIELDS if field in fields},
+    }
+    if fields["postcode"] is not None:
+        fields["postcode"] = str(fields["postcode"])
+    fields["content_hash"] = blake2b(json.dumps(fields, sort_keys=True).encode(), digest_size=16).hexdigest()
+    return fields
+
+
+class Command(BaseCommand):
+    help = "Imports a JSON or NDJSON festivals export by streaming it in batches and only writing changed festivals."
+
+    def add_arguments(self, parser):
+        parser.add_argument("file", help="JSON array or NDJSON file of open data records or festival fixtures.")
+        parser.add_argument("--batch-size", type=int, default=1000, help="Number of festivals upserted per query.")
+
+    def handle(self, *args, **options):
+        self.counts = dict.fromkeys(
+            ("inserted", "updated", "unchanged", "duplicates", "skipped", "invalid_postcodes"), 0
+        )
+        self.postcodes = {}
+        started_at = time.perf_counter()
+
+        with open(options["file"], encoding="utf-8") as file:
+            first = file.read(1)
+            while first.isspace():
+                first = file.read(1)
+            file.seek(0)
+
+            records = iter_json_array(file) if first == "[" else iter_ndjson(file)
+            while batch := list(islice(records, options["batch_size"])):
+                self.import_batch(batch)
+
+        total = sum(self.counts.values()) - self.counts["invalid_postcodes"]
+        elapsed = time.perf_counter() - started_at
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Processed {total} record(s) in {elapsed:.2f}s ({total / max(elapsed, 1e-9):.0f} rows/s): "
+                + ", ".join(f"{count} {name.replace('_', ' ')}" for name, count in self.counts.items())
+            )
+        )
+
+    def import_batch(self, records):
+        festivals = {}
+        for record in records:
+            if (fields := to_festival(record)) is None:
+                self.counts["skipped"] += 1
+            else:
+                self.counts["duplicates"] += fields["id"] in festivals
+                festivals[fields["id"]] = fields
+
+        self.locate(festivals.values())
+
+        existing = {
+            row["id"]: row
+            for row in Festival.objects.filter(pk__in=festivals).values(
+                "id", "content_hash", *OPTIONAL_FIELDS, *FestivalFacet.DIMENSIONS
+            )
+        }
+        changed = [
+            Festival(**{**{field: existing.get(pk, {}).get(field) for field in OPTIONAL_FIELDS}, **fields})
+            for pk, fields in festivals.items()
+            if pk not in existing or existing[pk]["content_hash"] != fields["content_hash"]
+        ]
+        self.counts["unchanged"] += len(festivals) - len(changed)
+        self.counts["updated"] += sum(1 for festival in changed if festival.pk in existing)
+        self.counts["inserted"] += sum(1 for festival in changed if festival.pk not in existing)
+
+        if not changed:
+            return
+
+        # bulk_create() sends no signals, so the facets, search index, change log and response cache are updated here.
+        facets = Counter(FestivalFacet.get_key(vars(festival)) for festival in changed)
+        facets.subtract(FestivalFacet.get_key(existing[festival.pk]) for festival in changed if festival.pk in existing)
+
+        with transaction.atomic():
+            Festival.objects.bulk_create(
+                changed,
+                update_conflicts=True,
+                unique_fields=["id"],
+                update_fields=[
+                    *SOURCE_FIELDS.keys() - {"id"},
+                    *OPTIONAL_FIELDS,
+                    "latitude",
+                    "longitude",
+                    "content_hash",
+                ],
+            )
+            FestivalFacet.update_counts(facets)
+            search.index_festivals(changed)
+            Change.record(Festival, [festival.pk for festival in changed])
+            response_cache.invalidate_on_commit("festivals", *(f"festival:{festival.pk}" for festival in changed))
+
+    def locate(self, festivals):
+        """
+        Drops malformed postcodes and locates a whole batch with a single query on the postcode prefixes not seen yet.
+        """
+        for fields in festivals:
+            if fields["postcode"] is not None and not POSTCODE_PATTERN.match(fields["postcode"]):
+                fields["postcode"] = None
+                self.counts["invalid_postcodes"] += 1
+
+        prefixes = {
+            fields["postcode"][:length] for fields in festivals if fields["postcode"] for length in range(2, 6)
+        } - self.postcodes.keys()
+        if prefixes:
+            self.postcodes.update(dict.fromkeys(prefixes))
+            self.postcodes.update(
+                (code, (latitude, longitude))
+                for code, latitude, longitude in Postcode.objects.filter(code__in=prefixes).values_list()
+            )
+
+        for fields in festivals:
+            fields["latitude"], fields["longitude"] = next(
+                (
+                    self.postcodes[fields["postcode"][:length]]
+                    for length in range(5, 1, -1)
+                    if fields["postcode"] and self.postcodes.get(fields["postcode"][:length])
+                ),
+                (None, None),
+            )
@@ -0,0 +1,62 @@
+import csv
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+from django.core.management.base import BaseCommand
+
+from zhackathon.management.commands.import_festivals import iter_json_array, iter_ndjson
+from zhackathon.provisioning import UserImporter
+
+
+class Command(BaseCommand):
+    help = (
+        "Creates users from a CSV (with a username,email,password header), JSON or NDJSON file, hashing their "
+        "passwords across a process pool and inserting them in batches. Existing and repeated usernames and emails "
+        "are skipped."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("file", help="CSV, JSON array or NDJSON file of username, email and password records.")
+        parser.add_argument("--batch-size", type=int, default=1000, help="Number of users created per batch.")
+        parser.add_argument(
+            "--workers", type=int, default=os.cpu_count() or 1, help="Number of processes hashing the passwords."
+        )
+
+    def handle(self, *args, **options):
+        started_at = time.perf_counter()
+
+        with open(options["file"], encoding="utf-8", newline="") as file, ProcessPoolExecutor(
+            options["workers"], mp_context=multiprocessing.get_context("spawn")
+        ) as executor:
+            first = file.read(1)
+            while first.isspace():
+                first = file.read(1)
+            file.seek(0)
+
+            if first == "[":
+                records = iter_json_array(file)
+            elif first == "{":
+                records = iter_ndjson(file)
+            else:
+                records = csv.DictReader(file)
+
+            importer = UserImporter(executor, options["workers"])
+            while batch := list(islice(records, options["batch_size"])):
+                importer.import_batch(batch)
+                if options["verbosity"] > 1:
+                    self.stdout.write(f"{importer.records} record(s), {importer.counts['created']} created")
+
+        for record, username, messages in importer.errors:
+            self.stderr.write(self.style.WARNING(f"Record {record} ({username}): {' '.join(messages)}"))
+
+        total = importer.records
+        elapsed = time.perf_counter() - started_at
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Processed {total} record(s) in {elapsed:.2f}s ({total / max(elapsed, 1e-9):.0f} rows/s): "
+                + ", ".join(f"{count} {name}" for name, count in importer.counts.items())
+            )
+        )
@@ -0,0 +1,49 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from zhackathon import geo
+from zhackathon.models import Change, Festival, Postcode
+
+
+class Command(BaseCommand):
+    help = "Loads the postcode coordinates reference file and locates every festival from it."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "file",
+            nargs="?",
+            default=geo.POSTCODES_FILE,
+            help="CSV file with postcode, latitude and longitude columns (defaults to the bundled one).",
+        )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            postcodes = Postcode.objects.bulk_create(
+                geo.read_postcodes(options["file"]),
+                batch_size=1000,
+                update_conflicts=True,
+                unique_fields=["code"],
+                update_fields=["latitude", "longitude"],
+            )
+
+            coordinates = {code: (latitude, longitude) for code, latitude, longitude in Postcode.objects.values_list()}
+            festivals = list(Festival.objects.only("id", "postcode", "latitude", "longitude"))
+            relocated = []
+            for festival in festivals:
+                previous = (festival.latitude, festival.longitude)
+                festival.latitude, festival.longitude = next(
+                    (
+                        coordinates[festival.postcode[:length]]
+                        for length in range(len(festival.postcode or ""), 1, -1)
+                        if festival.postcode[:length] in coordinates
+                    ),
+                    (None, None),
+                )
+                if (festival.latitude, festival.longitude) != previous:
+                    relocated.append(festival)
+            Festival.objects.bulk_update(relocated, ["latitude", "longitude"], batch_size=1000)
+            Change.record(Festival, [festival.pk for festival in relocated])
+
+        self.stdout.write(
+            self.style.SUCCESS(f"Loaded {len(postcodes)} postcode(s), located {len(festivals)} festival(s)")
+        )
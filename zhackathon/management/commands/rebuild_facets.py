@@ -0,0 +1,48 @@
+from collections import Counter
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import models, transaction
+
+from zhackathon.cache import response_cache
+from zhackathon.models import Festival, FestivalFacet
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the festival facet counts from the festival table and reports any drift."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--check",
+            action="store_true",
+            help="Only report the facet combinations whose counts drifted, without rewriting them.",
+        )
+
+    def handle(self, *args, **options):
+        expected = Counter()
+        for row in Festival.objects.values(*FestivalFacet.DIMENSIONS).annotate(count=models.Count("id")):
+            expected[FestivalFacet.get_key(row)] += row["count"]
+
+        stored = Counter(
+            {
+                FestivalFacet.get_key(row): row["count"]
+                for row in FestivalFacet.objects.filter(count__gt=0).values(*FestivalFacet.DIMENSIONS, "count")
+            }
+        )
+
+        drifted = {key: expected[key] - stored[key] for key in expected.keys() | stored.keys()}
+        drifted = {key: delta for key, delta in drifted.items() if delta}
+
+        for key, delta in drifted.items():
+            self.stdout.write(f"drift: {' / '.join(key)} ({delta:+d})")
+
+        if options["check"]:
+            if drifted:
+                raise CommandError(f"{len(drifted)} facet combination(s) drifted")
+            self.stdout.write(self.style.SUCCESS("No drift detected"))
+            return
+
+        with transaction.atomic():
+            FestivalFacet.update_counts(drifted)
+            response_cache.invalidate_on_commit("festivals")
+
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {len(drifted)} facet combination(s)"))
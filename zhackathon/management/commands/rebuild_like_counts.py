@@ -0,0 +1,47 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import models, transaction
+from django.db.models.functions import Coalesce
+
+from zhackathon.models import Comment
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the comment like counts from the stored likes and reports any drift."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--check",
+            action="store_true",
+            help="Only report the comments whose like counts drifted, without rewriting them.",
+        )
+
+    def handle(self, *args, **options):
+        expected = dict(
+            Comment.liked_by.through.objects.values("comment")
+            .annotate(count=models.Count("id"))
+            .values_list("comment", "count")
+        )
+
+        drifted = {
+            comment_id: expected.get(comment_id, 0)
+            for comment_id, like_count in Comment.objects.values_list("id", "like_count").iterator()
+            if like_count != expected.get(comment_id, 0)
+        }
+
+        for comment_id, count in drifted.items():
+            self.stdout.write(f"drift: {comment_id} ({count} like(s))")
+
+        if options["check"]:
+            if drifted:
+                raise CommandError(f"{len(drifted)} comment(s) drifted")
+            self.stdout.write(self.style.SUCCESS("No drift detected"))
+            return
+
+        # Counted again by the update, so that the likes written in the meantime are not lost.
+        likes = Comment.liked_by.through.objects.filter(comment_id=models.OuterRef("pk")).values("comment_id")
+        with transaction.atomic():
+            Comment.objects.filter(pk__in=drifted).update(
+                like_count=Coalesce(models.Subquery(likes.annotate(count=models.Count("pk")).values("count")), 0)
+            )
+
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt like counts of {len(drifted)} comment(s)"))
@@ -0,0 +1,77 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import models, transaction
+
+from zhackathon.cache import response_cache
+from zhackathon.models import Change, Festival, Rating, RatingHistogram
+
+
+def get_bayesian_rating(count, total):
+    return Festival.get_bayesian_rating(count, total) if count else None
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the festival rating aggregates from the rating table and reports any drift."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--check",
+            action="store_true",
+            help="Only report the festivals whose aggregates drifted, without rewriting them.",
+        )
+
+    def handle(self, *args, **options):
+        expected = {
+            row["festival"]: (row["count"], row["total"])
+            for row in Rating.objects.values("festival").annotate(count=models.Count("id"), total=models.Sum("rating"))
+        }
+        histograms = {}
+        for row in Rating.objects.values("festival", "rating").annotate(count=models.Count("id")):
+            histograms.setdefault(row["festival"], {})[row["rating"]] = row["count"]
+
+        stored_histograms = {}
+        for row in RatingHistogram.objects.filter(count__gt=0).values("festival", "rating", "count"):
+            stored_histograms.setdefault(row["festival"], {})[row["rating"]] = row["count"]
+
+        drifted = []
+        for festival_id, count, total, bayesian_rating in Festival.objects.values_list(
+            "id", "rating_count", "rating_sum", "bayesian_rating"
+        ).iterator():
+            if (
+                (count, total) != expected.get(festival_id, (0, 0))
+                or stored_histograms.get(festival_id, {}) != histograms.get(festival_id, {})
+                # The leaderboard prior may have changed since.
+                or bayesian_rating != get_bayesian_rating(count, total)
+            ):
+                drifted.append(festival_id)
+
+        for festival_id in drifted:
+            self.stdout.write(f"drift: {festival_id}")
+
+        if options["check"]:
+            if drifted:
+                raise CommandError(f"{len(drifted)} festival(s) drifted")
+            self.stdout.write(self.style.SUCCESS("No drift detected"))
+            return
+
+        with transaction.atomic():
+            for festival_id in drifted:
+                count, total = expected.get(festival_id, (0, 0))
+                Festival.objects.filter(pk=festival_id).update(
+                    rating_count=count,
+                    rating_sum=total,
+                    average_rating=total / count if count else None,
+                    bayesian_rating=get_bayesian_rating(count, total),
+                )
+                RatingHistogram.objects.filter(festival_id=festival_id).delete()
+                RatingHistogram.objects.bulk_create(
+                    RatingHistogram(festival_id=festival_id, rating=rating, count=bucket)
+                    for rating, bucket in histograms.get(festival_id, {}).items()
+                )
+            Change.record(Festival, drifted)
+            # Bulk updates, which send no signal.
+            if drifted:
+                response_cache.invalidate_on_commit(
+                    "festivals", *(f"festival:{festival_id}" for festival_id in drifted)
+                )
+
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt aggregates of {len(drifted)} festival(s)"))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from zhackathon import search
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the full-text search index of the festivals."
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            count = search.rebuild_index()
+
+        self.stdout.write(self.style.SUCCESS(f"Indexed {count} festival(s)"))
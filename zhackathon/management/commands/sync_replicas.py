@@ -0,0 +1,59 @@
+import sqlite3
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+class Command(BaseCommand):
+    help = (
+        "Copies the default SQLite database into its SQLite replicas, once or every --interval seconds, to run the "
+        "read replica routing locally. Real deployments use the streaming replication of their database instead."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--database",
+            action="append",
+            dest="replicas",
+            help='Replica to synchronize (repeatable), DATABASE_ROUTING["REPLICAS"] by default.',
+        )
+        parser.add_argument(
+            "--interval", type=float, help="Synchronize every this many seconds until interrupted, instead of once."
+        )
+
+    def handle(self, *args, **options):
+        primary = connections[DEFAULT_DB_ALIAS]
+        if not (replicas := options["replicas"] or settings.DATABASE_ROUTING["REPLICAS"]):
+            raise CommandError('No replica to synchronize, see DATABASE_ROUTING["REPLICAS"]')
+        for alias in (DEFAULT_DB_ALIAS, *replicas):
+            if alias not in connections.settings or connections[alias].vendor != "sqlite":
+                raise CommandError(f"{alias} is not an SQLite database")
+
+        # Readers of a WAL database do not block its writers, nor the copies.
+        with primary.cursor() as cursor:
+            cursor.execute("PRAGMA journal_mode=WAL")
+
+        while True:
+            for alias in replicas:
+                started_at = time.perf_counter()
+                self.synchronize(primary, alias)
+                if options["verbosity"]:
+                    self.stdout.write(f"Synchronized {alias} in {time.perf_counter() - started_at:.3f}s")
+            if options["interval"] is None:
+                break
+            try:
+                time.sleep(options["interval"])
+            except KeyboardInterrupt:
+                break
+
+    @staticmethod
+    def synchronize(primary, alias):
+        primary.ensure_connection()
+        replica = sqlite3.connect(connections[alias].settings_dict["NAME"], timeout=20)
+        try:
+            replica.execute("PRAGMA journal_mode=WAL")
+            primary.connection.backup(replica)
+        finally:
+            replica.close()
@@ -0,0 +1,267 @@
+import asyncio
+import hmac
+import logging
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+from django.utils.deprecation import MiddlewareMixin
+
+logger = logging.getLogger(__name__)
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576)
+PHASES = ("db", "permissions", "serializer", "render")
+# SQL statements kept per request for the slow request log.
+MAX_LOGGED_QUERIES = 200
+
+current = ContextVar("request_metrics", default=None)
+
+
+class RequestMetrics:
+    """
+    Time spent by the current request in each phase. Phases can overlap: the queries run while serializing count both
+    as db and serializer time.
+    """
+
+    def __init__(self, keep_sql=False):
+        self.started_at = time.perf_counter()
+        self.queries = 0
+        self.phases = Counter()
+        self.running = set()
+        self.sql = [] if keep_sql else None
+
+    def execute(self, execute, sql, params, many, context):
+        started_at = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started_at
+            self.queries += 1
+            self.phases["db"] += elapsed
+            if self.sql is not None and len(self.sql) < MAX_LOGGED_QUERIES:
+                self.sql.append((elapsed, sql))
+
+    @contextmanager
+    def timer(self, phase):
+        # Nested serializers only count once, in the outermost one.
+        if phase in self.running:
+            yield
+            return
+
+        self.running.add(phase)
+        started_at = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[phase] += time.perf_counter() - started_at
+            self.running.discard(phase)
+
+
+@contextmanager
+def timer(phase):
+    if (metrics := current.get()) is None:
+        yield
+    else:
+        with metrics.timer(phase):
+            yield
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+
+class Registry:
+    """
+    Metrics of the requests served by this process, by route and method. Each worker process has its own registry,
+    which Prometheus aggregates across the scraped workers.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.requests = Counter()
+            self.durations = defaultdict(lambda: Histogram(DURATION_BUCKETS))
+            self.queries = defaultdict(lambda: Histogram(QUERY_BUCKETS))
+            self.sizes = defaultdict(lambda: Histogram(SIZE_BUCKETS))
+            self.phases = Counter()
+
+    def observe(self, route, method, status, duration, size, metrics: RequestMetrics):
+        labels = (route, method)
+        with self.lock:
+            self.requests[(route, method, str(status))] += 1
+            self.durations[labels].observe(duration)
+            self.queries[labels].observe(metrics.queries)
+            if size is not None:
+                self.sizes[labels].observe(size)
+            for phase in PHASES:
+                self.phases[(*labels, phase)] += metrics.phases[phase]
+
+    def render(self):
+        """
+        Renders the metrics in the Prometheus text exposition format.
+        """
+        lines = []
+        with self.lock:
+            lines += header("zhackathon_requests_total", "counter", "Requests served.")
+            for (route, method, status), count in sorted(self.requests.items()):
+                lines.append(
+                    f"zhackathon_requests_total{format_labels(route=route, method=method, status=status)} {count}"
+                )
+
+            for name, help_text, histograms in (
+                ("zhackathon_request_duration_seconds", "Request latency.", self.durations),
+                ("zhackathon_request_queries", "SQL queries per request.", self.queries),
+                ("zhackathon_response_size_bytes", "Response body size.", self.sizes),
+            ):
+                lines += header(name, "histogram", help_text)
+                for (route, method), histogram in sorted(histograms.items()):
+                    lines += render_histogram(name, histogram, route=route, method=method)
+
+            lines += header(
+                "zhackathon_request_phase_seconds_total", "counter", f"Time spent in the {', '.join(PHASES)} phases."
+            )
+            for (route, method, phase), seconds in sorted(self.phases.items()):
+                labels = format_labels(route=route, method=method, phase=phase)
+                lines.append(f"zhackathon_request_phase_seconds_total{labels} {round(seconds, 6)}")
+        return "\n".join(lines) + "\n"
+
+
+def header(name, kind, help_text):
+    return [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+
+
+def format_labels(**labels):
+    escaped = {
+        key: value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for key, value in labels.items()
+    }
+    return "{" + ",".join(f'{key}="{value}"' for key, value in escaped.items()) + "}"
+
+
+def render_histogram(name, histogram: Histogram, **labels):
+    lines, cumulative = [], 0
+    for bucket, count in zip((*histogram.buckets, "+Inf"), histogram.counts):
+        cumulative += count
+        lines.append(f"{name}_bucket{format_labels(**labels, le=str(bucket))} {cumulative}")
+    lines.append(f"{name}_sum{format_labels(**labels)} {round(histogram.sum, 6)}")
+    lines.append(f"{name}_count{format_labels(**labels)} {cumulative}")
+    return lines
+
+
+registry = Registry()
+
+
+def execute_wrapper(execute, sql, params, many, context):
+    if (metrics := current.get()) is None:
+        return execute(sql, params, many, context)
+    return metrics.execute(execute, sql, params, many, context)
+
+
+def install_execute_wrapper(connection):
+    """
+    Times the queries of a new connection, including the ones of the threads the async ORM runs in: the metrics
+    of the request are found in the context, which asgiref copies into these threads.
+    """
+    if execute_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.append(execute_wrapper)
+
+
+class MetricsMiddleware(MiddlewareMixin):
+    """
+    Records the latency, queries, phase timings and response size of every request in the registry, and logs the SQL
+    of the requests slower than METRICS_SETTINGS["SLOW_REQUEST_THRESHOLD"] seconds. Works in both sync and async mode.
+    """
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not settings.METRICS_SETTINGS["ENABLED"]:
+            return self.get_response(request)
+
+        metrics = RequestMetrics(keep_sql=settings.METRICS_SETTINGS["SLOW_REQUEST_THRESHOLD"] is not None)
+        token = current.set(metrics)
+        try:
+            response = self.get_response(request)
+        finally:
+            current.reset(token)
+        return self.finish(request, response, metrics)
+
+    async def __acall__(self, request):
+        if not settings.METRICS_SETTINGS["ENABLED"]:
+            return await self.get_response(request)
+
+        metrics = RequestMetrics(keep_sql=settings.METRICS_SETTINGS["SLOW_REQUEST_THRESHOLD"] is not None)
+        token = current.set(metrics)
+        try:
+            response = await self.get_response(request)
+        finally:
+            current.reset(token)
+        return self.finish(request, response, metrics)
+
+    def finish(self, request, response, metrics: RequestMetrics):
+        duration = time.perf_counter() - metrics.started_at
+        match = request.resolver_match
+        route = match.view_name if match is not None else "unmatched"
+        size = None if response.streaming else len(response.content)
+        registry.observe(route, request.method, response.status_code, duration, size, metrics)
+
+        if settings.METRICS_SETTINGS["SERVER_TIMING"]:
+            response["Server-Timing"] = ", ".join(
+                [
+                    f'db;dur={metrics.phases["db"] * 1000:.3f};desc="{metrics.queries} queries"',
+                    *(f"{phase};dur={metrics.phases[phase] * 1000:.3f}" for phase in PHASES[1:]),
+                    f"total;dur={duration * 1000:.3f}",
+                ]
+            )
+
+        threshold = settings.METRICS_SETTINGS["SLOW_REQUEST_THRESHOLD"]
+        if threshold is not None and duration > threshold:
+            logger.warning(
+                "Slow request %s %s (%s): %.3fs, %d queries in %.3fs\n%s",
+                request.method,
+                request.get_full_path(),
+                route,
+                duration,
+                metrics.queries,
+                metrics.phases["db"],
+                "\n".join(f"  {elapsed * 1000:.2f}ms {sql}" for elapsed, sql in metrics.sql),
+            )
+
+        return response
+
+    def process_template_response(self, request, response):
+        # DRF responses are rendered after the view returns, the callback closes the render phase.
+        if (metrics := current.get()) is not None:
+            started_at = time.perf_counter()
+            response.add_post_render_callback(
+                lambda _: metrics.phases.update({"render": time.perf_counter() - started_at})
+            )
+        return response
+
+
+def metrics_view(request):
+    """
+    Serves the metrics to staff users, and to the scrapers sending METRICS_SETTINGS["TOKEN"] as a bearer token.
+    """
+    token = settings.METRICS_SETTINGS["TOKEN"]
+    authorization = request.headers.get("Authorization", "")
+    authorized = token is not None and hmac.compare_digest(authorization.encode(), f"Bearer {token}".encode())
+    if not (authorized or request.user.is_staff):
+        return HttpResponseForbidden()
+    return HttpResponse(registry.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
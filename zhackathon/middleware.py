@@ -0,0 +1,71 @@
+import asyncio
+
+from django.conf import settings
+from django.utils.deprecation import MiddlewareMixin
+
+from . import routers
+
+ASYNC_URLCONF = "zhackathon.urls_async"
+# Cookie of the clients which wrote recently, and read from the default database until it expires.
+PRIMARY_COOKIE = "read_primary"
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+
+
+class AsyncReadPathMiddleware(MiddlewareMixin):
+    """
+    Serves the read-only endpoints with async views when the middleware chain runs in async mode, i.e. under ASGI
+    with only async capable middlewares. Under WSGI, async views would each need an event loop, so the sync views of
+    the ROOT_URLCONF keep serving every request.
+    """
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self):
+            return self.__acall__(request)
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        request.urlconf = ASYNC_URLCONF
+        return await self.get_response(request)
+
+
+class DatabaseRoutingMiddleware(MiddlewareMixin):
+    """
+    Lets the safe requests read from the replicas (see zhackathon.routers.ReplicaRouter), but for the ones of clients
+    which wrote less than DATABASE_ROUTING["MAX_REPLICATION_LAG"] seconds ago, so that they see their own comments
+    and ratings even if the replicas did not catch up yet.
+    """
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        token = routers.replicas_allowed.set(self.allows_replicas(request))
+        try:
+            response = self.get_response(request)
+        finally:
+            routers.replicas_allowed.reset(token)
+        return self.finish(request, response)
+
+    async def __acall__(self, request):
+        token = routers.replicas_allowed.set(self.allows_replicas(request))
+        try:
+            response = await self.get_response(request)
+        finally:
+            routers.replicas_allowed.reset(token)
+        return self.finish(request, response)
+
+    @staticmethod
+    def allows_replicas(request):
+        return bool(routers.get_replicas()) and request.method in SAFE_METHODS and PRIMARY_COOKIE not in request.COOKIES
+
+    @staticmethod
+    def finish(request, response):
+        if routers.get_replicas() and request.method not in SAFE_METHODS and response.status_code < 400:
+            response.set_cookie(
+                PRIMARY_COOKIE,
+                "1",
+                max_age=settings.DATABASE_ROUTING["MAX_REPLICATION_LAG"],
+                httponly=True,
+                samesite="Lax",
+            )
+        return response
@@ -0,0 +1,68 @@
+# Generated by Django 4.1.13 on 2026-10-18 15:54
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def backfill_rating_aggregates(apps, schema_editor):
+    Festival = apps.get_model("zhackathon", "Festival")
+    Rating = apps.get_model("zhackathon", "Rating")
+    RatingHistogram = apps.get_model("zhackathon", "RatingHistogram")
+
+    totals = Rating.objects.values("festival").annotate(count=models.Count("id"), total=models.Sum("rating"))
+    for row in totals.iterator():
+        Festival.objects.filter(pk=row["festival"]).update(
+            rating_count=row["count"], rating_sum=row["total"], average_rating=row["total"] / row["count"]
+        )
+
+    buckets = Rating.objects.values("festival", "rating").annotate(count=models.Count("id"))
+    RatingHistogram.objects.bulk_create(
+        (RatingHistogram(festival_id=row["festival"], rating=row["rating"], count=row["count"]) for row in buckets),
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("zhackathon", "0003_alter_comment_author_alter_comment_festival_and_more"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="festival",
+            name="average_rating",
+            field=models.FloatField(blank=True, db_index=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name="festival",
+            name="rating_count",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name="festival",
+            name="rating_sum",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.CreateModel(
+            name="RatingHistogram",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("rating", models.IntegerField()),
+                ("count", models.PositiveIntegerField(default=0)),
+                (
+                    "festival",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="rating_histogram",
+                        to="zhackathon.festival",
+                    ),
+                ),
+            ],
+            options={
+                "db_table": "rating_histogram",
+                "unique_together": {("festival", "rating")},
+            },
+        ),
+        migrations.RunPython(backfill_rating_aggregates, migrations.RunPython.noop),
+    ]
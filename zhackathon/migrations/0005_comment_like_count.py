@@ -0,0 +1,27 @@
+# Generated by Django 4.1.13 on 2026-10-18 15:55
+
+from django.db import migrations, models
+
+
+def backfill_like_count(apps, schema_editor):
+    Comment = apps.get_model("zhackathon", "Comment")
+
+    likes = Comment.liked_by.through.objects.values("comment").annotate(count=models.Count("id"))
+    for row in likes.iterator():
+        Comment.objects.filter(pk=row["comment"]).update(like_count=row["count"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("zhackathon", "0004_festival_rating_aggregates"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="comment",
+            name="like_count",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(backfill_like_count, migrations.RunPython.noop),
+    ]
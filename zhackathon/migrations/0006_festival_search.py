@@ -0,0 +1,44 @@
+# Generated by Django 4.1.13 on 2026-10-18 16:40
+
+from hashlib import blake2b
+
+from django.db import migrations
+
+
+def index_festivals(apps, schema_editor):
+    Festival = apps.get_model("zhackathon", "Festival")
+
+    rows = [
+        (
+            int.from_bytes(blake2b(festival.pk.encode(), digest_size=8).digest(), "big", signed=True),
+            festival.pk,
+            festival.name,
+            festival.discipline,
+            festival.description,
+            festival.commune,
+        )
+        for festival in Festival.objects.iterator()
+    ]
+    with schema_editor.connection.cursor() as cursor:
+        cursor.executemany(
+            "INSERT INTO festival_search (rowid, festival_id, name, discipline, description, commune) "
+            "VALUES (%s, %s, %s, %s, %s, %s)",
+            rows,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("zhackathon", "0005_comment_like_count"),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            "CREATE VIRTUAL TABLE festival_search USING fts5("
+            "festival_id UNINDEXED, name, discipline, description, commune, "
+            "tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')",
+            "DROP TABLE festival_search",
+        ),
+        migrations.RunPython(index_festivals, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 4.1.13 on 2026-10-18 16:01
+
+import csv
+from pathlib import Path
+
+from django.db import migrations, models
+
+
+def load_postcodes(apps, schema_editor):
+    Festival = apps.get_model("zhackathon", "Festival")
+    Postcode = apps.get_model("zhackathon", "Postcode")
+
+    with open(Path(__file__).resolve().parent.parent / "data" / "postcodes.csv", encoding="utf-8", newline="") as file:
+        coordinates = {row["postcode"]: (float(row["latitude"]), float(row["longitude"])) for row in csv.DictReader(file)}
+    Postcode.objects.bulk_create(Postcode(code, *point) for code, point in coordinates.items())
+
+    festivals = list(Festival.objects.exclude(postcode=None).only("id", "postcode"))
+    for festival in festivals:
+        for length in range(len(festival.postcode), 1, -1):
+            if festival.postcode[:length] in coordinates:
+                festival.latitude, festival.longitude = coordinates[festival.postcode[:length]]
+                break
+    Festival.objects.bulk_update(festivals, ["latitude", "longitude"], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("zhackathon", "0006_festival_search"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="Postcode",
+            fields=[
+                ("code", models.CharField(max_length=5, primary_key=True, serialize=False)),
+                ("latitude", models.FloatField()),
+                ("longitude", models.FloatField()),
+            ],
+            options={
+                "db_table": "postcode",
+            },
+        ),
+        migrations.AddField(
+            model_name="festival",
+            name="latitude",
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name="festival",
+            name="longitude",
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.RunPython(load_postcodes, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.1.13 on 2026-10-18 16:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("zhackathon", "0007_festival_coordinates"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="festival",
+            name="content_hash",
+            field=models.CharField(blank=True, editable=False, max_length=32),
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 4.1.13 on 2026-10-18 16:06
+
+from django.db import migrations, models
+
+
+def backfill_festival_facets(apps, schema_editor):
+    Festival = apps.get_model("zhackathon", "Festival")
+    FestivalFacet = apps.get_model("zhackathon", "FestivalFacet")
+
+    counts = {}
+    for row in Festival.objects.values("region", "department", "discipline", "period").annotate(count=models.Count("id")):
+        key = tuple(row[dimension] or "" for dimension in ("region", "department", "discipline", "period"))
+        counts[key] = counts.get(key, 0) + row["count"]
+
+    FestivalFacet.objects.bulk_create(
+        (FestivalFacet(region=key[0], department=key[1], discipline=key[2], period=key[3], count=count) for key, count in counts.items()),
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("zhackathon", "0008_festival_content_hash"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="FestivalFacet",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("region", models.CharField(max_length=100)),
+                ("department", models.CharField(max_length=100)),
+                ("discipline", models.CharField(max_length=200)),
+                ("period", models.CharField(max_length=100)),
+                ("count", models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                "db_table": "festival_facet",
+                "unique_together": {("region", "department", "discipline", "period")},
+            },
+        ),
+        migrations.RunPython(backfill_festival_facets, migrations.RunPython.noop),
+    ]
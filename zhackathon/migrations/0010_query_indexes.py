@@ -0,0 +1,57 @@
+# Generated by Django 4.1.13 on 2026-10-18 16:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("zhackathon", "0009_festival_facet"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="comment",
+            index=models.Index(fields=["festival", "-created_at", "-id"], name="comment_festival_created_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="comment",
+            index=models.Index(fields=["-created_at", "-id"], name="comment_created_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="comment",
+            index=models.Index(fields=["-updated_at", "-id"], name="comment_updated_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="festival",
+            index=models.Index(fields=["name"], name="festival_name_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="festival",
+            index=models.Index(fields=["rating_count"], name="festival_rating_count_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="festival",
+            index=models.Index(fields=["region"], name="festival_region_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="festival",
+            index=models.Index(fields=["department"], name="festival_department_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="festival",
+            index=models.Index(fields=["discipline"], name="festival_discipline_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="festival",
+            index=models.Index(fields=["period"], name="festival_period_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="rating",
+            index=models.Index(fields=["festival", "rating", "id"], name="rating_festival_rating_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="rating",
+            index=models.Index(fields=["rating", "id"], name="rating_rating_idx"),
+        ),
+    ]
@@ -0,0 +1,90 @@
+# Generated by Django 4.1.13 on 2026-10-18 16:50
+
+import math
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models.functions import Cast
+
+# zhackathon.models.TRENDING_EPOCH
+TRENDING_EPOCH = datetime(2020, 1, 1, tzinfo=timezone.utc)
+
+
+def backfill_leaderboards(apps, schema_editor):
+    Festival = apps.get_model("zhackathon", "Festival")
+    Comment = apps.get_model("zhackathon", "Comment")
+
+    prior_mean = settings.LEADERBOARD_SETTINGS["PRIOR_MEAN"]
+    prior_weight = settings.LEADERBOARD_SETTINGS["PRIOR_WEIGHT"]
+    Festival.objects.filter(rating_count__gt=0).update(
+        bayesian_rating=(models.Value(prior_mean * prior_weight) + Cast("rating_sum", models.FloatField()))
+        / (models.F("rating_count") + prior_weight)
+    )
+
+    # Comments are the only activity with a date: likes and ratings only count from now on.
+    weight = settings.LEADERBOARD_SETTINGS["TRENDING_WEIGHTS"]["comment"]
+    rate = math.log(2) / (settings.LEADERBOARD_SETTINGS["TRENDING_HALF_LIFE"] * 3600)
+    keys = {}
+    for festival_id, created_at in Comment.objects.values_list("festival_id", "created_at").iterator():
+        added = math.log(weight) + rate * (created_at - TRENDING_EPOCH).total_seconds()
+        if (key := keys.get(festival_id)) is None:
+            keys[festival_id] = added
+        else:
+            keys[festival_id] = max(key, added) + math.log1p(math.exp(min(key, added) - max(key, added)))
+
+    for festival_id, key in keys.items():
+        Festival.objects.filter(pk=festival_id).update(trending_key=key)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("zhackathon", "0010_query_indexes"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="festival",
+            name="bayesian_rating",
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name="festival",
+            name="trending_key",
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name="festival",
+            index=models.Index(fields=["bayesian_rating", "id"], name="festival_top_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="festival",
+            index=models.Index(fields=["region", "bayesian_rating", "id"], name="festival_region_top_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="festival",
+            index=models.Index(fields=["discipline", "bayesian_rating", "id"], name="festival_discipline_top_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="festival",
+            index=models.Index(fields=["trending_key", "id"], name="festival_trend_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="festival",
+            index=models.Index(fields=["region", "trending_key", "id"], name="festival_region_trend_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="festival",
+            index=models.Index(fields=["discipline", "trending_key", "id"], name="festival_discipline_trend_idx"),
+        ),
+        migrations.RemoveIndex(
+            model_name="festival",
+            name="festival_region_idx",
+        ),
+        migrations.RemoveIndex(
+            model_name="festival",
+            name="festival_discipline_idx",
+        ),
+        migrations.RunPython(backfill_leaderboards, migrations.RunPython.noop),
+    ]
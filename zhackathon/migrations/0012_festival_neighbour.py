@@ -0,0 +1,44 @@
+# Generated by Django 4.1.13 on 2026-10-18 16:55
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("zhackathon", "0011_festival_leaderboards"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="FestivalNeighbour",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("similarity", models.FloatField()),
+                (
+                    "festival",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE, related_name="neighbours", to="zhackathon.festival"
+                    ),
+                ),
+                (
+                    "neighbour",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE, related_name="+", to="zhackathon.festival"
+                    ),
+                ),
+            ],
+            options={
+                "db_table": "festival_neighbour",
+            },
+        ),
+        migrations.AddIndex(
+            model_name="festivalneighbour",
+            index=models.Index(fields=["festival", "-similarity"], name="festival_neighbour_idx"),
+        ),
+        migrations.AlterUniqueTogether(
+            name="festivalneighbour",
+            unique_together={("festival", "neighbour")},
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 4.1.13 on 2026-10-18 17:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("zhackathon", "0012_festival_neighbour"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="Change",
+            fields=[
+                ("seq", models.BigAutoField(primary_key=True, serialize=False)),
+                ("model", models.CharField(max_length=20)),
+                ("object_id", models.CharField(max_length=100)),
+                ("deleted", models.BooleanField(default=False)),
+                ("changed_at", models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                "db_table": "change",
+            },
+        ),
+        migrations.CreateModel(
+            name="ChangeHorizon",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("seq", models.BigIntegerField(default=0)),
+            ],
+            options={
+                "db_table": "change_horizon",
+            },
+        ),
+        migrations.AddIndex(
+            model_name="change",
+            index=models.Index(fields=["model", "object_id", "seq"], name="change_object_idx"),
+        ),
+    ]
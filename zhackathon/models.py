@@ -1,9 +1,28 @@
+import math
 import uuid
+from datetime import datetime, timezone
 
+from django.conf import settings
 from django.contrib.auth.models import User
 from django.core import validators
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Case, F, When
+from django.db.models.functions import Cast, Exp, Greatest, Least, Ln
 from django.db.models.query import QuerySet
+from django.dispatch import Signal
+from django.utils import timezone as django_timezone
+
+from .likes import like_buffer
+
+# Trending keys are the logs of the trending scores as of this date (see Festival.record_activity).
+TRENDING_EPOCH = datetime(2020, 1, 1, tzinfo=timezone.utc)
+
+# Sent with the instance of a ticketing whose tickets Ticketing.reserve() took, which saves it without post_save.
+ticketing_reserved = Signal()
+
+
+def get_decay_rate():
+    return math.log(2) / (settings.LEADERBOARD_SETTINGS["TRENDING_HALF_LIFE"] * 3600)
 
 
 class Festival(models.Model):
@@ -19,16 +38,134 @@ class Festival(models.Model):
     postcode = models.CharField(
         max_length=5, null=True, blank=True, validators=[validators.RegexValidator("^[0-9]{5}$")]
     )
+    latitude = models.FloatField(null=True, blank=True, editable=False)
+    longitude = models.FloatField(null=True, blank=True, editable=False)
+    rating_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_sum = models.PositiveIntegerField(default=0, editable=False)
+    average_rating = models.FloatField(null=True, blank=True, editable=False, db_index=True)
+    bayesian_rating = models.FloatField(null=True, blank=True, editable=False)
+    trending_key = models.FloatField(null=True, blank=True, editable=False)
+    content_hash = models.CharField(max_length=32, blank=True, editable=False)
 
     ratings: QuerySet["Rating"]
     comments: QuerySet["Comment"]
     ticketings: QuerySet["Ticketing"]
+    rating_histogram: QuerySet["RatingHistogram"]
 
     class Meta:
         db_table = "festival"
+        # Orderings and filters of the festival list (see the audit_queries command).
+        indexes = [
+            models.Index(fields=["name"], name="festival_name_idx"),
+            models.Index(fields=["rating_count"], name="festival_rating_count_idx"),
+            models.Index(fields=["department"], name="festival_department_idx"),
+            models.Index(fields=["period"], name="festival_period_idx"),
+            # Leaderboards, read from their top (see FestivalViewSet.top and trending), and region and discipline
+            # filters.
+            models.Index(fields=["bayesian_rating", "id"], name="festival_top_idx"),
+            models.Index(fields=["region", "bayesian_rating", "id"], name="festival_region_top_idx"),
+            models.Index(fields=["discipline", "bayesian_rating", "id"], name="festival_discipline_top_idx"),
+            models.Index(fields=["trending_key", "id"], name="festival_trend_idx"),
+            models.Index(fields=["region", "trending_key", "id"], name="festival_region_trend_idx"),
+            models.Index(fields=["discipline", "trending_key", "id"], name="festival_discipline_trend_idx"),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        festival = super().from_db(db, field_names, values)
+        # Facets as stored, so that saving the festival moves it between facets without reading them again.
+        if set(FestivalFacet.DIMENSIONS) <= set(field_names):
+            festival.stored_facet_key = FestivalFacet.get_key(vars(festival))
+        return festival
 
     def get_average_rating(self):
-        return self.ratings.aggregate(models.Avg("rating"))["rating__avg"] or None
+        return self.average_rating
+
+    def get_trending_score(self, now=None):
+        if self.trending_key is None:
+            return None
+        elapsed = ((now or django_timezone.now()) - TRENDING_EPOCH).total_seconds()
+        return math.exp(self.trending_key - get_decay_rate() * elapsed)
+
+    def get_rating_histogram(self):
+        histogram = dict.fromkeys(range(Rating.MIN_RATING, Rating.MAX_RATING + 1), 0)
+        histogram.update(self.rating_histogram.filter(count__gt=0).values_list("rating", "count"))
+        return histogram
+
+    async def aget_rating_histogram(self):
+        histogram = dict.fromkeys(range(Rating.MIN_RATING, Rating.MAX_RATING + 1), 0)
+        histogram.update(
+            [row async for row in self.rating_histogram.filter(count__gt=0).values_list("rating", "count")]
+        )
+        return histogram
+
+    @staticmethod
+    def update_rating_aggregates(festival_id, rating, delta):
+        """
+        Adds (delta=1) or removes (delta=-1) a rating from the running aggregates of a festival,
+        using database-side increments so concurrent writers never overwrite each other.
+        """
+        count = F("rating_count") + delta
+        total = F("rating_sum") + delta * rating
+
+        with transaction.atomic():
+            Festival.objects.filter(pk=festival_id).update(
+                rating_count=count,
+                rating_sum=total,
+                average_rating=Case(
+                    When(rating_count=-delta, then=None),
+                    default=Cast(total, models.FloatField()) / count,
+                ),
+                bayesian_rating=Case(
+                    When(rating_count=-delta, then=None),
+                    default=Festival.get_bayesian_rating(count, total),
+                ),
+            )
+            RatingHistogram.objects.bulk_create(
+                [RatingHistogram(festival_id=festival_id, rating=rating)], ignore_conflicts=True
+            )
+            RatingHistogram.objects.filter(festival_id=festival_id, rating=rating).update(count=F("count") + delta)
+            Change.record(Festival, [festival_id])
+
+    @staticmethod
+    def get_bayesian_rating(count, total):
+        """
+        Average of the ratings and of PRIOR_WEIGHT more ratings of PRIOR_MEAN, so that a festival rated 5 once does
+        not outrank one rated 4.8 a hundred times. Also accepts expressions.
+        """
+        prior_mean = settings.LEADERBOARD_SETTINGS["PRIOR_MEAN"]
+        prior_weight = settings.LEADERBOARD_SETTINGS["PRIOR_WEIGHT"]
+        if not hasattr(total, "resolve_expression"):
+            return (prior_mean * prior_weight + total) / (prior_weight + count)
+        return (models.Value(prior_mean * prior_weight) + Cast(total, models.FloatField())) / (count + prior_weight)
+
+    @staticmethod
+    def get_trending_key(weight, at=None):
+        """
+        Key of an activity score of weight at a date (now by default): the log of its score as of TRENDING_EPOCH. All
+        scores decay at the same rate, so festivals are ranked by keys which only change when an activity is added.
+        """
+        elapsed = ((at or django_timezone.now()) - TRENDING_EPOCH).total_seconds()
+        return math.log(weight) + get_decay_rate() * elapsed
+
+    @staticmethod
+    def record_activity(counts, kind, at=None):
+        """
+        Adds activities of a kind ("comment", "like" or "rating"), counts mapping festival ids to their number, to the
+        trending scores: the sums of the weights of the activities, each one halved every TRENDING_HALF_LIFE hours.
+        """
+        weight = settings.LEADERBOARD_SETTINGS["TRENDING_WEIGHTS"][kind]
+        key = F("trending_key")
+
+        for festival_id, count in counts.items():
+            added = models.Value(Festival.get_trending_key(weight * count, at), models.FloatField())
+            # log(exp(key) + exp(added)), as max + log(1 + exp(min - max)) which cannot overflow.
+            Festival.objects.filter(pk=festival_id).update(
+                trending_key=Case(
+                    When(trending_key=None, then=added),
+                    default=Greatest(key, added) + Ln(1 + Exp(Least(key, added) - Greatest(key, added))),
+                )
+            )
 
     def get_comments(self):
         comments = self.comments.all()
@@ -54,17 +191,44 @@ class Ticketing(models.Model):
 
     def open(self):
         self.status = self.Status.OPEN
-        self.save()
+        self.save(update_fields=["status"])
 
     def close(self):
         self.status = self.Status.CLOSED
-        self.save()
+        self.save(update_fields=["status"])
 
     def is_open(self):
         return self.status != self.Status.CLOSED
 
+    def reserve(self, quantity=1):
+        """
+        Takes quantity tickets with a single conditional UPDATE, so concurrent reservations can never oversell,
+        and moves the status to LAST PLACES or CLOSED once the remaining tickets reach the configured thresholds.
+        Returns False when there are not enough tickets left.
+        """
+        last_places = settings.TICKETING_SETTINGS["LAST_PLACES_THRESHOLD"]
+        closed = settings.TICKETING_SETTINGS["CLOSED_THRESHOLD"]
+
+        reserved = (
+            Ticketing.objects.filter(pk=self.pk, available_tickets__gte=quantity + closed)
+            .exclude(status=self.Status.CLOSED)
+            .update(
+                available_tickets=F("available_tickets") - quantity,
+                status=Case(
+                    When(available_tickets__lte=closed + quantity, then=models.Value(self.Status.CLOSED)),
+                    When(available_tickets__lte=last_places + quantity, then=models.Value(self.Status.LAST_PLACES)),
+                    default=F("status"),
+                ),
+            )
+        )
+        self.refresh_from_db(fields=["available_tickets", "status"])
+        if reserved:
+            Change.record(Ticketing, [self.pk])
+            ticketing_reserved.send(sender=Ticketing, instance=self)
+        return bool(reserved)
+
     def save(self, *args, **kwargs):
-        if not self.available_tickets:
+        if self.available_tickets is None:
             self.available_tickets = self.total_tickets
         super().save(*args, **kwargs)
 
@@ -77,29 +241,223 @@ class Comment(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     content = models.TextField(max_length=255)
     liked_by = models.ManyToManyField(User, related_name="comments_liked", blank=True)
+    like_count = models.PositiveIntegerField(default=0, editable=False)
 
     class Meta:
         ordering = ["-created_at"]
         db_table = "comment"
+        # Keyset pages of the comments, of a festival or not, end with the primary key (see KeysetPagination).
+        indexes = [
+            models.Index(fields=["festival", "-created_at", "-id"], name="comment_festival_created_idx"),
+            models.Index(fields=["-created_at", "-id"], name="comment_created_idx"),
+            models.Index(fields=["-updated_at", "-id"], name="comment_updated_idx"),
+        ]
 
     def get_total_likes(self):
-        return self.liked_by.count()
+        return self.like_count + like_buffer.get_delta(self.pk)
+
+    def is_liked_by(self, user, stored):
+        return like_buffer.is_liked(self.pk, user.pk, stored)
 
     def like(self, user):
-        self.liked_by.add(user)
-        self.save()
+        if settings.LIKE_SETTINGS["WRITE_BEHIND"]:
+            like_buffer.add(self.pk, user.pk, True)
+            return
+        with transaction.atomic():
+            _, created = Comment.liked_by.through.objects.get_or_create(comment_id=self.pk, user_id=user.pk)
+            if created:
+                self.__increment_likes(1)
+                Festival.record_activity({self.festival_id: 1}, "like")
 
     def unlike(self, user):
-        self.liked_by.remove(user)
-        self.save()
+        if settings.LIKE_SETTINGS["WRITE_BEHIND"]:
+            like_buffer.add(self.pk, user.pk, False)
+            return
+        with transaction.atomic():
+            deleted, _ = Comment.liked_by.through.objects.filter(comment_id=self.pk, user_id=user.pk).delete()
+            if deleted:
+                self.__increment_likes(-1)
+
+    def __increment_likes(self, delta):
+        Comment.objects.filter(pk=self.pk).update(like_count=F("like_count") + delta)
+        self.refresh_from_db(fields=["like_count"])
 
 
 class Rating(models.Model):
+    MIN_RATING = 0
+    MAX_RATING = 5
+
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     festival = models.ForeignKey(Festival, on_delete=models.CASCADE, related_name="ratings")
-    rating = models.IntegerField(validators=[validators.MinValueValidator(0), validators.MaxValueValidator(5)])
+    rating = models.IntegerField(
+        validators=[validators.MinValueValidator(MIN_RATING), validators.MaxValueValidator(MAX_RATING)]
+    )
 
     class Meta:
         db_table = "rating"
         unique_together = ("user", "festival")
+        # Keyset pages of the ratings, of a festival or not, end with the primary key (see KeysetPagination).
+        indexes = [
+            models.Index(fields=["festival", "rating", "id"], name="rating_festival_rating_idx"),
+            models.Index(fields=["rating", "id"], name="rating_rating_idx"),
+        ]
+
+
+class RatingHistogram(models.Model):
+    festival = models.ForeignKey(Festival, on_delete=models.CASCADE, related_name="rating_histogram")
+    rating = models.IntegerField()
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        db_table = "rating_histogram"
+        unique_together = ("festival", "rating")
+
+
+class FestivalFacet(models.Model):
+    """
+    Number of festivals sharing each combination of facet values, kept up to date incrementally so that facet counts
+    are aggregated over these combinations instead of over every festival. Missing values are stored as "".
+    """
+
+    DIMENSIONS = ("region", "department", "discipline", "period")
+
+    region = models.CharField(max_length=100)
+    department = models.CharField(max_length=100)
+    discipline = models.CharField(max_length=200)
+    period = models.CharField(max_length=100)
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        db_table = "festival_facet"
+        unique_together = ("region", "department", "discipline", "period")
+
+    @staticmethod
+    def get_key(values):
+        return tuple(values.get(dimension) or "" for dimension in FestivalFacet.DIMENSIONS)
+
+    @staticmethod
+    def update_counts(deltas):
+        """
+        Applies a {facet key: count delta} mapping with database-side increments.
+        """
+        deltas = {key: delta for key, delta in deltas.items() if delta}
+        if not deltas:
+            return
+
+        with transaction.atomic():
+            FestivalFacet.objects.bulk_create(
+                [FestivalFacet(**dict(zip(FestivalFacet.DIMENSIONS, key))) for key in deltas], ignore_conflicts=True
+            )
+            for key, delta in deltas.items():
+                FestivalFacet.objects.filter(**dict(zip(FestivalFacet.DIMENSIONS, key))).update(
+                    count=F("count") + delta
+                )
+
+    @staticmethod
+    def get_counts(queryset=None, **filters):
+        """
+        Counts the festivals per value of each dimension, narrowed by the given dimension filters. Counts are summed
+        over the facet combinations, or counted on the given festival queryset when other filters are involved.
+        """
+        if queryset is None:
+            queryset, total = FestivalFacet.objects.filter(count__gt=0, **filters), models.Sum("count")
+        else:
+            total = models.Count("id")
+
+        return {
+            dimension: [
+                {"value": value or None, "count": count}
+                for value, count in queryset.values_list(dimension).annotate(total=total).order_by("-total", dimension)
+            ]
+            for dimension in FestivalFacet.DIMENSIONS
+        }
+
+
+class FestivalNeighbour(models.Model):
+    """
+    The festivals rated the most alike by the same users, for each festival, precomputed by the build_recommendations
+    command.
+    """
+
+    festival = models.ForeignKey(Festival, on_delete=models.CASCADE, related_name="neighbours")
+    neighbour = models.ForeignKey(Festival, on_delete=models.CASCADE, related_name="+")
+    similarity = models.FloatField()
+
+    class Meta:
+        db_table = "festival_neighbour"
+        unique_together = ("festival", "neighbour")
+        # Neighbours of a festival, most similar first.
+        indexes = [models.Index(fields=["festival", "-similarity"], name="festival_neighbour_idx")]
+
+
+class Postcode(models.Model):
+    """
+    Reference coordinates of a postcode, or of every postcode starting with a shorter prefix
+    (e.g. the department number) when the exact one is unknown.
+    """
+
+    code = models.CharField(primary_key=True, max_length=5)
+    latitude = models.FloatField()
+    longitude = models.FloatField()
+
+    class Meta:
+        db_table = "postcode"
+
+    @staticmethod
+    def locate(postcode):
+        if not postcode:
+            return None, None
+
+        matches = {
+            code: (latitude, longitude)
+            for code, latitude, longitude in Postcode.objects.filter(
+                code__in=[postcode[:length] for length in range(2, len(postcode) + 1)]
+            ).values_list("code", "latitude", "longitude")
+        }
+        return matches[max(matches, key=len)] if matches else (None, None)
+
+
+class Change(models.Model):
+    """
+    Append-only log of the writes to the festivals, comments, ratings and ticketings, in the order of their sequence
+    number, for the clients mirroring them (see ChangeViewSet). Recorded by the signals, and by the bulk writes which
+    send none. Only the latest change of each object matters: the compact_changes command deletes the others, and the
+    tombstones older than CHANGE_LOG_SETTINGS["TOMBSTONE_RETENTION"] days.
+    """
+
+    # AUTOINCREMENT on SQLite: numbers are never reused, even once the latest rows are deleted.
+    seq = models.BigAutoField(primary_key=True)
+    # Model name, e.g. "festival", and primary key of the changed object.
+    model = models.CharField(max_length=20)
+    object_id = models.CharField(max_length=100)
+    deleted = models.BooleanField(default=False)
+    changed_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = "change"
+        # Later changes of an object (see the compact_changes command).
+        indexes = [models.Index(fields=["model", "object_id", "seq"], name="change_object_idx")]
+
+    @staticmethod
+    def record(model, object_ids, deleted=False):
+        Change.objects.bulk_create(
+            [Change(model=model._meta.model_name, object_id=str(pk), deleted=deleted) for pk in object_ids],
+            batch_size=1000,
+        )
+
+
+class ChangeHorizon(models.Model):
+    """
+    Sequence number of the latest tombstone deleted by the compact_changes command: clients which synced before it
+    may have missed deletions, and must sync again from 0. A single row.
+    """
+
+    seq = models.BigIntegerField(default=0)
+
+    class Meta:
+        db_table = "change_horizon"
+
+    @staticmethod
+    def get():
+        return ChangeHorizon.objects.filter(pk=1).values_list("seq", flat=True).first() or 0
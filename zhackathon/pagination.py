@@ -0,0 +1,168 @@
+from base64 import b64decode
+from types import SimpleNamespace
+from urllib import parse
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import Q
+from rest_framework import pagination
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import Cursor, CursorPagination
+
+
+class KeysetPagination(CursorPagination):
+    """
+    Cursor pagination on a composite key: the cursor stores the whole ordering tuple of the
+    boundary row (always ending with the primary key), so every page is a single index range
+    scan whatever its depth, and concurrent inserts never shift or duplicate rows across pages.
+    """
+
+    page_size_query_param = "page_size"
+    max_page_size = 100
+
+    def paginate_queryset(self, queryset, request, view=None):
+        queryset = self._get_page_queryset(queryset, request, view)
+        if queryset is None:
+            return None
+        return self._get_page(list(queryset))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        queryset = self._get_page_queryset(queryset, request, view)
+        if queryset is None:
+            return None
+        return self._get_page([result async for result in queryset])
+
+    def _get_page_queryset(self, queryset, request, view):
+        """
+        Returns the query of the requested page and one more row, telling whether another page follows.
+        """
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+        self.fields = [queryset.model._meta.get_field(order.lstrip("-")) for order in self.ordering]
+        self.cursor = self.decode_cursor(request)
+
+        reverse = self.cursor is not None and self.cursor.reverse
+        ordering = tuple(order[1:] if order.startswith("-") else f"-{order}" for order in self.ordering)
+        queryset = queryset.order_by(*(ordering if reverse else self.ordering))
+
+        if self.cursor is not None:
+            queryset = queryset.filter(self._get_keyset_filter(ordering if reverse else self.ordering))
+
+        # Rows fetched with values() also need the columns of the cursor.
+        fields = queryset._fields  # pylint: disable=protected-access
+        if fields and (missing := [field.attname for field in self.fields if field.attname not in fields]):
+            queryset = queryset.values(*fields, *missing)
+
+        return queryset[: self.page_size + 1]
+
+    def _get_page(self, results):
+        reverse = self.cursor is not None and self.cursor.reverse
+        self.page = results[: self.page_size]
+        has_following_position = len(results) > len(self.page)
+
+        if reverse:
+            self.page.reverse()
+            self.has_next = True
+            self.has_previous = has_following_position
+        else:
+            self.has_next = has_following_position
+            self.has_previous = self.cursor is not None
+
+        if self.page:
+            self.previous_position = self._get_position_from_instance(self.page[0], self.ordering)
+            self.next_position = self._get_position_from_instance(self.page[-1], self.ordering)
+        else:
+            self.previous_position = self.next_position = self.cursor and self.cursor.position
+
+        if (self.has_previous or self.has_next) and self.template is not None:
+            self.display_page_controls = True
+
+        return self.page
+
+    def get_ordering(self, request, queryset, view):
+        ordering = tuple(queryset.query.order_by) or tuple(queryset.model._meta.ordering) or (self.ordering,)
+        meta = queryset.model._meta
+
+        try:
+            if not all(isinstance(order, str) and meta.get_field(order.lstrip("-")) for order in ordering):
+                raise FieldDoesNotExist
+        except FieldDoesNotExist:
+            ordering = (self.ordering,)
+
+        if meta.pk.name not in {order.lstrip("-") for order in ordering}:
+            ordering += (f"-{meta.pk.name}" if ordering[0].startswith("-") else meta.pk.name,)
+
+        return ordering
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+
+        try:
+            tokens = parse.parse_qs(b64decode(encoded.encode("ascii")).decode("ascii"), keep_blank_values=True)
+            reverse = bool(int(tokens.get("r", ["0"])[0]))
+            position = tokens["p"]
+            if len(position) != len(self.fields):
+                raise ValueError
+            position = [field.to_python(value) for field, value in zip(self.fields, position)]
+        except (TypeError, ValueError, KeyError, ValidationError) as exc:
+            raise NotFound(self.invalid_cursor_message) from exc
+
+        return Cursor(offset=0, reverse=reverse, position=position)
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        return self.encode_cursor(Cursor(offset=0, reverse=False, position=self.next_position))
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        return self.encode_cursor(Cursor(offset=0, reverse=True, position=self.previous_position))
+
+    def _get_keyset_filter(self, ordering):
+        equal, after = {}, Q()
+
+        for order, field, value in zip(ordering, self.fields, self.cursor.position):
+            lookup = "lt" if order.startswith("-") else "gt"
+            after |= Q(**equal, **{f"{field.attname}__{lookup}": value})
+            equal[field.attname] = value
+
+        # Redundant bound on the leading column so the database can seek straight into the index.
+        lookup = "lte" if ordering[0].startswith("-") else "gte"
+        return Q(**{f"{self.fields[0].attname}__{lookup}": self.cursor.position[0]}) & after
+
+    def _get_position_from_instance(self, instance, ordering):
+        if isinstance(instance, dict):
+            instance = SimpleNamespace(**instance)
+        return [field.value_to_string(instance) for field in self.fields]
+
+
+class CommentCursorPagination(KeysetPagination):
+    ordering = "-created_at"
+
+
+class RatingCursorPagination(KeysetPagination):
+    ordering = "rating"
+
+
+class LimitOffsetPagination(pagination.LimitOffsetPagination):
+    async def apaginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.limit = self.get_limit(request)
+        if self.limit is None:
+            return None
+
+        self.count = await queryset.acount()
+        self.offset = self.get_offset(request)
+        if self.count > self.limit and self.template is not None:
+            self.display_page_controls = True
+
+        if self.count == 0 or self.offset > self.count:
+            return []
+        return [result async for result in queryset[self.offset : self.offset + self.limit]]
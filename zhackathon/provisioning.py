@@ -0,0 +1,155 @@
+import atexit
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import get_hasher, make_password
+from django.contrib.auth.password_validation import validate_password
+from django.core.exceptions import ValidationError
+from django.db import models
+
+# Number of users inserted per query.
+BATCH_SIZE = 1000
+
+pool = None
+pool_lock = threading.Lock()
+
+
+def hash_passwords(hasher, passwords):
+    """
+    Hashes passwords in a worker process. The hasher is the one of the parent, so that the worker needs no settings.
+    """
+    return [hasher.encode(password, hasher.salt()) for password in passwords]
+
+
+def get_workers():
+    return settings.USER_IMPORT_SETTINGS["WORKERS"] or os.cpu_count() or 1
+
+
+def get_pool():
+    """
+    Returns the process pool the batch requests of this worker share, started on first use. Its processes are
+    spawned rather than forked, since forking a threaded server is unsafe.
+    """
+    global pool  # pylint: disable=global-statement
+    with pool_lock:
+        if pool is None:
+            pool = ProcessPoolExecutor(get_workers(), mp_context=multiprocessing.get_context("spawn"))
+            atexit.register(pool.shutdown)
+        return pool
+
+
+class UserImporter:
+    """
+    Creates users from {"username", "email", "password"} records, a batch at a time: records are validated in process,
+    deduplicated against the previous ones and the existing users with one query per batch rather than one per
+    record, their passwords hashed across the processes of an executor and the users inserted by bulk_create().
+    Records without a password get an unusable one.
+    """
+
+    def __init__(self, executor, workers):
+        self.executor = executor
+        self.workers = workers
+        self.hasher = get_hasher()
+        self.usernames = set()
+        self.emails = set()
+        self.counts = dict.fromkeys(("created", "duplicates", "existing", "invalid"), 0)
+        # (position of the record from 1, username, messages) of the invalid records.
+        self.errors = []
+        self.records = 0
+
+    def import_batch(self, records):
+        user_model = get_user_model()
+        users = []
+        for record in records:
+            self.records += 1
+            if not isinstance(record, dict):
+                record = {}
+            user, messages = self.validate(user_model, record)
+            if messages:
+                self.counts["invalid"] += 1
+                self.errors.append((self.records, record.get("username"), messages))
+            elif user.username in self.usernames or user.email in self.emails:
+                self.counts["duplicates"] += 1
+            else:
+                self.usernames.add(user.username)
+                self.emails.add(user.email)
+                users.append(user)
+
+        existing = (
+            user_model.objects.filter(
+                models.Q(username__in=[user.username for user in users])
+                | models.Q(email__in=[user.email for user in users])
+            ).values_list("username", "email")
+            if users
+            else []
+        )
+        usernames, emails = set(), set()
+        for username, email in existing:
+            usernames.add(username)
+            emails.add(email)
+        new_users = [user for user in users if user.username not in usernames and user.email not in emails]
+        self.counts["existing"] += len(users) - len(new_users)
+
+        self.hash(new_users)
+        # A username registered meanwhile is skipped rather than failing the batch. SQLite does not tell which rows
+        # were inserted: those are the ones stored with the password hashed here, whose salt is random.
+        user_model.objects.bulk_create(new_users, batch_size=BATCH_SIZE, ignore_conflicts=True)
+        stored = set(
+            user_model.objects.filter(username__in=[user.username for user in new_users]).values_list(
+                "username", "password"
+            )
+            if new_users
+            else []
+        )
+        created = sum((user.username, user.password) in stored for user in new_users)
+        self.counts["created"] += created
+        self.counts["existing"] += len(new_users) - created
+
+    @staticmethod
+    def validate(user_model, record):
+        username = str(record.get("username") or "").strip()
+        email = user_model.objects.normalize_email(str(record.get("email") or "").strip())
+        password = record.get("password") or None
+        user = user_model(username=username, email=email)
+
+        messages = []
+        try:
+            user.clean_fields(exclude=["password"])
+        except ValidationError as exc:
+            messages += [f"{field}: {message}" for field, errors in exc.message_dict.items() for message in errors]
+        # The email of a user is optional, but not the one of a registration.
+        if not email:
+            messages.append("email: This field cannot be blank.")
+        if password is not None:
+            try:
+                # Like the registration endpoint.
+                validate_password(str(password))
+            except ValidationError as exc:
+                messages += [f"password: {message}" for message in exc.messages]
+
+        user.password = password
+        return user, messages
+
+    def hash(self, users):
+        """
+        Hashes the passwords of the users, split in a chunk per worker process.
+        """
+        hashed = [user for user in users if user.password is not None]
+        passwords = [str(user.password) for user in hashed]
+        size = -(-len(passwords) // self.workers)
+        chunks = [passwords[start : start + size] for start in range(0, len(passwords), size or 1)]
+
+        encoded = [
+            password
+            for chunk in self.executor.map(hash_passwords, [self.hasher] * len(chunks), chunks)
+            for password in chunk
+        ]
+        for user, password in zip(hashed, encoded):
+            user.password = password
+        for user in users:
+            if user.password is None:
+                user.password = make_password(None)
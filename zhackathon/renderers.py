@@ -0,0 +1,56 @@
+from rest_framework import renderers
+from rest_framework.utils.encoders import JSONEncoder
+
+
+class JSONRenderer(renderers.JSONRenderer):
+    """
+    Renders the same bytes as the DRF JSON renderer. Responses without indentation, i.e. all but the browsable API and
+    "application/json; indent=N" requests, reuse an encoder built once instead of resolving the indentation and
+    building an encoder for each one.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.encoder = JSONEncoder(
+            ensure_ascii=self.ensure_ascii,
+            allow_nan=not self.strict,
+            separators=renderers.SHORT_SEPARATORS if self.compact else renderers.LONG_SEPARATORS,
+        )
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None or (accepted_media_type and ";" in accepted_media_type) or "indent" in (renderer_context or {}):
+            return super().render(data, accepted_media_type, renderer_context)
+
+        content = self.encoder.encode(data)
+        # Like DRF, keeps the output a strict JavaScript subset.
+        return content.replace("\u2028", "\\u2028").replace("\u2029", "\\u2029").encode()
+
+
+class StreamingRenderer(renderers.BaseRenderer):
+    """
+    Negotiates the format of the responses which stream their content themselves, i.e. exports (see zhackathon.exports)
+    and event streams (see zhackathon.streams), from the Accept header or ?format=. Only the other responses, i.e.
+    errors, are rendered, as a JSON document.
+    """
+
+    charset = "utf-8"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        return JSONEncoder(ensure_ascii=False).encode(data).encode() + b"\n"
+
+
+class CSVRenderer(StreamingRenderer):
+    media_type = "text/csv"
+    format = "csv"
+
+
+class NDJSONRenderer(StreamingRenderer):
+    media_type = "application/x-ndjson"
+    format = "ndjson"
+
+
+class EventStreamRenderer(StreamingRenderer):
+    media_type = "text/event-stream"
+    format = "event-stream"
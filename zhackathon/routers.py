@@ -0,0 +1,38 @@
+import random
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+# Whether the current request may read from the replicas, see zhackathon.middleware.DatabaseRoutingMiddleware.
+replicas_allowed = ContextVar("replicas_allowed", default=False)
+
+
+def get_replicas():
+    return settings.DATABASE_ROUTING["REPLICAS"]
+
+
+class ReplicaRouter:
+    """
+    Sends the reads of the requests allowed to use the replicas to one of DATABASE_ROUTING["REPLICAS"] at random, and
+    every other query, including the reads of transactions and of management commands, to the default database.
+    """
+
+    def db_for_read(self, model, **hints):
+        if not (replicas := get_replicas()) or not replicas_allowed.get():
+            return DEFAULT_DB_ALIAS
+        # Reads within a transaction must see its writes.
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *get_replicas()}
+        return obj1._state.db in databases and obj2._state.db in databases
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas are copies of the default database, migrated along with it.
+        return db not in get_replicas()
@@ -0,0 +1,108 @@
+import re
+from hashlib import blake2b
+
+from django.db import connection
+
+from .models import Festival
+
+FIELDS = ("name", "discipline", "description", "commune")
+# bm25 weights of festival_id (unindexed), name, discipline, description and commune.
+WEIGHTS = (0.0, 10.0, 2.0, 1.0, 5.0)
+BATCH_SIZE = 1000
+
+
+def get_docid(festival_id):
+    """
+    Festival ids are strings, so each document gets a stable 64-bit rowid derived from it:
+    updates and deletes can then address the index row directly instead of scanning it.
+    """
+    return int.from_bytes(blake2b(festival_id.encode(), digest_size=8).digest(), "big", signed=True)
+
+
+def build_query(text):
+    """
+    Turns free text into an FTS5 query matching every word as a prefix. Words are quoted so that user input is never
+    parsed as FTS5 syntax, and accents are folded by the index tokenizer so that "fete" matches "Fête".
+    """
+    return " ".join(f'"{word}"*' for word in re.findall(r"\w+", text))
+
+
+def search(text, limit, offset=0):
+    query = build_query(text)
+    if not query:
+        return []
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT festival_id FROM festival_search WHERE festival_search MATCH %s "
+            f"ORDER BY bm25(festival_search, {', '.join(map(str, WEIGHTS))}) LIMIT %s OFFSET %s",
+            [query, limit, offset],
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+def count(text):
+    query = build_query(text)
+    if not query:
+        return 0
+
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT count(*) FROM festival_search WHERE festival_search MATCH %s", [query])
+        return cursor.fetchone()[0]
+
+
+class SearchResults:
+    """
+    Ids of the festivals matching a text, best first, paginated like a queryset: count() counts every match, and each
+    slice is a LIMIT/OFFSET of the ranked query, so that no match is out of reach.
+    """
+
+    def __init__(self, text):
+        self.text = text
+
+    def count(self):
+        return count(self.text)
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice) or index.step is not None:
+            raise TypeError("Search results only support slices.")
+        start, stop = index.start or 0, index.stop
+        return search(self.text, -1 if stop is None else max(stop - start, 0), start)
+
+
+def index_festivals(festivals):
+    rows = [
+        (get_docid(festival.pk), festival.pk, *(getattr(festival, field) for field in FIELDS)) for festival in festivals
+    ]
+
+    with connection.cursor() as cursor:
+        cursor.executemany("DELETE FROM festival_search WHERE rowid = %s", [row[:1] for row in rows])
+        cursor.executemany(
+            f"INSERT INTO festival_search (rowid, festival_id, {', '.join(FIELDS)}) VALUES (%s, %s, %s, %s, %s, %s)",
+            rows,
+        )
+
+
+def remove_festivals(festival_ids):
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            "DELETE FROM festival_search WHERE rowid = %s", [(get_docid(festival_id),) for festival_id in festival_ids]
+        )
+
+
+def rebuild_index():
+    with connection.cursor() as cursor:
+        cursor.execute("DELETE FROM festival_search")
+
+    festivals, count = [], 0
+    for festival in Festival.objects.only("id", *FIELDS).iterator(chunk_size=BATCH_SIZE):
+        festivals.append(festival)
+        if len(festivals) == BATCH_SIZE:
+            index_festivals(festivals)
+            count, festivals = count + len(festivals), []
+    index_festivals(festivals)
+
+    with connection.cursor() as cursor:
+        cursor.execute("INSERT INTO festival_search (festival_search) VALUES ('optimize')")
+
+    return count + len(festivals)
@@ -1,26 +1,171 @@
 # pylint: disable=abstract-method
 
+from django.conf import settings
 from django.contrib.auth.models import User
 from django.contrib.auth.password_validation import validate_password
+from django.core.exceptions import FieldDoesNotExist, ImproperlyConfigured
+from django.db.models import CharField, Field, IntegerField, Manager, TextField
 from django.utils.translation import gettext_lazy as _
+from drf_spectacular.utils import extend_schema_serializer
 from rest_framework import serializers
+from rest_framework.fields import empty
 from rest_framework.validators import UniqueValidator
 
-from . import models
+from . import metrics, models
 
 
-class EmptySerializer(serializers.Serializer):
+# Adds the time spent validating and representing data to the serializer phase of the request metrics. A comment
+# rather than a docstring, which drf-spectacular would copy into the description of every component.
+class TimedSerializerMixin:
+    def run_validation(self, data=empty):
+        with metrics.timer("serializer"):
+            return super().run_validation(data)
+
+    def to_representation(self, instance):
+        with metrics.timer("serializer"):
+            return super().to_representation(instance)
+
+
+class Serializer(TimedSerializerMixin, serializers.Serializer):
+    pass
+
+
+class ModelSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    pass
+
+
+# Serializes the rows of a values() queryset (see BaseViewSet.values_actions) with a converter compiled once per child
+# serializer class, instead of running the fields of the child on a model instance for every row. Model instances still
+# go through the fields. A serializer opts in with Meta.list_serializer_class.
+class RowListSerializer(TimedSerializerMixin, serializers.ListSerializer):
+    converters = {}
+
+    @classmethod
+    def get_converter(cls, serializer_class):
+        """
+        Returns the values() columns a serializer reads and a function converting such a row to its representation.
+        """
+        if serializer_class not in cls.converters:
+            cls.converters[serializer_class] = compile_row_converter(serializer_class)
+        return cls.converters[serializer_class]
+
+    def to_representation(self, data):
+        rows = list(data.all() if isinstance(data, Manager) else data)
+        if not rows or not isinstance(rows[0], dict):
+            return super().to_representation(rows)
+
+        with metrics.timer("serializer"):
+            _, convert = self.get_converter(type(self.child))
+            return [convert(row) for row in rows]
+
+
+def compile_row_converter(serializer_class):
+    plan = []
+    meta = serializer_class.Meta.model._meta
+    for field in serializer_class().fields.values():
+        if field.write_only:
+            continue
+        try:
+            model_field = meta.get_field(field.source)
+        except FieldDoesNotExist:
+            model_field = None
+        if not isinstance(model_field, Field) or model_field.many_to_many or len(field.source_attrs) != 1:
+            raise ImproperlyConfigured(f"{serializer_class.__name__}.{field.field_name} is not a model column")
+
+        # Columns already holding their representation are copied, the others go through the field.
+        if isinstance(field, serializers.PrimaryKeyRelatedField):
+            to_representation = field.pk_field.to_representation if field.pk_field is not None else None
+        elif isinstance(field, serializers.RelatedField):
+            raise ImproperlyConfigured(f"{serializer_class.__name__}.{field.field_name} needs a model instance")
+        elif type(field).to_representation in IDENTITY_REPRESENTATIONS and isinstance(model_field, IDENTITY_COLUMNS):
+            to_representation = None
+        else:
+            to_representation = field.to_representation
+        plan.append((field.field_name, model_field.attname, to_representation))
+
+    def convert(row):
+        representation = {}
+        for name, column, to_representation in plan:
+            value = row[column]
+            representation[name] = value if value is None or to_representation is None else to_representation(value)
+        return representation
+
+    return tuple(column for _, column, _ in plan), convert
+
+
+# Field representations which return database values of the matching columns unchanged.
+IDENTITY_REPRESENTATIONS = (serializers.CharField.to_representation, serializers.IntegerField.to_representation)
+IDENTITY_COLUMNS = (CharField, TextField, IntegerField)
+
+
+class EmptySerializer(Serializer):
     class Meta:
         fields = ()
 
 
-class FestivalSerializer(serializers.ModelSerializer):
+class FestivalSerializer(ModelSerializer):
     class Meta:
         model = models.Festival
-        fields = "__all__"
+        exclude = ["content_hash", "bayesian_rating", "trending_key"]
+        list_serializer_class = RowListSerializer
+
+
+class FacetCountSerializer(Serializer):
+    value = serializers.CharField(allow_null=True)
+    count = serializers.IntegerField()
+
+    class Meta:
+        fields = ["value", "count"]
+
+
+class FacetsSerializer(Serializer):
+    region = FacetCountSerializer(many=True)
+    department = FacetCountSerializer(many=True)
+    discipline = FacetCountSerializer(many=True)
+    period = FacetCountSerializer(many=True)
+
+    class Meta:
+        fields = ["region", "department", "discipline", "period"]
+
 
+class NearbyFestivalSerializer(FestivalSerializer):
+    distance_km = serializers.FloatField(read_only=True)
 
-class CommentDetailSerializer(serializers.ModelSerializer):
+
+class NearbyQuerySerializer(Serializer):
+    postcode = serializers.RegexField("^[0-9]{5}$", required=False)
+    latitude = serializers.FloatField(min_value=-90, max_value=90, required=False)
+    longitude = serializers.FloatField(min_value=-180, max_value=180, required=False)
+    radius_km = serializers.FloatField(min_value=0, max_value=500, default=30)
+
+    class Meta:
+        fields = ["postcode", "latitude", "longitude", "radius_km"]
+
+    def validate(self, attrs):
+        if "postcode" in attrs:
+            attrs["latitude"], attrs["longitude"] = models.Postcode.locate(attrs["postcode"])
+            if attrs["latitude"] is None:
+                raise serializers.ValidationError({"postcode": _("Unknown postcode.")}, code="invalid")
+        elif "latitude" not in attrs or "longitude" not in attrs:
+            raise serializers.ValidationError(_("Either a postcode or a latitude and a longitude are required."))
+
+        return attrs
+
+
+class RankedFestivalSerializer(FestivalSerializer):
+    score = serializers.FloatField(read_only=True)
+
+
+class LeaderboardQuerySerializer(Serializer):
+    region = serializers.CharField(required=False)
+    discipline = serializers.CharField(required=False)
+    limit = serializers.IntegerField(min_value=1, max_value=100, default=10)
+
+    class Meta:
+        fields = ["region", "discipline", "limit"]
+
+
+class CommentDetailSerializer(ModelSerializer):
     class Meta:
         model = models.Comment
         fields = ["festival", "content"]
@@ -31,13 +176,14 @@ class CommentDetailSerializer(serializers.ModelSerializer):
         return super().create(validated_data)
 
 
-class CommentListSerializer(serializers.ModelSerializer):
+class CommentListSerializer(ModelSerializer):
     class Meta:
         model = models.Comment
         fields = ["content"]
+        list_serializer_class = RowListSerializer
 
 
-class RatingListSerializer(serializers.ModelSerializer):
+class RatingListSerializer(ModelSerializer):
     class Meta:
         model = models.Rating
         fields = ["festival"]
@@ -48,7 +194,7 @@ class RatingListSerializer(serializers.ModelSerializer):
         return super().create(validated_data)
 
 
-class RatingDetailSerializer(serializers.ModelSerializer):
+class RatingDetailSerializer(ModelSerializer):
     class Meta:
         model = models.Rating
         fields = ["festival", "rating"]
@@ -59,21 +205,129 @@ class RatingDetailSerializer(serializers.ModelSerializer):
         return super().create(validated_data)
 
 
-class AverageRatingSerializer(serializers.Serializer):
+class CommentExportSerializer(ModelSerializer):
+    class Meta:
+        model = models.Comment
+        fields = ["id", "festival", "author", "content", "like_count", "created_at", "updated_at"]
+
+
+class RatingExportSerializer(ModelSerializer):
+    class Meta:
+        model = models.Rating
+        fields = ["id", "festival", "user", "rating"]
+
+
+class AverageRatingSerializer(Serializer):
     average = serializers.FloatField()
+    count = serializers.IntegerField()
+    histogram = serializers.DictField(child=serializers.IntegerField())
 
     class Meta:
-        fields = ["average"]
+        fields = ["average", "count", "histogram"]
 
 
-class TotalLikesSerializer(serializers.Serializer):
+class TotalLikesSerializer(Serializer):
     total = serializers.IntegerField()
 
     class Meta:
         fields = ["total"]
 
 
-class UserRegisterSerializer(serializers.ModelSerializer):
+class ReservationSerializer(Serializer):
+    quantity = serializers.IntegerField(min_value=1, default=1)
+
+    class Meta:
+        fields = ["quantity"]
+
+
+class TicketingStatusSerializer(ModelSerializer):
+    class Meta:
+        model = models.Ticketing
+        fields = ["name", "available_tickets", "status"]
+
+
+class OverviewQuerySerializer(Serializer):
+    comments = serializers.IntegerField(min_value=0, max_value=50, default=5)
+
+    class Meta:
+        fields = ["comments"]
+
+
+class OverviewCommentSerializer(ModelSerializer):
+    like_count = serializers.IntegerField(source="get_total_likes")
+    liked = serializers.BooleanField()
+
+    class Meta:
+        model = models.Comment
+        fields = ["id", "author", "content", "created_at", "updated_at", "like_count", "liked"]
+
+
+class FestivalOverviewSerializer(Serializer):
+    festival = FestivalSerializer()
+    rating = AverageRatingSerializer(allow_null=True)
+    comment_count = serializers.IntegerField()
+    comments = OverviewCommentSerializer(many=True)
+    ticketings = TicketingStatusSerializer(many=True)
+
+    class Meta:
+        fields = ["festival", "rating", "comment_count", "comments", "ticketings"]
+
+
+class CommentChangeSerializer(ModelSerializer):
+    class Meta:
+        model = models.Comment
+        # Like counts change on every like, which the change log does not record.
+        fields = ["id", "festival", "author", "content", "created_at", "updated_at"]
+
+
+class TicketingChangeSerializer(ModelSerializer):
+    class Meta:
+        model = models.Ticketing
+        fields = ["name", "festival", "total_tickets", "available_tickets", "status", "opened_at"]
+
+
+class ChangesQuerySerializer(Serializer):
+    since = serializers.IntegerField(min_value=0, default=0)
+    limit = serializers.IntegerField(min_value=1, max_value=1000, required=False)
+
+    class Meta:
+        fields = ["since", "limit"]
+
+
+class ChangeSerializer(Serializer):
+    seq = serializers.IntegerField()
+    model = serializers.ChoiceField(choices=["festival", "comment", "rating", "ticketing"])
+    id = serializers.CharField()
+    deleted = serializers.BooleanField()
+    # Current representation of the object, None for a tombstone.
+    data = serializers.DictField(allow_null=True)
+
+    class Meta:
+        fields = ["seq", "model", "id", "deleted", "data"]
+
+
+# A single object, although the response of a list action.
+@extend_schema_serializer(many=False)
+class ChangeFeedSerializer(Serializer):
+    # The since of the next request.
+    next = serializers.IntegerField()
+    more = serializers.BooleanField()
+    changes = ChangeSerializer(many=True)
+
+    class Meta:
+        fields = ["next", "more", "changes"]
+
+
+class CacheStatsSerializer(Serializer):
+    hits = serializers.IntegerField()
+    misses = serializers.IntegerField()
+    hit_ratio = serializers.FloatField(allow_null=True)
+
+    class Meta:
+        fields = ["hits", "misses", "hit_ratio"]
+
+
+class UserRegisterSerializer(ModelSerializer):
     username = serializers.CharField(write_only=True, validators=[UniqueValidator(User.objects.all())])
     email = serializers.EmailField(validators=[UniqueValidator(User.objects.all())])
     password = serializers.CharField(write_only=True, validators=[validate_password], style={"input_type": "password"})
@@ -90,9 +344,51 @@ class UserRegisterSerializer(serializers.ModelSerializer):
         return attrs
 
 
-class UserLoginSerializer(serializers.Serializer):
+class UserLoginSerializer(Serializer):
     username = serializers.CharField()
     password = serializers.CharField(write_only=True, style={"input_type": "password"})
 
     class Meta:
         fields = ("username", "password")
+
+
+class UserBatchSerializer(Serializer):
+    users = serializers.ListField(child=serializers.DictField(), min_length=1)
+
+    class Meta:
+        fields = ["users"]
+
+    def validate_users(self, value):
+        if len(value) > (limit := settings.USER_IMPORT_SETTINGS["MAX_BATCH_SIZE"]):
+            raise serializers.ValidationError(
+                _("Ensure this field has no more than %(limit)d elements.") % {"limit": limit}, code="max_length"
+            )
+        return value
+
+
+class UserImportErrorSerializer(Serializer):
+    # Position of the record in the list, from 1.
+    record = serializers.IntegerField()
+    username = serializers.CharField(allow_null=True)
+    messages = serializers.ListField(child=serializers.CharField())
+
+    class Meta:
+        fields = ["record", "username", "messages"]
+
+
+class UserBatchResultSerializer(Serializer):
+    created = serializers.IntegerField()
+    duplicates = serializers.IntegerField()
+    existing = serializers.IntegerField()
+    invalid = serializers.IntegerField()
+    errors = UserImportErrorSerializer(many=True)
+
+    class Meta:
+        fields = ["created", "duplicates", "existing", "invalid", "errors"]
+
+
+class TokenSerializer(Serializer):
+    token = serializers.CharField(source="key")
+
+    class Meta:
+        fields = ["token"]
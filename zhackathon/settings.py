@@ -31,20 +31,28 @@ INSTALLED_APPS = [
     "django_extensions",
     "drf_spectacular",
     "rest_framework",
+    "rest_framework.authtoken",
 ]
 
 REST_SESSION_LOGIN = False
 REST_FRAMEWORK = {
     "DEFAULT_SCHEMA_CLASS": "drf_spectacular.openapi.AutoSchema",
     "DEFAULT_FILTER_BACKENDS": ["django_filters.rest_framework.DjangoFilterBackend"],
-    "DEFAULT_PAGINATION_CLASS": "rest_framework.pagination.LimitOffsetPagination",
+    "DEFAULT_PAGINATION_CLASS": "zhackathon.pagination.LimitOffsetPagination",
+    "DEFAULT_RENDERER_CLASSES": [
+        "zhackathon.renderers.JSONRenderer",
+        "rest_framework.renderers.BrowsableAPIRenderer",
+    ],
     "PAGE_SIZE": 10,
     # "DEFAULT_PERMISSION_CLASSES": [
     #     "rest_framework.permissions.AllowAny",
     # ],
-    # "DEFAULT_AUTHENTICATION_CLASSES": [
-    #     "rest_framework.authentication.SessionAuthentication",
-    # ],
+    "DEFAULT_AUTHENTICATION_CLASSES": [
+        "rest_framework.authentication.SessionAuthentication",
+        "rest_framework.authentication.BasicAuthentication",
+        # "Authorization: Token {key}", from POST /api/user/token/, cached in the "tokens" cache.
+        "zhackathon.authentication.CachedTokenAuthentication",
+    ],
 }
 
 SPECTACULAR_SETTINGS = {
@@ -55,7 +63,71 @@ SPECTACULAR_SETTINGS = {
     "COMPONENT_SPLIT_REQUEST": True,
 }
 
+TICKETING_SETTINGS = {
+    # A ticketing switches to LAST PLACES, then CLOSED, once its available tickets drop to these values.
+    "LAST_PLACES_THRESHOLD": 10,
+    "CLOSED_THRESHOLD": 0,
+}
+
+TICKETING_STREAM_SETTINGS = {
+    # Seconds between two events of a ticketing stream, the updates in between are merged into the next one.
+    "INTERVAL": 1,
+    # Seconds of silence after which a stream sends a comment, so that proxies keep the connection open.
+    "KEEPALIVE": 15,
+    # Directory where each ASGI worker binds a Unix datagram socket, through which the updates of every process reach
+    # its subscribers (None: a single worker).
+    "BRIDGE_DIRECTORY": None,
+}
+
+LEADERBOARD_SETTINGS = {
+    # Top festivals are ranked by their average rating blended with PRIOR_WEIGHT ratings of PRIOR_MEAN, so that a few
+    # ratings cannot outrank many. Run rebuild_rating_aggregates after changing them.
+    "PRIOR_MEAN": 3,
+    "PRIOR_WEIGHT": 10,
+    # Hours after which a comment, like or rating counts half as much in the trending score. A new half-life applies to
+    # the activity recorded from then on, which outranks the older one right away.
+    "TRENDING_HALF_LIFE": 24,
+    # Weight of each kind of activity in the trending score.
+    "TRENDING_WEIGHTS": {"comment": 1, "like": 0.5, "rating": 2},
+}
+
+LIKE_SETTINGS = {
+    # Buffers the likes and unlikes in process and writes them in batches, instead of within their requests.
+    "WRITE_BEHIND": False,
+    # Seconds between two writes of the buffered likes.
+    "FLUSH_INTERVAL": 1,
+    # Number of buffered (comment, user) pairs triggering a write right away.
+    "FLUSH_SIZE": 500,
+}
+
+USER_IMPORT_SETTINGS = {
+    # Processes hashing the passwords of POST /api/user/batch/, shared by the requests of a worker (None: one per CPU).
+    "WORKERS": None,
+    # Users accepted per request, larger lists go through the import_users command.
+    "MAX_BATCH_SIZE": 1000,
+}
+
+CHANGE_LOG_SETTINGS = {
+    # Changes returned by GET /api/changes/ when the request sets no limit.
+    "PAGE_SIZE": 500,
+    # Days after which compact_changes deletes tombstones: clients which have not synced for longer sync again from 0.
+    "TOMBSTONE_RETENTION": 30,
+}
+
+METRICS_SETTINGS = {
+    "ENABLED": True,
+    # Requests slower than this many seconds log the SQL they executed (None disables the log).
+    "SLOW_REQUEST_THRESHOLD": None,
+    # Adds a Server-Timing header with the time spent in each phase and the number of queries to every response.
+    "SERVER_TIMING": False,
+    # Bearer token of the scrapers of /metrics, which otherwise only serves staff users (None: staff users only).
+    "TOKEN": None,
+}
+
 MIDDLEWARE = [
+    "zhackathon.metrics.MetricsMiddleware",
+    "zhackathon.middleware.AsyncReadPathMiddleware",
+    "zhackathon.middleware.DatabaseRoutingMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -93,10 +165,69 @@ DATABASES = {
     "default": {
         "ENGINE": "django.db.backends.sqlite3",
         "NAME": BASE_DIR / "db.sqlite3",
-    }
+        "OPTIONS": {"timeout": 20},
+    },
+    # Local stand-in for a read replica, kept in sync by the sync_replicas command. Only used once listed in
+    # DATABASE_ROUTING["REPLICAS"].
+    "replica": {
+        "ENGINE": "django.db.backends.sqlite3",
+        "NAME": BASE_DIR / "db_replica.sqlite3",
+        "OPTIONS": {"timeout": 20},
+        "TEST": {"MIRROR": "default"},
+    },
+}
+
+DATABASE_ROUTERS = ["zhackathon.routers.ReplicaRouter"]
+
+DATABASE_ROUTING = {
+    # Aliases of DATABASES the reads of safe requests are spread over (none: everything goes to "default").
+    "REPLICAS": [],
+    # Seconds the replicas may lag behind: clients read from "default" for this long after they write, and cached
+    # responses are invalidated once more after it, in case they were rendered from a replica not yet up to date.
+    "MAX_REPLICATION_LAG": 5,
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/4.1/topics/cache/
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
+    # Rendered API responses, see zhackathon.cache. The in-process LRU is only invalidated by the writes of its own
+    # process: use a shared backend, e.g. django.core.cache.backends.filebased.FileBasedCache, with several workers.
+    "responses": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "responses",
+        "TIMEOUT": 300,
+        "OPTIONS": {"MAX_ENTRIES": 10000},
+    },
+    # Users of the verified API tokens, see zhackathon.authentication. Each process only evicts the tokens revoked by
+    # its own requests, the others keep accepting them for up to TIMEOUT seconds: use a shared backend to evict them
+    # everywhere at once.
+    "tokens": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "tokens",
+        "TIMEOUT": 60,
+        "OPTIONS": {"MAX_ENTRIES": 10000},
+    },
+    # Sessions, written through to the database and read from the cache (see SESSION_ENGINE). With several workers, it
+    # must be a shared backend, or a worker would still read a session ended by another one.
+    "sessions": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "sessions",
+        "OPTIONS": {"MAX_ENTRIES": 10000},
+    },
+}
+
+# Sessions are read from the "sessions" cache rather than from django_session on every request. Without any shared
+# cache, "django.contrib.sessions.backends.signed_cookies" keeps them in the cookie itself instead, at the cost of not
+# being able to end a session server-side before it expires.
+SESSION_ENGINE = "django.contrib.sessions.backends.cached_db"
+SESSION_CACHE_ALIAS = "sessions"
+
+
 # Password validation
 # https://docs.djangoproject.com/en/4.1/ref/settings/#auth-password-validators
 
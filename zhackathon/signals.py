@@ -0,0 +1,192 @@
+from django.contrib.auth.models import User
+from django.db.backends.signals import connection_created
+from django.db.models import F, QuerySet
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from . import metrics, search
+from .authentication import evict_tokens_on_commit
+from .cache import response_cache
+from .models import (
+    Change,
+    Comment,
+    Festival,
+    FestivalFacet,
+    Postcode,
+    Rating,
+    Ticketing,
+    ticketing_reserved,
+)
+from .streams import ticketing_broker
+
+
+@receiver(pre_save, sender=Festival)
+def locate_festival(sender, instance, update_fields=None, **kwargs):
+    if update_fields is None:
+        instance.latitude, instance.longitude = Postcode.locate(instance.postcode)
+
+
+@receiver(pre_save, sender=Festival)
+def remember_festival_facets(sender, instance, raw=False, **kwargs):
+    """
+    Festivals loaded or saved before know their stored facets (see Festival.from_db), other ones are new, except those
+    loaded without their facets and fixture entries, which may overwrite a festival: only these read them.
+    """
+    if raw or (not instance._state.adding and not hasattr(instance, "stored_facet_key")):
+        stored = Festival.objects.filter(pk=instance.pk).values(*FestivalFacet.DIMENSIONS).first()
+        instance.stored_facet_key = None if stored is None else FestivalFacet.get_key(stored)
+        # Deferred facets are not saved, they keep their stored values.
+        for dimension in instance.get_deferred_fields() & set(FestivalFacet.DIMENSIONS) if stored else ():
+            setattr(instance, dimension, stored[dimension])
+
+
+@receiver(post_save, sender=Festival)
+def count_festival_facets(sender, instance, **kwargs):
+    key = FestivalFacet.get_key(vars(instance))
+    previous_key = getattr(instance, "stored_facet_key", None)
+
+    if key != previous_key:
+        FestivalFacet.update_counts({key: 1, **({previous_key: -1} if previous_key is not None else {})})
+    instance.stored_facet_key = key
+
+
+@receiver(post_delete, sender=Festival)
+def uncount_festival_facets(sender, instance, **kwargs):
+    FestivalFacet.update_counts({FestivalFacet.get_key(vars(instance)): -1})
+
+
+@receiver(post_save, sender=Festival)
+def index_festival(sender, instance, update_fields=None, **kwargs):
+    if update_fields is None or not set(update_fields).isdisjoint(search.FIELDS):
+        search.index_festivals([instance])
+
+
+@receiver(post_delete, sender=Festival)
+def unindex_festival(sender, instance, **kwargs):
+    search.remove_festivals([instance.pk])
+
+
+@receiver(post_save, sender=Festival)
+@receiver(post_delete, sender=Festival)
+def invalidate_festival(sender, instance, **kwargs):
+    response_cache.invalidate_on_commit("festivals", f"festival:{instance.pk}")
+
+
+@receiver(pre_save, sender=Rating)
+def remember_rated_festival(sender, instance, raw=False, **kwargs):
+    # Fixture entries may overwrite a stored rating.
+    if raw or not instance._state.adding:
+        instance.previous_rating = Rating.objects.filter(pk=instance.pk).values_list("festival_id", "rating").first()
+        instance.previous_festival_id = instance.previous_rating and instance.previous_rating[0]
+
+
+@receiver(post_save, sender=Rating)
+def rate_festival(sender, instance, **kwargs):
+    """
+    Moves a saved rating within the aggregates of its festivals, whether it was saved by the API, the admin, a fixture
+    or any other code.
+    """
+    previous = getattr(instance, "previous_rating", None)
+    current = (instance.festival_id, instance.rating)
+    if previous != current:
+        if previous is not None:
+            Festival.update_rating_aggregates(*previous, -1)
+        Festival.update_rating_aggregates(*current, 1)
+    instance.previous_rating = current
+
+
+@receiver(post_delete, sender=Rating)
+def unrate_festival(sender, instance, origin=None, **kwargs):
+    """
+    Removes a deleted rating from the aggregates of its festival, whether the rating or its user was deleted. The
+    aggregates of a deleted festival go with it.
+    """
+    origin_model = origin.model if isinstance(origin, QuerySet) else type(origin)
+    if origin_model is not Festival:
+        Festival.update_rating_aggregates(instance.festival_id, instance.rating, -1)
+
+
+@receiver(post_save, sender=Rating)
+@receiver(post_delete, sender=Rating)
+def invalidate_rated_festival(sender, instance, **kwargs):
+    festival_ids = {instance.festival_id, getattr(instance, "previous_festival_id", None)} - {None}
+    response_cache.invalidate_on_commit("festivals", *(f"festival:{festival_id}" for festival_id in festival_ids))
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def invalidate_festival_comments(sender, instance, **kwargs):
+    response_cache.invalidate_on_commit(f"comments:{instance.festival_id}")
+
+
+@receiver(pre_delete, sender=User)
+def unlike_comments(sender, instance, **kwargs):
+    # The likes of a deleted user go with it, without Comment.unlike().
+    liked = Comment.liked_by.through.objects.filter(user_id=instance.pk).values("comment_id")
+    Comment.objects.filter(pk__in=liked).update(like_count=F("like_count") - 1)
+
+
+@receiver(post_save, sender=Comment)
+def record_comment_activity(sender, instance, created, **kwargs):
+    if created:
+        Festival.record_activity({instance.festival_id: 1}, "comment")
+
+
+@receiver(post_save, sender=Ticketing)
+@receiver(post_delete, sender=Ticketing)
+def invalidate_festival_ticketings(sender, instance, **kwargs):
+    response_cache.invalidate_on_commit(f"festival:{instance.festival_id}")
+
+
+@receiver(post_save, sender=Ticketing)
+@receiver(ticketing_reserved, sender=Ticketing)
+def publish_ticketing(sender, instance, **kwargs):
+    ticketing_broker.publish_on_commit(instance.festival_id, [instance])
+
+
+@receiver(post_save, sender=Festival)
+@receiver(post_save, sender=Comment)
+@receiver(post_save, sender=Rating)
+@receiver(post_save, sender=Ticketing)
+def record_change(sender, instance, **kwargs):
+    Change.record(sender, [instance.pk])
+
+
+@receiver(post_delete, sender=Festival)
+@receiver(post_delete, sender=Comment)
+@receiver(post_delete, sender=Rating)
+@receiver(post_delete, sender=Ticketing)
+def record_deletion(sender, instance, origin=None, **kwargs):
+    # The tombstone of a festival stands for those of its comments, ratings and ticketings.
+    origin_model = origin.model if isinstance(origin, QuerySet) else type(origin)
+    if origin_model is Festival and sender is not Festival:
+        return
+    Change.record(sender, [instance.pk], deleted=True)
+
+
+@receiver(post_save, sender=User)
+def revoke_user_tokens(sender, instance, created, update_fields=None, **kwargs):
+    """
+    A password change revokes the tokens of the user, any other change (deactivation, permissions...) evicts the user
+    cached with them. Logins only update last_login.
+    """
+    if created or (update_fields is not None and set(update_fields) <= {"last_login"}):
+        return
+
+    tokens = Token.objects.filter(user=instance)
+    # Set by set_password() until the user is saved.
+    if instance._password is not None:  # pylint: disable=protected-access
+        tokens.delete()
+    else:
+        evict_tokens_on_commit(tokens.values_list("key", flat=True))
+
+
+@receiver(post_delete, sender=Token)
+def evict_token(sender, instance, **kwargs):
+    evict_tokens_on_commit([instance.key])
+
+
+@receiver(connection_created)
+def time_queries(sender, connection, **kwargs):
+    metrics.install_execute_wrapper(connection)
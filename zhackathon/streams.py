@@ -0,0 +1,269 @@
+import asyncio
+import atexit
+import contextvars
+import json
+import logging
+import os
+import socket
+import threading
+from collections import defaultdict
+from pathlib import Path
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers import asgi
+from django.db import transaction
+from django.http import StreamingHttpResponse
+from rest_framework.utils.encoders import JSONEncoder
+
+logger = logging.getLogger(__name__)
+
+# Columns of a ticketing sent to its subscribers, like serializers.TicketingStatusSerializer.
+FIELDS = ("name", "available_tickets", "status")
+
+encoder = JSONEncoder(ensure_ascii=False, separators=(",", ":"))
+# Receive channel of the ASGI connection of the current request, see ASGIHandler.
+receive_channel = contextvars.ContextVar("receive_channel")
+
+
+def encode_event(ticketings):
+    ticketings = sorted(ticketings, key=lambda ticketing: ticketing["name"])
+    return f"event: ticketings\ndata: {encoder.encode(ticketings)}\n\n".encode()
+
+
+class Subscription:
+    def __init__(self, festival_id):
+        self.festival_id = festival_id
+        # Latest state of each ticketing updated since the last event, by name.
+        self.changes = {}
+        self.ready = asyncio.Event()
+
+
+class TicketingBroker:
+    """
+    Fans the ticketing updates out to the streams of this process, subscribed from its event loop. Updates are
+    coalesced per festival: the first one after a quiet INTERVAL goes out right away, the next ones are merged, by
+    ticketing, into a single event at the end of the interval. A subscription is an event and a dict, so a worker holds
+    thousands of idle ones for little memory and no thread.
+
+    With TICKETING_STREAM_SETTINGS["BRIDGE_DIRECTORY"], each worker also binds a Unix datagram socket there, and
+    publishes the updates of its requests to the sockets of the others, whatever their server (WSGI workers and
+    management commands publish without subscribers of their own).
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.loop = None
+        self.subscriptions = defaultdict(set)
+        # Updates merged for the next event of each festival, and loop time of its last event.
+        self.pending = {}
+        self.flushed_at = {}
+        self.transport = None
+        self.path = None
+        self.sender = None
+
+    async def subscribe(self, festival_id):
+        loop = asyncio.get_running_loop()
+        if loop is not self.loop:
+            self.bind(loop)
+            await self.listen()
+
+        subscription = Subscription(festival_id)
+        self.subscriptions[festival_id].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        subscriptions = self.subscriptions.get(subscription.festival_id, set())
+        subscriptions.discard(subscription)
+        if not subscriptions:
+            self.subscriptions.pop(subscription.festival_id, None)
+            self.flushed_at.pop(subscription.festival_id, None)
+
+    def bind(self, loop):
+        """
+        Attaches the broker to the event loop of this process, e.g. after a previous one was closed.
+        """
+        if self.transport is not None and not self.loop.is_closed():
+            self.transport.close()
+        with self.lock:
+            self.loop, self.transport = loop, None
+        self.subscriptions.clear()
+        self.pending.clear()
+        self.flushed_at.clear()
+
+    async def listen(self):
+        directory = settings.TICKETING_STREAM_SETTINGS["BRIDGE_DIRECTORY"]
+        if directory is None:
+            return
+
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"{os.getpid()}.sock")
+        # Left over by a previous process with the same id.
+        Path(path).unlink(missing_ok=True)
+        self.transport, _ = await asyncio.get_running_loop().create_datagram_endpoint(
+            lambda: BridgeProtocol(self), local_addr=path, family=socket.AF_UNIX
+        )
+        if self.path is None:
+            atexit.register(lambda: Path(self.path).unlink(missing_ok=True))
+        self.path = path
+
+    def publish_on_commit(self, festival_id, ticketings):
+        """
+        Publishes the state of ticketings once the transaction which changed them commits.
+        """
+        ticketings = [{field: getattr(ticketing, field) for field in FIELDS} for ticketing in ticketings]
+        transaction.on_commit(lambda: self.publish(festival_id, ticketings))
+
+    def publish(self, festival_id, ticketings):
+        with self.lock:
+            loop = self.loop
+        if loop is not None and not loop.is_closed():
+            loop.call_soon_threadsafe(self.dispatch, festival_id, ticketings)
+        self.broadcast(festival_id, ticketings)
+
+    def broadcast(self, festival_id, ticketings):
+        directory = settings.TICKETING_STREAM_SETTINGS["BRIDGE_DIRECTORY"]
+        if directory is None:
+            return
+
+        message = encoder.encode({"festival": festival_id, "ticketings": ticketings}).encode()
+        with self.lock:
+            if self.sender is None:
+                self.sender = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+                self.sender.setblocking(False)
+        for path in map(str, Path(directory).glob("*.sock")):
+            if path == self.path:
+                continue
+            try:
+                self.sender.sendto(message, path)
+            except ConnectionRefusedError:
+                # Nobody listens anymore: the worker died without cleaning up.
+                Path(path).unlink(missing_ok=True)
+            except FileNotFoundError:
+                pass
+            except OSError:
+                logger.warning("Could not publish the ticketings of %s to %s", festival_id, path, exc_info=True)
+
+    def dispatch(self, festival_id, ticketings):
+        if festival_id not in self.subscriptions:
+            return
+
+        if festival_id not in self.pending:
+            delay = self.flushed_at.get(festival_id, -float("inf")) + get_interval() - self.loop.time()
+            self.loop.call_later(max(delay, 0), self.flush, festival_id)
+        self.pending.setdefault(festival_id, {}).update((ticketing["name"], ticketing) for ticketing in ticketings)
+
+    def flush(self, festival_id):
+        changes = self.pending.pop(festival_id, {})
+        self.flushed_at[festival_id] = self.loop.time()
+        for subscription in self.subscriptions.get(festival_id, ()):
+            subscription.changes.update(changes)
+            subscription.ready.set()
+
+
+class BridgeProtocol(asyncio.DatagramProtocol):
+    def __init__(self, broker):
+        self.broker = broker
+
+    def datagram_received(self, data, addr):
+        try:
+            message = json.loads(data)
+            self.broker.dispatch(message["festival"], message["ticketings"])
+        except (ValueError, KeyError, TypeError):
+            logger.warning("Ignored a malformed ticketing update from %s", addr)
+
+
+def get_interval():
+    return settings.TICKETING_STREAM_SETTINGS["INTERVAL"]
+
+
+class EventStreamResponse(StreamingHttpResponse):
+    """
+    Server-sent events of the ticketings of a festival: a first event with all of them, then one with those which
+    changed, at most every INTERVAL seconds, and a comment every KEEPALIVE seconds of silence. Only ASGIHandler
+    streams the updates: other handlers, e.g. WSGI, would hold a thread per stream, so they only send the first event
+    and a retry delay of INTERVAL, after which EventSource clients reconnect.
+    """
+
+    def __init__(self, festival_id, ticketings):
+        self.festival_id = festival_id
+        # Resolved now, while the request still decides whether the replicas may serve it.
+        self.ticketings = ticketings.using(ticketings.db).values(*FIELDS)
+        super().__init__(self.get_snapshot(), content_type="text/event-stream")
+        self["Cache-Control"] = "no-cache"
+        # Keeps nginx from buffering the events.
+        self["X-Accel-Buffering"] = "no"
+
+    def get_snapshot(self):
+        yield f"retry: {int(get_interval() * 1000)}\n".encode() + encode_event(self.ticketings)
+
+    async def astream(self, send, receive):
+        subscription = await ticketing_broker.subscribe(self.festival_id)
+        disconnect = asyncio.ensure_future(wait_for_disconnect(receive))
+        ready = None
+        try:
+            # Read once subscribed, so that no update falls in between.
+            snapshot = await sync_to_async(list)(self.ticketings)
+            await send({"type": "http.response.body", "body": encode_event(snapshot), "more_body": True})
+
+            while True:
+                ready = ready or asyncio.ensure_future(subscription.ready.wait())
+                done, _ = await asyncio.wait(
+                    {ready, disconnect},
+                    timeout=settings.TICKETING_STREAM_SETTINGS["KEEPALIVE"],
+                    return_when=asyncio.FIRST_COMPLETED,
+                )
+                if disconnect in done:
+                    break
+                if ready in done:
+                    ready = None
+                    subscription.ready.clear()
+                    changes, subscription.changes = subscription.changes, {}
+                    body = encode_event(changes.values())
+                else:
+                    body = b": keep-alive\n\n"
+                await send({"type": "http.response.body", "body": body, "more_body": True})
+        finally:
+            ticketing_broker.unsubscribe(subscription)
+            disconnect.cancel()
+            if ready is not None:
+                ready.cancel()
+
+
+async def wait_for_disconnect(receive):
+    while (await receive())["type"] != "http.disconnect":
+        pass
+
+
+class ASGIHandler(asgi.ASGIHandler):
+    """
+    Django's ASGI handler, which also streams the responses having an astream method, EventStreamResponse and
+    exports.ExportResponse, from the event loop: Django 4.1 iterates streaming responses synchronously, and could not
+    tell when their client disconnects.
+    """
+
+    async def handle(self, scope, receive, send):
+        token = receive_channel.set(receive)
+        try:
+            await super().handle(scope, receive, send)
+        finally:
+            receive_channel.reset(token)
+
+    async def send_response(self, response, send):
+        if not hasattr(response, "astream"):
+            await super().send_response(response, send)
+            return
+
+        headers = [(str(header).encode("ascii"), str(value).encode("latin1")) for header, value in response.items()]
+        headers += [
+            (b"Set-Cookie", cookie.output(header="").encode("ascii").strip()) for cookie in response.cookies.values()
+        ]
+        await send({"type": "http.response.start", "status": response.status_code, "headers": headers})
+        try:
+            await response.astream(send, receive_channel.get())
+        finally:
+            await send({"type": "http.response.body"})
+            await sync_to_async(response.close, thread_sensitive=True)()
+
+
+ticketing_broker = TicketingBroker()
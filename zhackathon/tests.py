@@ -1,3 +1,1965 @@
-from django.test import TestCase
+import asyncio
+import csv
+import gzip
+import json
+import multiprocessing
+import os
+import socket
+import sqlite3
+import tempfile
+import threading
+import time
+from contextlib import ExitStack, closing, contextmanager
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.core.signals import request_finished, request_started
+from django.db import (
+    DatabaseError,
+    close_old_connections,
+    connection,
+    connections,
+    transaction,
+)
+from django.test import Client, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from . import (
+    benchmark,
+    geo,
+    metrics,
+    middleware,
+    renderers,
+    routers,
+    search,
+    serializers,
+    streams,
+    views,
+)
+from .authentication import TOKEN_CACHE_ALIAS
+from .cache import CACHE_ALIAS, response_cache
+from .likes import like_buffer
+from .management.commands import audit_queries, import_festivals
+from .models import (
+    Change,
+    ChangeHorizon,
+    Comment,
+    Festival,
+    FestivalFacet,
+    FestivalNeighbour,
+    Postcode,
+    Rating,
+    Ticketing,
+)
+from .provisioning import UserImporter
+from .urls import router
+
+
+def reserve_tickets(args):
+    database, ticketing_name, user_id, attempts = args
+    # Forked processes cannot share the in-memory test database, they write to a file copy of it.
+    connections["default"].settings_dict["NAME"] = database
+    connections.close_all()
+
+    client = APIClient()
+    client.force_authenticate(User.objects.get(pk=user_id))
+
+    statuses = [
+        client.post(f"/api/ticketings/{ticketing_name}/reserve/", {"quantity": 1}).status_code for _ in range(attempts)
+    ]
+    connections.close_all()
+    return statuses
+
+
+class RatingAggregateTestCase(TestCase):
+    def setUp(self):
+        self.festival = Festival.objects.create(id="FEST_1", name="Festival", discipline="Musique")
+        self.other = Festival.objects.create(id="FEST_2", name="Other", discipline="Cirque")
+        self.user = User.objects.create_superuser("admin", "admin@zhackathon.fr", "admin")
+
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def assertAggregates(self, festival, count, total, histogram):
+        festival.refresh_from_db()
+        self.assertEqual((festival.rating_count, festival.rating_sum), (count, total))
+        self.assertEqual(festival.average_rating, total / count if count else None)
+        self.assertEqual({rating: n for rating, n in festival.get_rating_histogram().items() if n}, histogram)
+
+    def test_aggregates_follow_rating_writes(self):
+        self.client.post("/api/ratings/", {"festival": self.festival.pk, "rating": 4})
+        rating_id = Rating.objects.get().pk
+        self.assertAggregates(self.festival, 1, 4, {4: 1})
+
+        self.client.patch(f"/api/ratings/{rating_id}/", {"rating": 2})
+        self.assertAggregates(self.festival, 1, 2, {2: 1})
+
+        self.client.put(f"/api/ratings/{rating_id}/", {"festival": self.other.pk, "rating": 5})
+        self.assertAggregates(self.festival, 0, 0, {})
+        self.assertAggregates(self.other, 1, 5, {5: 1})
+
+        self.client.delete(f"/api/ratings/{rating_id}/")
+        self.assertAggregates(self.other, 0, 0, {})
+        call_command("rebuild_rating_aggregates", check=True, stdout=StringIO())
+
+    def test_aggregates_follow_cascading_deletes(self):
+        for index, rating in enumerate((1, 3, 5)):
+            self.client.force_authenticate(User.objects.create(username=f"user-{index}", is_staff=True))
+            self.client.post("/api/ratings/", {"festival": self.festival.pk, "rating": rating})
+            self.client.post("/api/ratings/", {"festival": self.other.pk, "rating": rating})
+        self.assertAggregates(self.festival, 3, 9, {1: 1, 3: 1, 5: 1})
+
+        User.objects.get(username="user-2").delete()
+        self.assertAggregates(self.festival, 2, 4, {1: 1, 3: 1})
+        self.assertAggregates(self.other, 2, 4, {1: 1, 3: 1})
+
+        self.festival.delete()
+        self.assertAggregates(self.other, 2, 4, {1: 1, 3: 1})
+        call_command("rebuild_rating_aggregates", check=True, stdout=StringIO())
+
+    def test_aggregates_follow_orm_writes(self):
+        rating = Rating.objects.create(user=self.user, festival=self.festival, rating=3)
+        self.assertAggregates(self.festival, 1, 3, {3: 1})
+
+        rating.festival, rating.rating = self.other, 1
+        rating.save()
+        rating.save()
+        self.assertAggregates(self.festival, 0, 0, {})
+        self.assertAggregates(self.other, 1, 1, {1: 1})
+
+        # A fixture entry overwriting the stored rating.
+        Rating.objects.filter(pk=rating.pk).get().save_base(raw=True)
+        self.assertAggregates(self.other, 1, 1, {1: 1})
+
+        self.user.delete()
+        self.assertAggregates(self.other, 0, 0, {})
+        call_command("rebuild_rating_aggregates", check=True, stdout=StringIO())
+
+
+class CommentLikeTestCase(TestCase):
+    def setUp(self):
+        festival = Festival.objects.create(id="FEST_1", name="Festival", discipline="Musique")
+        self.admin = User.objects.create_superuser("admin", "admin@zhackathon.fr", "admin")
+        self.users = [User.objects.create(username=f"user-{index}") for index in range(2)]
+        self.comment = Comment.objects.create(festival=festival, author=self.admin, content="Super")
+
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def assertLikes(self, users):
+        self.comment.refresh_from_db()
+        self.assertEqual(set(self.comment.liked_by.all()), set(users))
+        self.assertEqual(self.comment.like_count, len(users))
+
+    def test_like_and_unlike_are_idempotent(self):
+        for _ in range(2):
+            response = self.client.post(f"/api/comments/{self.comment.pk}/like/")
+            self.assertEqual(response.data, {"total": 1})
+        self.assertLikes([self.admin])
+
+        for user in self.users:
+            self.comment.like(user)
+        self.comment.like(self.users[0])
+        self.assertLikes([self.admin, *self.users])
+
+        for _ in range(2):
+            response = self.client.delete(f"/api/comments/{self.comment.pk}/unlike/")
+            self.assertEqual(response.data, {"total": 2})
+        self.assertLikes(self.users)
+
+        self.comment.unlike(self.admin)
+        self.comment.unlike(self.users[1])
+        self.assertLikes([self.users[0]])
+        self.assertEqual(self.client.get(f"/api/comments/{self.comment.pk}/likes/").data, {"total": 1})
+
+    def test_deleted_users_take_their_likes_along(self):
+        for user in self.users:
+            self.comment.like(user)
+        self.users[0].delete()
+        self.assertLikes([self.users[1]])
+        call_command("rebuild_like_counts", check=True, stdout=StringIO())
+
+    def test_rebuild_like_counts(self):
+        self.comment.like(self.admin)
+        Comment.objects.filter(pk=self.comment.pk).update(like_count=3)
+        with self.assertRaises(CommandError):
+            call_command("rebuild_like_counts", check=True, stdout=StringIO())
+
+        stdout = StringIO()
+        call_command("rebuild_like_counts", stdout=stdout)
+        self.assertIn("Rebuilt like counts of 1 comment(s)", stdout.getvalue())
+        self.assertLikes([self.admin])
+
+
+class KeysetPaginationTestCase(TestCase):
+    def setUp(self):
+        caches[CACHE_ALIAS].clear()
+        self.festival = Festival.objects.create(id="FEST_1", name="Festival", discipline="Musique")
+        self.admin = User.objects.create_superuser("admin", "admin@zhackathon.fr", "admin")
+        self.users = [User.objects.create(username=f"user-{index}") for index in range(7)]
+
+        now = timezone.now()
+        for index, user in enumerate(self.users):
+            comment = Comment.objects.create(festival=self.festival, author=user, content=f"Comment {index}")
+            # Pairs of comments created at the same time, told apart by their id.
+            Comment.objects.filter(pk=comment.pk).update(created_at=now - timedelta(minutes=index // 2))
+            festival = Festival.objects.create(id=f"FEST_R{index}", name=f"Rated {index}", discipline="Cirque")
+            Rating.objects.create(festival=festival, user=user, rating=index % 3)
+
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def get_pages(self, url):
+        pages = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            pages.append(response.data)
+            url = response.data["next"]
+        return pages
+
+    def test_ties_are_broken_by_the_primary_key(self):
+        pages = self.get_pages("/api/comments/?page_size=2")
+        self.assertEqual([len(page["results"]) for page in pages], [2, 2, 2, 1])
+        expected = Comment.objects.order_by("-created_at", "-id").values_list("content", flat=True)
+        self.assertEqual([comment["content"] for page in pages for comment in page["results"]], list(expected))
+
+        pages = self.get_pages("/api/ratings/?page_size=3")
+        expected = Rating.objects.order_by("rating", "id").values_list("festival", flat=True)
+        self.assertEqual([rating["festival"] for page in pages for rating in page["results"]], list(expected))
+
+    def test_cursors_are_stable_across_inserts(self):
+        first = self.client.get("/api/comments/?page_size=3").data
+        # Rows inserted before the cursor would shift an offset onto rows already seen.
+        for index in range(3):
+            Comment.objects.create(festival=self.festival, author=self.admin, content=f"Newer {index}")
+        older = Comment.objects.create(festival=self.festival, author=self.admin, content="Older")
+        Comment.objects.filter(pk=older.pk).update(created_at=timezone.now() - timedelta(days=1))
+
+        pages = [first, *self.get_pages(first["next"])]
+        contents = [comment["content"] for page in pages for comment in page["results"]]
+        self.assertEqual(sorted(contents), [*(f"Comment {index}" for index in range(7)), "Older"])
+        self.assertEqual(contents[-1], "Older")
+
+    def test_previous_pages(self):
+        first, second, *_ = self.get_pages("/api/comments/?page_size=3")
+        self.assertIsNone(first["previous"])
+
+        previous = self.client.get(second["previous"]).data
+        self.assertEqual(previous["results"], first["results"])
+        self.assertIsNone(previous["previous"])
+        self.assertEqual(self.client.get(previous["next"]).data["results"], second["results"])
+
+    def test_invalid_cursors_are_not_found(self):
+        for cursor in ("garbage", "cD1ub3QtYS1kYXRl", "cD0x"):
+            with self.subTest(cursor=cursor):
+                self.assertEqual(self.client.get(f"/api/comments/?cursor={cursor}").status_code, 404)
+
+
+@override_settings(TICKETING_SETTINGS={"LAST_PLACES_THRESHOLD": 5, "CLOSED_THRESHOLD": 0})
+class TicketingReservationTestCase(TestCase):
+    def setUp(self):
+        self.festival = Festival.objects.create(id="FEST_1", name="Festival", discipline="Musique")
+        self.ticketing = Ticketing.objects.create(name="pass", festival=self.festival, total_tickets=10)
+
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_superuser("admin", "admin@zhackathon.fr", "admin"))
+
+    def test_reserve_moves_status_through_thresholds(self):
+        response = self.client.post("/api/ticketings/pass/reserve/", {"quantity": 4})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["available_tickets"], 6)
+        self.assertEqual(response.data["status"], Ticketing.Status.OPEN)
+
+        response = self.client.post("/api/ticketings/pass/reserve/", {"quantity": 2})
+        self.assertEqual(response.data["available_tickets"], 4)
+        self.assertEqual(response.data["status"], Ticketing.Status.LAST_PLACES)
+
+        response = self.client.post("/api/ticketings/pass/reserve/", {"quantity": 4})
+        self.assertEqual(response.data["available_tickets"], 0)
+        self.assertEqual(response.data["status"], Ticketing.Status.CLOSED)
+
+    def test_reserve_more_than_available_is_refused(self):
+        response = self.client.post("/api/ticketings/pass/reserve/", {"quantity": 11})
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.data["available_tickets"], 10)
+
+        self.ticketing.reserve(10)
+        response = self.client.post("/api/ticketings/pass/reserve/", {"quantity": 1})
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.data["status"], Ticketing.Status.CLOSED)
+
+    def test_sold_out_ticketing_is_not_refilled_on_save(self):
+        self.ticketing.reserve(10)
+        self.ticketing.save()
+        self.ticketing.refresh_from_db()
+        self.assertEqual(self.ticketing.available_tickets, 0)
+
+
+class TicketingContentionTestCase(TransactionTestCase):
+    processes = 8
+    attempts = 250
+    total_tickets = 1500
+
+    def test_concurrent_reservations_never_oversell(self):
+        festival = Festival.objects.create(id="FEST_1", name="Festival", discipline="Musique")
+        Ticketing.objects.create(name="pass", festival=festival, total_tickets=self.total_tickets)
+        user = User.objects.create_superuser("admin", "admin@zhackathon.fr", "admin")
+
+        with tempfile.TemporaryDirectory() as directory:
+            database = os.path.join(directory, "contention.sqlite3")
+            connection.ensure_connection()
+            with closing(sqlite3.connect(database)) as copy:
+                connection.connection.backup(copy)
+
+            with multiprocessing.get_context("fork").Pool(self.processes) as pool:
+                results = pool.map(reserve_tickets, [(database, "pass", user.pk, self.attempts)] * self.processes)
+            with closing(sqlite3.connect(database)) as copy:
+                ticketing = copy.execute(
+                    "SELECT available_tickets, status FROM ticketing WHERE name = 'pass'"
+                ).fetchone()
+        statuses = [status for result in results for status in result]
+
+        self.assertEqual(statuses.count(200), self.total_tickets)
+        self.assertEqual(statuses.count(409), self.processes * self.attempts - self.total_tickets)
+        self.assertEqual(ticketing, (0, Ticketing.Status.CLOSED))
+
+
+class QueryBudgetTestCase(TestCase):
+    """
+    Runs every endpoint against a small and a larger dataset and fails when one exceeds the query budget declared by
+    its viewset, which also proves the number of queries does not grow with the page size.
+    """
+
+    def setUp(self):
+        caches[CACHE_ALIAS].clear()
+        self.admin = User.objects.create_superuser("admin", "admin@zhackathon.fr", "admin")
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def seed(self, size):
+        for index in range(size):
+            user = User.objects.create(username=f"user-{size}-{index}")
+            festival = Festival.objects.create(
+                id=f"FEST_{size}_{index}", name=f"Festival {index}", discipline="Musique", postcode="35000"
+            )
+            Ticketing.objects.create(name=f"pass-{size}-{index}", festival=festival, total_tickets=100)
+            Comment.objects.create(author=user, festival=festival, content="Great")
+            Comment.objects.create(author=user, festival=Festival.objects.get(pk=f"FEST_{size}_0"), content="Again")
+            Rating.objects.create(user=user, festival=festival, rating=index % 6)
+        return Festival.objects.get(pk=f"FEST_{size}_0")
+
+    @contextmanager
+    def assertQueryBudget(self, viewset, action):
+        with CaptureQueriesContext(connection) as context:
+            yield
+        queries = [
+            query["sql"] for query in context.captured_queries if not query["sql"].startswith(("SAVEPOINT", "RELEASE"))
+        ]
+        self.assertLessEqual(
+            len(queries),
+            viewset.query_budgets[action],
+            f"{viewset.__name__}.{action} exceeded its query budget:\n" + "\n".join(queries),
+        )
+
+    def test_every_action_declares_a_budget(self):
+        for _, viewset, _ in router.registry:
+            actions = {"list", "create", "retrieve", "update", "partial_update", "destroy"}
+            actions = {action for action in actions if hasattr(viewset, action)}
+            actions |= {action.__name__ for action in viewset.get_extra_actions()}
+            self.assertEqual(actions - viewset.query_budgets.keys(), set(), viewset.__name__)
+
+    def test_read_endpoints_stay_within_budget(self):
+        for size in (3, 40):
+            festival = self.seed(size)
+            comment = festival.comments.first()
+            # The festivals like the first one, which the admin rated, are recommended to the admin.
+            Rating.objects.create(user=self.admin, festival=festival, rating=5)
+            FestivalNeighbour.objects.bulk_create(
+                FestivalNeighbour(festival=festival, neighbour_id=f"FEST_{size}_{index}", similarity=1 / index)
+                for index in range(1, size)
+            )
+            caches[CACHE_ALIAS].clear()
+
+            reads = [
+                (views.FestivalViewSet, "list", "/api/festivals/?limit=50"),
+                (views.FestivalViewSet, "retrieve", f"/api/festivals/{festival.pk}/"),
+                (views.FestivalViewSet, "rating", f"/api/festivals/{festival.pk}/rating/"),
+                (views.FestivalViewSet, "comments", f"/api/festivals/{festival.pk}/comments/?page_size=50"),
+                (views.FestivalViewSet, "overview", f"/api/festivals/{festival.pk}/overview/?comments=50"),
+                (views.FestivalViewSet, "ticketings_stream", f"/api/festivals/{festival.pk}/ticketings/stream/"),
+                (views.FestivalViewSet, "facets", "/api/festivals/facets/?discipline=Musique"),
+                (views.FestivalViewSet, "search", "/api/festivals/search/?q=festival&limit=50"),
+                (views.FestivalViewSet, "nearby", "/api/festivals/nearby/?postcode=35000&limit=50"),
+                (views.FestivalViewSet, "top", "/api/festivals/top/?limit=50"),
+                (views.FestivalViewSet, "trending", "/api/festivals/trending/?limit=50"),
+                (views.FestivalViewSet, "similar", f"/api/festivals/{festival.pk}/similar/?limit=50"),
+                (views.UserViewSet, "recommendations", "/api/user/recommendations/?limit=50"),
+                (views.CommentViewSet, "list", f"/api/comments/?festival={festival.pk}&page_size=50"),
+                (views.CommentViewSet, "likes", f"/api/comments/{comment.pk}/likes/"),
+                (views.RatingViewSet, "list", "/api/ratings/?page_size=50"),
+                (views.CacheViewSet, "stats", "/api/cache/stats/"),
+                (views.ChangeViewSet, "list", "/api/changes/?since=1&limit=1000"),
+                (views.FestivalViewSet, "export", "/api/festivals/export/?discipline=Musique"),
+                (views.CommentViewSet, "export", f"/api/comments/export/?festival={festival.pk}&format=ndjson"),
+                (views.RatingViewSet, "export", "/api/ratings/export/"),
+            ]
+            for viewset, action, url in reads:
+                with self.subTest(size=size, url=url), self.assertQueryBudget(viewset, action):
+                    response = self.client.get(url)
+                    self.assertEqual(response.status_code, 200)
+                    # Exports and event streams run their query while their content streams.
+                    response.getvalue()
+                    if action in ("top", "trending", "similar", "recommendations"):
+                        # Enough festivals to expose a query per festival.
+                        self.assertGreaterEqual(len(response.json()), size - 1)
+
+    def test_write_endpoints_stay_within_budget(self):
+        festival = self.seed(3)
+        other = Festival.objects.get(pk="FEST_3_1")
+        comment = Comment.objects.create(author=self.admin, festival=festival, content="Mine")
+        rating = Rating.objects.create(user=self.admin, festival=other, rating=2)
+
+        writes = [
+            (views.FestivalViewSet, "create", "post", "/api/festivals/", {"name": "New", "discipline": "Cirque"}),
+            (views.FestivalViewSet, "update", "put", f"/api/festivals/{other.pk}/", {"name": "B", "discipline": "D"}),
+            (views.FestivalViewSet, "partial_update", "patch", f"/api/festivals/{other.pk}/", {"name": "Other"}),
+            (views.CommentViewSet, "create", "post", "/api/comments/", {"festival": festival.pk, "content": "Hi"}),
+            (views.CommentViewSet, "update", "put", f"/api/comments/{comment.pk}/", {"content": "Edited"}),
+            (views.CommentViewSet, "partial_update", "patch", f"/api/comments/{comment.pk}/", {"content": "Again"}),
+            (views.CommentViewSet, "like", "post", f"/api/comments/{comment.pk}/like/", None),
+            (views.CommentViewSet, "unlike", "delete", f"/api/comments/{comment.pk}/unlike/", None),
+            (views.CommentViewSet, "destroy", "delete", f"/api/comments/{comment.pk}/", None),
+            (views.RatingViewSet, "create", "post", "/api/ratings/", {"festival": festival.pk, "rating": 4}),
+            (views.RatingViewSet, "update", "put", f"/api/ratings/{rating.pk}/", {"festival": other.pk, "rating": 5}),
+            (views.RatingViewSet, "partial_update", "patch", f"/api/ratings/{rating.pk}/", {"rating": 1}),
+            (views.RatingViewSet, "destroy", "delete", f"/api/ratings/{rating.pk}/", None),
+            (views.TicketingViewSet, "reserve", "post", "/api/ticketings/pass-3-0/reserve/", {"quantity": 2}),
+            (views.FestivalViewSet, "destroy", "delete", f"/api/festivals/{festival.pk}/", None),
+            (views.UserViewSet, "logout", "delete", "/api/user/logout/", None),
+        ]
+        for viewset, action, method, url, data in writes:
+            with self.subTest(url=url, method=method), self.assertQueryBudget(viewset, action):
+                self.assertLess(getattr(self.client, method)(url, data).status_code, 300)
+
+        self.client.force_authenticate(None)
+        credentials = {"username": "newcomer", "email": "newcomer@zhackathon.fr"}
+        with self.assertQueryBudget(views.UserViewSet, "create"):
+            response = self.client.post(
+                "/api/user/", {**credentials, "password": "Zh4ckathon!", "password_confirmation": "Zh4ckathon!"}
+            )
+            self.assertEqual(response.status_code, 201)
+        with self.assertQueryBudget(views.UserViewSet, "login"):
+            response = self.client.put("/api/user/login/", {"username": "newcomer", "password": "Zh4ckathon!"})
+            self.assertEqual(response.status_code, 202)
+        self.client.logout()
+        with self.assertQueryBudget(views.UserViewSet, "token"):
+            response = self.client.post("/api/user/token/", {"username": "newcomer", "password": "Zh4ckathon!"})
+            self.assertEqual(response.status_code, 201)
+
+        self.client.force_authenticate(self.admin)
+        users = [{"username": f"batch-{index}", "email": f"batch-{index}@zhackathon.fr"} for index in range(50)]
+        with self.assertQueryBudget(views.UserViewSet, "batch"):
+            response = self.client.post("/api/user/batch/", {"users": users}, format="json")
+            self.assertEqual(response.status_code, 201)
+
+
+@override_settings(PASSWORD_HASHERS=["django.contrib.auth.hashers.MD5PasswordHasher"])
+class BenchmarkTestCase(TestCase):
+    def setUp(self):
+        caches[CACHE_ALIAS].clear()
+        self.dataset = benchmark.Dataset(seed=1)
+        self.dataset.generate(festivals=20, users=10, comments=100, likes=200, ratings=50, batch_size=64)
+
+    def test_every_routed_action_is_benchmarked(self):
+        self.assertEqual(benchmark.get_routed_actions(), benchmark.ENDPOINTS.keys())
+
+    def test_dataset_is_consistent(self):
+        self.assertEqual(Festival.objects.count(), 20)
+        self.assertEqual(Rating.objects.count(), sum(Festival.objects.values_list("rating_count", flat=True)))
+        for comment in Comment.objects.all():
+            self.assertEqual(comment.liked_by.count(), comment.like_count)
+        call_command("rebuild_rating_aggregates", check=True, stdout=StringIO())
+        call_command("rebuild_facets", check=True, stdout=StringIO())
+        self.assertEqual(len(search.search("festival", limit=100)), 20)
+
+    def test_run_reports_every_endpoint(self):
+        # Festivals created through the API all get the same empty id, so the second one breaks the test transaction.
+        names = benchmark.ENDPOINTS.keys() - {"festivals-create"}
+        report = {"endpoints": benchmark.Runner(warmup=1).run(self.dataset, names, requests=3)}
+
+        self.assertEqual(report["endpoints"].keys(), names)
+        for name, result in report["endpoints"].items():
+            self.assertEqual(result["requests"], 3, name)
+            self.assertLessEqual(result["latency_ms"]["p50"], result["latency_ms"]["p99"], name)
+        self.assertEqual(report["endpoints"]["festivals-retrieve"]["statuses"], {"200": 3})
+
+        self.assertEqual(benchmark.compare(report, report), [])
+        slower = json.loads(json.dumps(report))
+        slower["endpoints"]["festivals-list"]["latency_ms"]["p95"] += 100
+        slower["endpoints"]["comments-like"]["queries"]["max"] += 1
+        del slower["endpoints"]["cache-stats"]
+        self.assertEqual(len(benchmark.compare(slower, report)), 3)
+
+
+class MetricsTestCase(TestCase):
+    def setUp(self):
+        caches[CACHE_ALIAS].clear()
+        metrics.registry.reset()
+        Festival.objects.create(id="FEST_1", name="Festival", discipline="Musique")
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_superuser("admin", "admin@zhackathon.fr", "admin"))
+
+    def test_requests_are_recorded_by_route(self):
+        self.client.get("/api/festivals/")
+        self.client.get("/api/festivals/FEST_1/")
+        self.client.get("/api/festivals/missing/")
+
+        self.assertEqual(metrics.registry.requests[("festivals-detail", "GET", "200")], 1)
+        self.assertEqual(metrics.registry.requests[("festivals-detail", "GET", "404")], 1)
+        histogram = metrics.registry.queries[("festivals-list", "GET")]
+        self.assertEqual(sum(histogram.counts), 1)
+        self.assertEqual(histogram.sum, 2)
+        self.assertGreater(metrics.registry.phases[("festivals-list", "GET", "serializer")], 0)
+        self.assertGreater(metrics.registry.phases[("festivals-list", "GET", "render")], 0)
+        self.assertGreater(metrics.registry.sizes[("festivals-list", "GET")].sum, 0)
+
+    def test_metrics_endpoint_renders_prometheus_text(self):
+        self.client.get("/api/festivals/")
+        self.client.force_login(User.objects.get(username="admin"))
+        response = self.client.get("/metrics")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response["Content-Type"].startswith("text/plain; version=0.0.4"))
+        content = response.content.decode()
+        self.assertIn('zhackathon_requests_total{route="festivals-list",method="GET",status="200"} 1', content)
+        self.assertIn('zhackathon_request_queries_bucket{route="festivals-list",method="GET",le="+Inf"} 1', content)
+        self.assertIn("# TYPE zhackathon_request_duration_seconds histogram", content)
+
+    @override_settings(METRICS_SETTINGS={**settings.METRICS_SETTINGS, "TOKEN": "scraper"})
+    def test_metrics_endpoint_is_restricted_to_staff_and_scrapers(self):
+        client = APIClient()
+        self.assertEqual(client.get("/metrics").status_code, 403)
+        self.assertEqual(client.get("/metrics", HTTP_AUTHORIZATION="Bearer other").status_code, 403)
+        client.force_login(User.objects.create_user("user", "user@zhackathon.fr", "user"))
+        self.assertEqual(client.get("/metrics").status_code, 403)
+
+        self.assertEqual(APIClient().get("/metrics", HTTP_AUTHORIZATION="Bearer scraper").status_code, 200)
+
+    @override_settings(METRICS_SETTINGS={**settings.METRICS_SETTINGS, "SLOW_REQUEST_THRESHOLD": 0})
+    def test_slow_requests_log_their_sql(self):
+        with self.assertLogs("zhackathon.metrics", "WARNING") as logs:
+            self.client.get("/api/festivals/FEST_1/")
+
+        self.assertIn("GET /api/festivals/FEST_1/ (festivals-detail)", logs.output[0])
+        self.assertIn('FROM "festival"', logs.output[0])
+
+
+class SearchTestCase(TestCase):
+    def setUp(self):
+        Festival.objects.create(id="FEST_1", name="Nuits du jazz", discipline="Musique", commune="Rennes")
+        Festival.objects.create(id="FEST_2", name="Rencontres", discipline="Musique", description="Du jazz la nuit")
+        Festival.objects.create(id="FEST_3", name="Fête de la BD", discipline="Livre, littérature", commune="Angoulême")
+        Festival.objects.create(id="FEST_4", name="Jazz à Rennes", discipline="Musique", commune="Rennes")
+
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_superuser("admin", "admin@zhackathon.fr", "admin"))
+
+    def test_matches_are_ranked_by_field(self):
+        # Names weigh more than communes, which weigh more than descriptions.
+        self.assertEqual(search.search("jazz", limit=10)[2:], ["FEST_2"])
+        self.assertEqual(search.search("rennes", limit=10), ["FEST_4", "FEST_1"])
+        self.assertEqual(search.search("jazz nuit", limit=10), ["FEST_1", "FEST_2"])
+
+    def test_accents_and_case_are_folded(self):
+        for text in ("fete", "FÊTE", "angouleme", "fêt bd"):
+            with self.subTest(text=text):
+                self.assertEqual(search.search(text, limit=10), ["FEST_3"])
+        self.assertEqual(search.search('"*) OR (', limit=10), [])
+
+    def test_every_match_can_be_paged_to(self):
+        for index in range(25):
+            Festival.objects.create(id=f"FEST_B{index}", name=f"Blues {index}", discipline="Musique")
+
+        ids = []
+        for offset in range(0, 25, 10):
+            response = self.client.get(f"/api/festivals/search/?q=blues&limit=10&offset={offset}")
+            self.assertEqual(response.data["count"], 25)
+            ids += [festival["id"] for festival in response.data["results"]]
+        self.assertEqual(sorted(ids), sorted(f"FEST_B{index}" for index in range(25)))
+        self.assertEqual(self.client.get("/api/festivals/search/?q=").data["count"], 0)
+
+
+class NearbyTestCase(TestCase):
+    def setUp(self):
+        # Sequence numbers of the change log are reused once a test rolls back.
+        geo.festival_index.seq = None
+        Postcode.objects.create(code="35400", latitude=48.6493, longitude=-2.0257)
+        # Located from the department prefixes of the bundled reference file.
+        Festival.objects.create(id="FEST_RENNES", name="Rennes", discipline="Musique", postcode="35000")
+        Festival.objects.create(id="FEST_MALO", name="Saint-Malo", discipline="Musique", postcode="35400")
+        Festival.objects.create(id="FEST_PARIS", name="Paris", discipline="Musique", postcode="75001")
+        Festival.objects.create(id="FEST_NOWHERE", name="Nowhere", discipline="Musique")
+
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_superuser("admin", "admin@zhackathon.fr", "admin"))
+
+    def get_nearby(self, **parameters):
+        response = self.client.get("/api/festivals/nearby/", parameters)
+        self.assertEqual(response.status_code, 200)
+        return [(festival["id"], festival["distance_km"]) for festival in response.data["results"]]
+
+    def test_postcodes_fall_back_to_their_prefix(self):
+        rennes, malo = Festival.objects.get(pk="FEST_RENNES"), Festival.objects.get(pk="FEST_MALO")
+        self.assertEqual((rennes.latitude, rennes.longitude), (48.1173, -1.6778))
+        self.assertEqual((malo.latitude, malo.longitude), (48.6493, -2.0257))
+        self.assertEqual(Postcode.locate("35999"), (48.1173, -1.6778))
+        self.assertEqual(Postcode.locate("2A004"), (None, None))
+
+    def test_festivals_within_the_radius_closest_first(self):
+        distance = round(geo.haversine(48.1173, -1.6778, 48.6493, -2.0257), 3)
+        self.assertEqual(self.get_nearby(postcode="35000"), [("FEST_RENNES", 0)])
+        self.assertEqual(
+            self.get_nearby(postcode="35000", radius_km=100), [("FEST_RENNES", 0), ("FEST_MALO", distance)]
+        )
+        self.assertEqual(
+            self.get_nearby(postcode="35400", radius_km=500)[:2], [("FEST_MALO", 0), ("FEST_RENNES", distance)]
+        )
+        distance = round(geo.haversine(48.85, 2.35, 48.8566, 2.3522), 3)
+        self.assertEqual(self.get_nearby(latitude=48.85, longitude=2.35, radius_km=5), [("FEST_PARIS", distance)])
+        self.assertEqual(self.client.get("/api/festivals/nearby/?postcode=99999").status_code, 400)
+
+    def test_writes_of_other_processes_are_replayed(self):
+        self.assertEqual(self.get_nearby(postcode="75001"), [("FEST_PARIS", 0)])
+
+        # Bulk writes, as another worker would make them, only leave their changes in the log.
+        Festival.objects.filter(pk="FEST_NOWHERE").update(latitude=48.8566, longitude=2.3522)
+        Change.record(Festival, ["FEST_NOWHERE"])
+        self.assertEqual(self.get_nearby(postcode="75001"), [("FEST_NOWHERE", 0), ("FEST_PARIS", 0)])
+
+        # Once the tombstones it missed were compacted, the index is loaded again.
+        Festival.objects.filter(pk="FEST_NOWHERE").update(latitude=None, longitude=None)
+        ChangeHorizon.objects.create(pk=1, seq=Change.objects.latest("seq").seq + 1)
+        with self.assertNumQueries(5):
+            self.assertEqual(self.get_nearby(postcode="75001"), [("FEST_PARIS", 0)])
+
+
+class ImportFestivalsTestCase(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.records = [
+            {
+                "identifiant": f"FEST_{index}",
+                "nom_du_festival": f'Festival "{index}" [été], {{nuit}}',
+                "discipline_dominante": "Musique",
+                "code_postal_de_la_commune_principale_de_deroulement": "35000",
+            }
+            for index in range(5)
+        ]
+
+    def run_import(self, content, name="festivals.json", batch_size=2):
+        path = os.path.join(self.directory.name, name)
+        with open(path, "w", encoding="utf-8") as file:
+            file.write(content)
+        stdout = StringIO()
+        call_command("import_festivals", path, batch_size=batch_size, stdout=stdout)
+        counts = stdout.getvalue().strip().split(": ", 1)[1].split(", ")
+        return {name: int(count) for count, name in (count.split(" ", 1) for count in counts)}
+
+    def test_json_array_is_parsed_across_chunk_boundaries(self):
+        content = json.dumps(self.records, indent=2, ensure_ascii=False)
+        for chunk_size in (1, 2, 3, 7, 64):
+            with self.subTest(chunk_size=chunk_size):
+                items = list(import_festivals.iter_json_array(StringIO(content), chunk_size=chunk_size))
+                self.assertEqual(items, self.records)
+        self.assertEqual(list(import_festivals.iter_json_array(StringIO(" [ ] "), chunk_size=1)), [])
+
+        with self.assertRaises(CommandError):
+            list(import_festivals.iter_json_array(StringIO('[{"a": 1}, {"b": '), chunk_size=4))
+
+    def test_counts_and_unchanged_rows(self):
+        records = [self.records[0], *self.records, {"identifiant": "FEST_X"}]
+        records[2] = {**records[2], "code_postal_de_la_commune_principale_de_deroulement": "35"}
+        counts = self.run_import(json.dumps(records))
+        self.assertEqual(
+            counts,
+            {"inserted": 5, "updated": 0, "unchanged": 0, "duplicates": 1, "skipped": 1, "invalid postcodes": 1},
+        )
+        self.assertEqual(Festival.objects.get(pk="FEST_0").name, self.records[0]["nom_du_festival"])
+        self.assertIsNone(Festival.objects.get(pk="FEST_1").postcode)
+        self.assertEqual(Festival.objects.get(pk="FEST_2").latitude, 48.1173)
+
+        records = [
+            {**record, "discipline_dominante": "Cirque"} if index == 3 else record
+            for index, record in enumerate(self.records)
+        ]
+        counts = self.run_import("\n".join(map(json.dumps, records)) + "\n\n", name="festivals.ndjson", batch_size=10)
+        # The postcode of FEST_1 is now valid, and the discipline of FEST_3 changed.
+        self.assertEqual((counts["inserted"], counts["updated"], counts["unchanged"]), (0, 2, 3))
+        self.assertEqual(Festival.objects.get(pk="FEST_1").postcode, "35000")
+        self.assertEqual(Festival.objects.get(pk="FEST_3").discipline, "Cirque")
+        self.assertEqual(Change.objects.filter(object_id="FEST_3").count(), 2)
+        self.assertEqual(Change.objects.filter(object_id="FEST_4").count(), 1)
+        call_command("rebuild_facets", check=True, stdout=StringIO())
+
+    def test_descriptions(self):
+        self.run_import(json.dumps(self.records))
+        Festival.objects.filter(pk="FEST_0").update(description="Edited")
+        fixture = [
+            {
+                "model": "zhackathon.festival",
+                "pk": "FEST_1",
+                "fields": {"name": "One", "discipline": "Jazz", "description": "Jazz"},
+            }
+        ]
+
+        counts = self.run_import(json.dumps([{**self.records[0], "discipline_dominante": "Cirque"}, *fixture]))
+        self.assertEqual(counts["updated"], 2)
+        self.assertEqual(Festival.objects.get(pk="FEST_0").description, "Edited")
+        self.assertEqual(Festival.objects.get(pk="FEST_1").description, "Jazz")
+        self.assertEqual(search.search("jazz", limit=10), ["FEST_1"])
+        self.assertEqual(search.search("edited", limit=10), ["FEST_0"])
+
+
+@override_settings(ALLOWED_HOSTS=["testserver", "a.example", "b.example"])
+class ResponseCacheTestCase(TestCase):
+    def setUp(self):
+        caches[CACHE_ALIAS].clear()
+        self.festival = Festival.objects.create(id="FEST_1", name="Festival", discipline="Musique")
+        Festival.objects.create(id="FEST_2", name="Other", discipline="Cirque")
+        self.admin = User.objects.create_superuser("admin", "admin@zhackathon.fr", "admin")
+
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def test_hits_and_conditional_requests(self):
+        first = self.client.get("/api/festivals/FEST_1/")
+        self.assertEqual(first["X-Cache"], "MISS")
+        second = self.client.get("/api/festivals/FEST_1/")
+        self.assertEqual(second["X-Cache"], "HIT")
+        self.assertEqual((second.content, second["ETag"]), (first.content, first["ETag"]))
+
+        response = self.client.get("/api/festivals/FEST_1/", HTTP_IF_NONE_MATCH=first["ETag"])
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b"")
+        response = self.client.get("/api/festivals/FEST_1/", HTTP_IF_NONE_MATCH='"stale"')
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get("/api/festivals/FEST_1/", HTTP_IF_MODIFIED_SINCE=first["Last-Modified"])
+        self.assertEqual(response.status_code, 304)
+
+        self.assertEqual(self.client.get("/api/festivals/missing/").status_code, 404)
+        self.assertNotIn("X-Cache", self.client.get("/api/festivals/missing/"))
+
+    def test_rebuilt_rating_aggregates_invalidate_the_festivals(self):
+        Rating.objects.create(user=self.admin, festival=self.festival, rating=4)
+        # Drifted aggregates, as rebuild_rating_aggregates fixes them.
+        Festival.objects.filter(pk="FEST_1").update(rating_count=2, rating_sum=9, average_rating=4.5)
+        drifted = self.client.get("/api/festivals/FEST_1/")
+        self.assertEqual(drifted.json()["rating_count"], 2)
+        self.assertEqual(self.client.get("/api/festivals/")["X-Cache"], "MISS")
+        self.assertEqual(self.client.get("/api/festivals/")["X-Cache"], "HIT")
+
+        call_command("rebuild_rating_aggregates", stdout=StringIO())
+
+        response = self.client.get("/api/festivals/FEST_1/")
+        self.assertEqual(response["X-Cache"], "MISS")
+        self.assertNotEqual(response["ETag"], drifted["ETag"])
+        self.assertEqual(response.json()["rating_count"], 1)
+        self.assertEqual(self.client.get("/api/festivals/")["X-Cache"], "MISS")
+
+    def test_writes_invalidate_their_namespaces(self):
+        etag = self.client.get("/api/festivals/FEST_1/")["ETag"]
+        self.client.get("/api/festivals/FEST_2/")
+        self.client.get("/api/festivals/")
+        self.client.get("/api/festivals/FEST_1/comments/")
+
+        self.client.patch("/api/festivals/FEST_1/", {"name": "Renamed"})
+        response = self.client.get("/api/festivals/FEST_1/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual((response.status_code, response["X-Cache"]), (200, "MISS"))
+        self.assertEqual(response.json()["name"], "Renamed")
+        self.assertEqual(self.client.get("/api/festivals/")["X-Cache"], "MISS")
+        self.assertEqual(self.client.get("/api/festivals/FEST_2/")["X-Cache"], "HIT")
+        self.assertEqual(self.client.get("/api/festivals/FEST_1/comments/")["X-Cache"], "HIT")
+
+        Comment.objects.create(festival=self.festival, author=self.admin, content="New")
+        self.assertEqual(self.client.get("/api/festivals/FEST_1/comments/")["X-Cache"], "MISS")
+        self.client.post("/api/ratings/", {"festival": "FEST_2", "rating": 4})
+        response = self.client.get("/api/festivals/FEST_2/")
+        self.assertEqual((response["X-Cache"], response.json()["average_rating"]), ("MISS", 4))
+
+    def test_links_keep_the_host_of_the_request(self):
+        for host in ("a.example", "b.example", "a.example"):
+            response = self.client.get("/api/festivals/?limit=1", HTTP_HOST=host)
+            self.assertEqual(response.json()["next"], f"http://{host}/api/festivals/?limit=1&offset=1")
+        self.assertEqual(response["X-Cache"], "HIT")
+        response = self.client.get("/api/festivals/?limit=1", HTTP_HOST="a.example", secure=True)
+        self.assertEqual(response.json()["next"], "https://a.example/api/festivals/?limit=1&offset=1")
+
+
+class FacetTestCase(TestCase):
+    def setUp(self):
+        caches[CACHE_ALIAS].clear()
+        Festival.objects.create(id="FEST_1", name="One", discipline="Musique", region="Bretagne")
+        Festival.objects.create(id="FEST_2", name="Two", discipline="Cirque", region="Bretagne")
+
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_superuser("admin", "admin@zhackathon.fr", "admin"))
+
+    def assertFacets(self, **expected):
+        counts = FestivalFacet.get_counts()
+        for dimension, values in expected.items():
+            self.assertEqual({row["value"]: row["count"] for row in counts[dimension]}, values, dimension)
+        call_command("rebuild_facets", check=True, stdout=StringIO())
+
+    def test_counts_follow_writes(self):
+        self.assertFacets(region={"Bretagne": 2}, discipline={"Musique": 1, "Cirque": 1})
+
+        with CaptureQueriesContext(connection) as context:
+            self.client.patch("/api/festivals/FEST_1/", {"region": "Occitanie", "discipline": "Cirque"})
+        # The facets of the festival are those loaded by the view, not read once more.
+        self.assertEqual(len([query for query in context if 'SELECT "festival"."region"' in query["sql"]]), 0)
+        self.assertFacets(region={"Bretagne": 1, "Occitanie": 1}, discipline={"Cirque": 2})
+
+        festival = Festival.objects.only("id", "name").get(pk="FEST_2")
+        festival.region = "Occitanie"
+        festival.save()
+        self.assertFacets(region={"Occitanie": 2}, discipline={"Cirque": 2})
+        festival.discipline = "Théâtre"
+        festival.save()
+        self.assertFacets(region={"Occitanie": 2}, discipline={"Cirque": 1, "Théâtre": 1})
+
+        self.client.delete("/api/festivals/FEST_1/")
+        self.assertFacets(region={"Occitanie": 1}, discipline={"Théâtre": 1})
+
+    def test_fixtures_overwriting_festivals(self):
+        path = os.path.join(tempfile.mkdtemp(), "festivals.json")
+        self.addCleanup(os.remove, path)
+        with open(path, "w", encoding="utf-8") as file:
+            json.dump(
+                [
+                    {"model": "zhackathon.festival", "pk": "FEST_1", "fields": {"name": "One", "discipline": "Danse"}},
+                    {
+                        "model": "zhackathon.festival",
+                        "pk": "FEST_3",
+                        "fields": {"name": "Three", "discipline": "Danse"},
+                    },
+                ],
+                file,
+            )
+        call_command("loaddata", path, verbosity=0)
+        self.assertFacets(region={"Bretagne": 1, None: 2}, discipline={"Danse": 2, "Cirque": 1})
+
+    def test_check_reports_drift(self):
+        FestivalFacet.objects.filter(region="Bretagne", discipline="Cirque").update(count=5)
+        with self.assertRaisesMessage(CommandError, "1 facet combination(s) drifted"):
+            call_command("rebuild_facets", check=True, stdout=StringIO())
+
+        call_command("rebuild_facets", stdout=StringIO())
+        self.assertFacets(region={"Bretagne": 2})
+
+
+class AsyncReadPathTestCase(TestCase):
+    def setUp(self):
+        caches[CACHE_ALIAS].clear()
+        festival = Festival.objects.create(id="FEST_1", name="Festival", discipline="Musique")
+        admin = User.objects.create_superuser("admin", "admin@zhackathon.fr", "admin")
+        self.comment = Comment.objects.create(festival=festival, author=admin, content="Great")
+        self.comment.like(admin)
+        Rating.objects.create(festival=festival, user=admin, rating=4)
+
+        self.client = APIClient()
+        self.client.force_login(admin)
+        self.async_client.force_login(admin)
+
+    def test_read_actions_are_served_by_async_views(self):
+        for path in ("/api/festivals/", "/api/festivals/FEST_1/", "/api/comments/", "/api/comments/1/likes/"):
+            self.assertTrue(asyncio.iscoroutinefunction(resolve(path, urlconf=middleware.ASYNC_URLCONF).func))
+        self.assertFalse(
+            asyncio.iscoroutinefunction(resolve("/api/festivals/facets/", urlconf=middleware.ASYNC_URLCONF).func)
+        )
+
+    async def test_async_responses_match_sync_responses(self):
+        twins = {
+            "/api/festivals/": "FestivalViewSet.alist",
+            "/api/festivals/?limit=1&offset=1": "FestivalViewSet.alist",
+            "/api/festivals/FEST_1/": "FestivalViewSet.aretrieve",
+            "/api/festivals/missing/": "FestivalViewSet.aretrieve",
+            "/api/festivals/FEST_1/rating/": "FestivalViewSet.arating",
+            "/api/festivals/FEST_1/comments/": "FestivalViewSet.acomments",
+            "/api/festivals/facets/": None,
+            "/api/comments/": "CommentViewSet.alist",
+            f"/api/comments/{self.comment.pk}/likes/": "CommentViewSet.alikes",
+        }
+        served = []
+
+        def spy(cls, name):
+            twin = getattr(cls, name)
+
+            async def wrapper(self, request, *args, **kwargs):
+                served.append(f"{cls.__name__}.{name}")
+                return await twin(self, request, *args, **kwargs)
+
+            return mock.patch.object(cls, name, wrapper)
+
+        with ExitStack() as stack:
+            for twin in set(twins.values()) - {None}:
+                stack.enter_context(spy(getattr(views, twin.split(".")[0]), twin.split(".")[1]))
+
+            for path, twin in twins.items():
+                with self.subTest(path=path):
+                    expected = await sync_to_async(self.client.get)(path)
+                    # Otherwise the async view would serve the response cached by the sync one.
+                    await sync_to_async(caches[CACHE_ALIAS].clear)()
+                    served.clear()
+                    response = await self.async_client.get(path)
+
+                    self.assertEqual(served, [twin] if twin else [])
+                    self.assertEqual(response.status_code, expected.status_code)
+                    self.assertEqual(response.content, expected.content)
+                    self.assertEqual(response.get("X-Cache"), expected.get("X-Cache"))
+
+    async def test_writes_fall_through_to_sync_views(self):
+        response = await self.async_client.delete(f"/api/comments/{self.comment.pk}/unlike/")
+
+        self.assertEqual(response.status_code, 204)
+        response = await self.async_client.get(f"/api/comments/{self.comment.pk}/likes/")
+        self.assertEqual(json.loads(response.content), {"total": 0})
+
+
+class RowSerializerTestCase(TestCase):
+    def setUp(self):
+        caches[CACHE_ALIAS].clear()
+        admin = User.objects.create_superuser("admin", "admin@zhackathon.fr", "admin")
+        for index in range(5):
+            Festival.objects.create(
+                id=f"FEST_{index}",
+                name=f"Fête n°{index} \u2028",
+                discipline="Musique",
+                website=f"https://festival{index}.fr" if index % 2 else None,
+                region="Bretagne",
+                postcode="29000",
+            )
+            Comment.objects.create(festival_id="FEST_0", author=admin, content=f"Génial \u2029 {index}")
+        Rating.objects.create(festival_id="FEST_0", user=admin, rating=4)
+
+        self.client = APIClient()
+        self.client.force_authenticate(admin)
+
+    def get_both(self, path):
+        caches[CACHE_ALIAS].clear()
+        rows = self.client.get(path)
+        caches[CACHE_ALIAS].clear()
+        with mock.patch.object(views.FestivalViewSet, "values_actions", ()), mock.patch.object(
+            views.CommentViewSet, "values_actions", ()
+        ):
+            instances = self.client.get(path)
+        return rows, instances
+
+    def test_values_rows_render_like_model_instances(self):
+        paths = [
+            "/api/festivals/",
+            "/api/festivals/?limit=2&offset=1",
+            "/api/festivals/?ordering=-average_rating&region=Bretagne",
+            "/api/comments/",
+            "/api/comments/?page_size=2&ordering=updated_at",
+        ]
+        for path in paths:
+            with self.subTest(path=path):
+                rows, instances = self.get_both(path)
+                self.assertEqual(rows.status_code, 200)
+                self.assertEqual(rows.content, instances.content)
+
+    def test_cursors_of_values_rows_match(self):
+        rows, instances = self.get_both("/api/comments/?page_size=2")
+        self.assertEqual(rows.json()["next"], instances.json()["next"])
+
+        rows, instances = self.get_both(rows.json()["next"])
+        self.assertEqual(rows.content, instances.content)
+
+    def test_converter_only_accepts_model_columns(self):
+        columns, convert = serializers.RowListSerializer.get_converter(serializers.CommentDetailSerializer)
+
+        self.assertEqual(columns, ("festival_id", "content"))
+        self.assertEqual(convert({"festival_id": "FEST_0", "content": None}), {"festival": "FEST_0", "content": None})
+        with self.assertRaises(ImproperlyConfigured):
+            serializers.RowListSerializer.get_converter(serializers.NearbyFestivalSerializer)
+
+    def test_renderer_matches_drf_renderer(self):
+        data = {"name": "Fête \u2028\u2029", "average": 4.5, "missing": None, "items": [1, "2"]}
+        for media_type in ("application/json", "application/json; indent=4"):
+            with self.subTest(media_type=media_type):
+                self.assertEqual(
+                    renderers.JSONRenderer().render(data, media_type, {}),
+                    JSONRenderer().render(data, media_type, {}),
+                )
+        with self.assertRaises(ValueError):
+            renderers.JSONRenderer().render({"average": float("nan")}, "application/json", {})
+
+
+class AuditQueriesTestCase(TestCase):
+    def setUp(self):
+        caches[CACHE_ALIAS].clear()
+        benchmark.Dataset(seed=1).generate(festivals=20, users=10, comments=100, likes=20, ratings=50, batch_size=64)
+
+    def test_every_endpoint_is_served_by_indexes(self):
+        stdout = StringIO()
+        call_command("audit_queries", verbosity=2, stdout=stdout)
+
+        output = stdout.getvalue()
+        self.assertIn("comments-list GET /api/comments/?festival=", output)
+        self.assertIn("SEARCH comment USING INDEX comment_festival_created_idx", output)
+        self.assertIn("SEARCH rating USING INDEX rating_festival_rating_idx", output)
+        self.assertIn("SEARCH festival USING INDEX festival_region_top_idx", output)
+        self.assertIn("festivals-trending GET /api/festivals/trending/?region=", output)
+
+    def test_findings(self):
+        self.assertEqual(audit_queries.get_findings('SELECT * FROM "festival" LIMIT 10', ["SCAN festival"]), [])
+        self.assertEqual(
+            audit_queries.get_findings('SELECT * FROM "festival" WHERE "region" = 1', ["SCAN festival"]),
+            ["full scan of festival"],
+        )
+        self.assertEqual(
+            audit_queries.get_findings(
+                'SELECT * FROM "comment" WHERE "festival_id" = 1 ORDER BY "created_at" LIMIT 10',
+                ["SEARCH comment USING INDEX comment_festival_id (festival_id=?)", "USE TEMP B-TREE FOR ORDER BY"],
+            ),
+            ["temp B-tree for ORDER BY"],
+        )
+        self.assertEqual(
+            audit_queries.get_findings(
+                'SELECT "region", COUNT("id") FROM "festival" WHERE "average_rating" > 1 GROUP BY "region" ORDER BY 2',
+                [
+                    "SEARCH festival USING INDEX festival_average_rating (average_rating>?)",
+                    "USE TEMP B-TREE FOR ORDER BY",
+                ],
+            ),
+            [],
+        )
+
+
+@override_settings(DATABASE_ROUTING={"REPLICAS": ["replica"], "MAX_REPLICATION_LAG": 5})
+class DatabaseRoutingTestCase(TransactionTestCase):
+    # The replica mirrors the test database, and only sees the rows committed by a TransactionTestCase.
+    databases = {"default", "replica"}
+
+    def setUp(self):
+        caches[CACHE_ALIAS].clear()
+        festival = Festival.objects.create(id="FEST_1", name="Festival", discipline="Musique")
+        self.admin = User.objects.create_superuser("admin", "admin@zhackathon.fr", "admin")
+        self.comment = Comment.objects.create(festival=festival, author=self.admin, content="Super")
+
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+        self.cancel_delayed_invalidations()
+        self.addCleanup(self.cancel_delayed_invalidations)
+
+    @staticmethod
+    def cancel_delayed_invalidations():
+        with response_cache.lock:
+            if response_cache.timer is not None:
+                response_cache.timer.cancel()
+            response_cache.timer = None
+            response_cache.delayed.clear()
+
+    @contextmanager
+    def assertReadsFrom(self, alias):
+        other = "default" if alias == "replica" else "replica"
+        with CaptureQueriesContext(connections[alias]) as used, CaptureQueriesContext(connections[other]) as unused:
+            yield
+        self.assertTrue(used.captured_queries)
+        self.assertEqual(unused.captured_queries, [])
+
+    def test_router(self):
+        router = routers.ReplicaRouter()
+        self.assertEqual(router.db_for_read(Festival), "default")
+        self.assertEqual(router.db_for_write(Festival), "default")
+        self.assertFalse(router.allow_migrate("replica", "zhackathon"))
+
+        token = routers.replicas_allowed.set(True)
+        try:
+            self.assertEqual(router.db_for_read(Festival), "replica")
+            with transaction.atomic():
+                self.assertEqual(router.db_for_read(Festival), "default")
+            with override_settings(DATABASE_ROUTING={"REPLICAS": [], "MAX_REPLICATION_LAG": 5}):
+                self.assertEqual(router.db_for_read(Festival), "default")
+        finally:
+            routers.replicas_allowed.reset(token)
+
+    def test_safe_requests_read_from_replicas(self):
+        with self.assertReadsFrom("replica"):
+            self.assertEqual(self.client.get("/api/festivals/FEST_1/").status_code, 200)
+        with self.assertReadsFrom("replica"):
+            self.assertEqual(self.client.get(f"/api/comments/{self.comment.pk}/likes/").status_code, 200)
+
+    def test_writers_are_pinned_to_the_primary(self):
+        with CaptureQueriesContext(connections["replica"]) as context:
+            response = self.client.post(f"/api/comments/{self.comment.pk}/like/")
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(context.captured_queries, [])
+        self.assertEqual(response.cookies[middleware.PRIMARY_COOKIE]["max-age"], 5)
+
+        with self.assertReadsFrom("default"):
+            self.assertEqual(self.client.get(f"/api/comments/{self.comment.pk}/likes/").json(), {"total": 1})
+
+        # Once the cookie expired.
+        del self.client.cookies[middleware.PRIMARY_COOKIE]
+        with self.assertReadsFrom("replica"):
+            self.client.get(f"/api/comments/{self.comment.pk}/likes/")
+
+    def test_failed_writes_do_not_pin(self):
+        response = self.client.post("/api/comments/0/like/")
+        self.assertEqual(response.status_code, 404)
+        self.assertNotIn(middleware.PRIMARY_COOKIE, response.cookies)
+
+    def test_cache_is_invalidated_once_replicas_caught_up(self):
+        with mock.patch.object(response_cache, "invalidate_later") as invalidate_later:
+            Comment.objects.create(festival_id="FEST_1", author=self.admin, content="Génial")
+        invalidate_later.assert_called_once_with(("comments:FEST_1",), 5)
+
+        versions = response_cache.get_versions(["festival:FEST_1", "festivals"])
+        response_cache.invalidate_later(["festival:FEST_1"], 0.01)
+        response_cache.invalidate_later(["festival:FEST_1"], 0.02)
+        response_cache.invalidate_later(["festivals"], 60)
+        time.sleep(0.1)
+        new_versions = response_cache.get_versions(["festival:FEST_1", "festivals"])
+        self.assertNotEqual(new_versions[0], versions[0])
+        self.assertEqual(new_versions[1], versions[1])
+        self.assertEqual(response_cache.delayed.keys(), {"festivals"})
+
+
+@override_settings(LIKE_SETTINGS={"WRITE_BEHIND": True, "FLUSH_INTERVAL": 1, "FLUSH_SIZE": 500})
+class LikeBufferTestCase(TestCase):
+    def setUp(self):
+        festival = Festival.objects.create(id="FEST_1", name="Festival", discipline="Musique")
+        self.admin = User.objects.create_superuser("admin", "admin@zhackathon.fr", "admin")
+        self.users = [User.objects.create(username=f"user-{index}") for index in range(3)]
+        self.comment = Comment.objects.create(festival=festival, author=self.admin, content="Super")
+
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+        # The background thread would write from a connection of its own, outside of the test transaction.
+        patcher = mock.patch.object(like_buffer, "start")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        like_buffer.pending, like_buffer.flushing = {}, {}
+        like_buffer.deltas.clear()
+
+    def get_stored_likes(self):
+        self.comment.refresh_from_db()
+        return self.comment.like_count, set(self.comment.liked_by.values_list("pk", flat=True))
+
+    def test_reads_merge_pending_likes(self):
+        # The comment, and whether the user already liked it.
+        with self.assertNumQueries(2):
+            response = self.client.post(f"/api/comments/{self.comment.pk}/like/")
+        self.assertEqual(response.data, {"total": 1})
+        for user in self.users:
+            self.comment.like(user)
+        self.comment.unlike(self.users[0])
+
+        self.assertEqual(self.get_stored_likes(), (0, set()))
+        self.assertEqual(self.client.get(f"/api/comments/{self.comment.pk}/likes/").data, {"total": 3})
+
+        self.assertEqual(like_buffer.flush(), 3)
+        self.assertEqual(self.get_stored_likes(), (3, {self.admin.pk, self.users[1].pk, self.users[2].pk}))
+        self.assertEqual(self.client.get(f"/api/comments/{self.comment.pk}/likes/").data, {"total": 3})
+
+    def test_intents_are_coalesced(self):
+        self.comment.liked_by.add(self.users[0])
+        self.comment.like_count = 1
+        self.comment.save()
+
+        # Liking twice counts once, and unliking cancels a pending like out.
+        self.comment.like(self.users[1])
+        self.comment.like(self.users[1])
+        self.comment.like(self.users[2])
+        self.comment.unlike(self.users[2])
+        self.comment.like(self.users[0])
+        self.comment.unlike(self.users[0])
+        self.comment.unlike(self.users[0])
+        self.assertEqual(
+            like_buffer.pending, {(self.comment.pk, self.users[1].pk): True, (self.comment.pk, self.users[0].pk): False}
+        )
+        self.assertEqual(self.comment.get_total_likes(), 1)
+
+        # The comments and users still existing, the likes, the unlikes, the counts and the trending score of the
+        # festival, within a savepoint.
+        with self.assertNumQueries(8):
+            self.assertEqual(like_buffer.flush(), 2)
+        self.assertEqual(self.get_stored_likes(), (1, {self.users[1].pk}))
+        self.assertEqual(like_buffer.deltas, {})
+
+    def test_failed_flush_keeps_intents(self):
+        self.comment.like(self.users[0])
+        self.comment.like(self.users[1])
+        with mock.patch.object(like_buffer, "write", side_effect=DatabaseError("database is locked")):
+            with self.assertLogs("zhackathon.likes", "ERROR"):
+                self.assertEqual(like_buffer.flush(), 0)
+        self.assertEqual(self.comment.get_total_likes(), 2)
+
+        # An unlike received in the meantime still cancels the like out.
+        self.comment.unlike(self.users[1])
+        self.assertEqual(like_buffer.flush(), 1)
+        self.assertEqual(self.get_stored_likes(), (1, {self.users[0].pk}))
+
+    def test_unexpected_errors_keep_intents(self):
+        self.comment.like(self.users[0])
+        with mock.patch.object(like_buffer, "write", side_effect=ValueError("unexpected")):
+            with self.assertLogs("zhackathon.likes", "ERROR"):
+                self.assertEqual(like_buffer.flush(), 0)
+
+        self.assertEqual(like_buffer.pending, {(self.comment.pk, self.users[0].pk): True})
+        self.assertEqual(like_buffer.flush(), 1)
+
+    @override_settings(LIKE_SETTINGS={"WRITE_BEHIND": True, "FLUSH_INTERVAL": 0, "FLUSH_SIZE": 500})
+    def test_failed_flushes_do_not_stop_the_thread(self):
+        flushes = []
+
+        def flush():
+            flushes.append(len(flushes))
+            if len(flushes) == 1:
+                raise RuntimeError("unexpected")
+            like_buffer.stopping.set()
+            return 0
+
+        self.addCleanup(like_buffer.stopping.clear)
+        with mock.patch.object(like_buffer, "flush", side_effect=flush), self.assertLogs("zhackathon.likes", "ERROR"):
+            thread = like_buffer.thread = threading.Thread(target=like_buffer.run)
+            thread.start()
+            thread.join(5)
+
+        self.assertEqual(flushes, [0, 1])
+        # Stopped on its own, it can be started again.
+        self.assertIsNone(like_buffer.thread)
+
+    def test_stop_writes_buffered_intents(self):
+        self.comment.like(self.users[0])
+        like_buffer.stop()
+        self.assertEqual(self.get_stored_likes(), (1, {self.users[0].pk}))
+        self.assertEqual(like_buffer.pending, {})
+
+
+@override_settings(
+    LEADERBOARD_SETTINGS={
+        "PRIOR_MEAN": 3,
+        "PRIOR_WEIGHT": 10,
+        "TRENDING_HALF_LIFE": 24,
+        "TRENDING_WEIGHTS": {"comment": 1, "like": 0.5, "rating": 2},
+    }
+)
+class LeaderboardTestCase(TestCase):
+    def setUp(self):
+        caches[CACHE_ALIAS].clear()
+        self.festivals = [
+            Festival.objects.create(id=f"FEST_{index}", name=f"Festival {index}", discipline=discipline, region=region)
+            for index, (discipline, region) in enumerate(
+                [("Musique", "Bretagne"), ("Musique", "Occitanie"), ("Cirque", "Bretagne"), ("Cirque", "Bretagne")]
+            )
+        ]
+        self.admin = User.objects.create_superuser("admin", "admin@zhackathon.fr", "admin")
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def get_ranking(self, path):
+        return [(festival["id"], round(festival["score"], 3)) for festival in self.client.get(path).json()]
+
+    def test_top_ranks_by_bayesian_average(self):
+        users = [User.objects.create(username=f"user-{index}") for index in range(40)]
+        # A single 5 does not outrank many 4s and 5s.
+        first = Rating.objects.create(user=users[0], festival_id="FEST_0", rating=5)
+        for user, rating in zip(users, [5, 4] * 20):
+            Rating.objects.create(user=user, festival_id="FEST_1", rating=rating)
+        for user, rating in zip(users, [1, 2]):
+            Rating.objects.create(user=user, festival_id="FEST_2", rating=rating)
+
+        self.assertEqual(
+            self.get_ranking("/api/festivals/top/"), [("FEST_1", 4.2), ("FEST_0", 3.182), ("FEST_2", 2.75)]
+        )
+        self.assertEqual(self.get_ranking("/api/festivals/top/?region=Bretagne&limit=1"), [("FEST_0", 3.182)])
+        self.assertEqual(self.get_ranking("/api/festivals/top/?discipline=Cirque"), [("FEST_2", 2.75)])
+        self.assertEqual(self.client.get("/api/festivals/top/?limit=0").status_code, 400)
+
+        first.delete()
+        with self.assertNumQueries(1):
+            self.assertEqual(self.get_ranking("/api/festivals/top/?region=Bretagne"), [("FEST_2", 2.75)])
+
+    def test_trending_decays_activity(self):
+        now = timezone.now()
+        Festival.record_activity({"FEST_0": 1}, "comment", now)
+        Festival.record_activity({"FEST_1": 3, "FEST_3": 1}, "rating", now - timedelta(hours=48))
+        Festival.record_activity({"FEST_3": 1}, "like", now - timedelta(hours=24))
+
+        with mock.patch("django.utils.timezone.now", return_value=now):
+            self.assertEqual(
+                self.get_ranking("/api/festivals/trending/"), [("FEST_1", 1.5), ("FEST_0", 1.0), ("FEST_3", 0.75)]
+            )
+            self.assertEqual(
+                self.get_ranking("/api/festivals/trending/?region=Bretagne"), [("FEST_0", 1.0), ("FEST_3", 0.75)]
+            )
+
+        # A day later, the activity of each festival counts half as much.
+        with mock.patch("django.utils.timezone.now", return_value=now + timedelta(hours=24)):
+            self.assertEqual(self.get_ranking("/api/festivals/trending/?limit=2"), [("FEST_1", 0.75), ("FEST_0", 0.5)])
+
+    def test_activity_is_recorded(self):
+        self.client.post("/api/comments/", {"festival": "FEST_0", "content": "Super"})
+        self.client.post("/api/ratings/", {"festival": "FEST_2", "rating": 4})
+        comment = Comment.objects.create(festival=self.festivals[3], author=self.admin, content="Super")
+        self.client.post(f"/api/comments/{comment.pk}/like/")
+
+        self.assertEqual(
+            self.get_ranking("/api/festivals/trending/"), [("FEST_2", 2.0), ("FEST_3", 1.5), ("FEST_0", 1.0)]
+        )
+        self.assertEqual(self.get_ranking("/api/festivals/top/"), [("FEST_2", 3.091)])
+
+
+class RecommendationTestCase(TestCase):
+    ratings = {
+        "alice": {"FEST_A": 5, "FEST_B": 5, "FEST_C": 1},
+        "bob": {"FEST_A": 4, "FEST_B": 5, "FEST_C": 2},
+        "carol": {"FEST_A": 5, "FEST_B": 4, "FEST_C": 1, "FEST_D": 3},
+        "dave": {"FEST_A": 1, "FEST_B": 2, "FEST_C": 5},
+        "erin": {"FEST_A": 5},
+    }
+
+    def setUp(self):
+        caches[CACHE_ALIAS].clear()
+        for name in "ABCDE":
+            Festival.objects.create(id=f"FEST_{name}", name=f"Festival {name}", discipline="Musique", region="Bretagne")
+        self.users = {username: User.objects.create(username=username) for username in self.ratings}
+        Rating.objects.bulk_create(
+            Rating(user=self.users[username], festival_id=festival_id, rating=rating)
+            for username, ratings in self.ratings.items()
+            for festival_id, rating in ratings.items()
+        )
+        # A festival nobody rated anymore.
+        FestivalNeighbour.objects.create(festival_id="FEST_E", neighbour_id="FEST_A", similarity=1)
+
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_superuser("admin", "admin@zhackathon.fr", "admin"))
+
+    def get_neighbours(self):
+        return {
+            (festival_id, neighbour_id): round(similarity, 3)
+            for festival_id, neighbour_id, similarity in FestivalNeighbour.objects.values_list(
+                "festival", "neighbour", "similarity"
+            )
+        }
+
+    def test_build_keeps_positive_similarities(self):
+        call_command("build_recommendations", stdout=StringIO())
+        neighbours = self.get_neighbours()
+        # Festivals rated alike, but not the ones rated inversely, nor the ones with a single common rater.
+        self.assertEqual(neighbours.keys(), {("FEST_A", "FEST_B"), ("FEST_B", "FEST_A")})
+        self.assertGreater(neighbours["FEST_A", "FEST_B"], 0.5)
+
+        # One pass per festival yields the same neighbours.
+        call_command("build_recommendations", block_size=1, stdout=StringIO())
+        self.assertEqual(self.get_neighbours(), neighbours)
+
+        call_command("build_recommendations", min_support=1, stdout=StringIO())
+        self.assertIn(("FEST_D", "FEST_C"), self.get_neighbours())
+
+    def test_similar_and_recommendations(self):
+        call_command("build_recommendations", stdout=StringIO())
+
+        response = self.client.get("/api/festivals/FEST_A/similar/")
+        self.assertEqual([festival["id"] for festival in response.json()], ["FEST_B"])
+        self.assertEqual(self.client.get("/api/festivals/FEST_A/similar/?region=Occitanie").json(), [])
+        self.assertEqual(self.client.get("/api/festivals/FEST_X/similar/").status_code, 404)
+
+        self.client.force_authenticate(self.users["erin"])
+        with self.assertNumQueries(2):
+            response = self.client.get("/api/user/recommendations/")
+        self.assertEqual([festival["id"] for festival in response.json()], ["FEST_B"])
+
+        # Festivals already rated are not recommended, nor the ones similar to festivals rated low.
+        self.client.force_authenticate(self.users["dave"])
+        self.assertEqual(self.client.get("/api/user/recommendations/").json(), [])
+
+
+class ExportTestCase(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_superuser("admin", "admin@zhackathon.fr", "admin")
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+        self.festivals = [
+            Festival.objects.create(id=f"FEST_{index}", name=f'Festival "{index}", Rennes', discipline=discipline)
+            for index, discipline in enumerate(["Musique", "Cirque", "Musique"])
+        ]
+        for festival in self.festivals:
+            Comment.objects.create(author=self.admin, festival=festival, content="Great,\nreally")
+            Rating.objects.create(user=self.admin, festival=festival, rating=4)
+
+    def test_csv_export_honours_the_list_filters(self):
+        response = self.client.get("/api/festivals/export/?format=csv&discipline=Musique&ordering=-name")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response["Content-Type"], "text/csv; charset=utf-8")
+        self.assertEqual(response["Content-Disposition"], 'attachment; filename="festivals.csv"')
+        rows = list(csv.DictReader(StringIO(response.getvalue().decode())))
+        self.assertEqual([row["id"] for row in rows], ["FEST_2", "FEST_0"])
+        self.assertEqual(rows[0]["name"], 'Festival "2", Rennes')
+        self.assertEqual(rows[0].keys(), set(serializers.FestivalSerializer().fields))
+
+    def test_ndjson_export_matches_the_serializer(self):
+        festival = self.festivals[1]
+        response = self.client.get(f"/api/comments/export/?festival={festival.pk}", HTTP_ACCEPT="application/x-ndjson")
+
+        self.assertEqual(response["Content-Type"], "application/x-ndjson; charset=utf-8")
+        lines = response.getvalue().decode().splitlines()
+        self.assertEqual(
+            [json.loads(line) for line in lines],
+            serializers.CommentExportSerializer(festival.comments.all(), many=True).data,
+        )
+
+        response = self.client.get("/api/ratings/export/?format=ndjson")
+        self.assertEqual(len(response.getvalue().splitlines()), 3)
+
+    def test_export_is_gzipped_on_demand(self):
+        plain = self.client.get("/api/ratings/export/").getvalue()
+        response = self.client.get("/api/ratings/export/", HTTP_ACCEPT_ENCODING="gzip, br")
+
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertIn("Accept-Encoding", response["Vary"])
+        self.assertEqual(gzip.decompress(response.getvalue()), plain)
+
+    def test_export_streams_in_chunks(self):
+        with mock.patch("zhackathon.exports.CHUNK_SIZE", 2), CaptureQueriesContext(connection) as context:
+            response = self.client.get("/api/festivals/export/")
+            queries = len(context.captured_queries)
+            chunks = iter(response.streaming_content)
+
+            # The header goes out before the query runs.
+            self.assertEqual(next(chunks).decode().split(",")[0], "id")
+            self.assertEqual(len(context.captured_queries), queries)
+            self.assertEqual([chunk.count(b"\n") for chunk in chunks], [2, 1])
+            self.assertEqual(len(context.captured_queries), queries + 1)
+
+    async def test_asgi_streams_the_export_off_the_event_loop(self):
+        expected = await sync_to_async(lambda: self.client.get("/api/festivals/export/").getvalue())()
+        client = Client()
+        await sync_to_async(client.force_login)(self.admin)
+        scope = {
+            "type": "http",
+            "method": "GET",
+            "path": "/api/festivals/export/",
+            "query_string": b"",
+            "server": ("testserver", 80),
+            "headers": [(b"cookie", f"sessionid={client.cookies['sessionid'].value}".encode())],
+        }
+        messages = []
+
+        async def receive():
+            return {"type": "http.request", "body": b""}
+
+        async def send(message):
+            messages.append(message)
+
+        # The ORM would refuse to fetch the rows from the event loop. See also
+        # TicketingStreamTestCase.test_asgi_streams_coalesced_updates.
+        for signal in (request_started, request_finished):
+            signal.disconnect(close_old_connections)
+            self.addCleanup(signal.connect, close_old_connections)
+        with mock.patch("zhackathon.exports.CHUNK_SIZE", 2):
+            await asyncio.wait_for(streams.ASGIHandler().handle(scope, receive, send), 5)
+
+        self.assertEqual(messages[0]["status"], 200)
+        self.assertEqual([message.get("body", b"").count(b"\n") for message in messages[1:]], [1, 2, 1, 0])
+        self.assertEqual(b"".join(message.get("body", b"") for message in messages[1:]), expected)
+
+    def test_invalid_export_requests(self):
+        response = self.client.get("/api/ratings/export/?festival=UNKNOWN")
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("festival", json.loads(response.content))
+
+        self.assertEqual(self.client.get("/api/festivals/export/?format=xml").status_code, 404)
+        self.client.force_authenticate(User.objects.create_user("user"))
+        self.assertEqual(self.client.get("/api/festivals/export/").status_code, 403)
+
+
+@override_settings(PASSWORD_HASHERS=["django.contrib.auth.hashers.MD5PasswordHasher"])
+class AuthenticationTestCase(TestCase):
+    def setUp(self):
+        caches[TOKEN_CACHE_ALIAS].clear()
+        self.admin = User.objects.create_superuser("admin", "admin@zhackathon.fr", "admin")
+        self.client = APIClient()
+
+    def get_token(self):
+        response = self.client.post("/api/user/token/", {"username": "admin", "password": "admin"})
+        self.assertEqual(response.status_code, 201)
+        return response.json()["token"]
+
+    def count_queries(self, **headers):
+        with CaptureQueriesContext(connection) as context:
+            self.assertEqual(self.client.get("/api/cache/stats/", **headers).status_code, 200)
+        return len(context.captured_queries)
+
+    def test_cached_token_runs_no_query(self):
+        with override_settings(SESSION_ENGINE="django.contrib.sessions.backends.db"):
+            client = APIClient()
+            client.login(username="admin", password="admin")
+            with CaptureQueriesContext(connection) as context:
+                client.get("/api/cache/stats/")
+            self.assertEqual(len(context.captured_queries), 2)
+
+        # The session is then read from the cache, the user still from the database.
+        self.client.login(username="admin", password="admin")
+        self.assertEqual(self.count_queries(), 1)
+        self.client.logout()
+
+        token = self.get_token()
+        self.assertEqual(token, self.get_token())
+        self.assertEqual(self.count_queries(HTTP_AUTHORIZATION=f"Token {token}"), 1)
+        self.assertEqual(self.count_queries(HTTP_AUTHORIZATION=f"Token {token}"), 0)
+        self.assertEqual(self.client.get("/api/cache/stats/", HTTP_AUTHORIZATION="Token unknown").status_code, 403)
+        self.assertEqual(self.client.post("/api/user/token/", {"username": "admin", "password": "no"}).status_code, 400)
+
+    def test_logout_revokes_the_token(self):
+        token = self.get_token()
+        self.client.credentials(HTTP_AUTHORIZATION=f"Token {token}")
+        self.assertEqual(self.client.get("/api/cache/stats/").status_code, 200)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.client.delete("/api/user/logout/").status_code, 204)
+        self.assertEqual(self.client.get("/api/cache/stats/").status_code, 403)
+        self.client.credentials()
+        self.assertNotEqual(self.get_token(), token)
+
+    def test_user_changes_evict_the_token(self):
+        token = self.get_token()
+        self.client.credentials(HTTP_AUTHORIZATION=f"Token {token}")
+        self.assertEqual(self.client.get("/api/cache/stats/").status_code, 200)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.admin.is_staff = False
+            self.admin.save()
+        self.assertEqual(self.client.get("/api/cache/stats/").status_code, 403)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.admin.is_staff = True
+            self.admin.set_password("changed")
+            self.admin.save()
+        self.assertEqual(self.client.get("/api/cache/stats/").status_code, 403)
+        self.assertFalse(Token.objects.filter(key=token).exists())
+
+
+@override_settings(PASSWORD_HASHERS=["django.contrib.auth.hashers.MD5PasswordHasher"])
+class UserImportTestCase(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_superuser("admin", "admin@zhackathon.fr", "admin")
+        User.objects.create_user("taken", "taken@zhackathon.fr")
+
+    def test_import_users_command(self):
+        with tempfile.NamedTemporaryFile("w", suffix=".csv", encoding="utf-8") as file:
+            writer = csv.writer(file)
+            writer.writerows(
+                [
+                    ("username", "email", "password"),
+                    ("alice", "alice@ZHACKATHON.FR", "Zh4ckathon!"),
+                    ("bob", "bob@zhackathon.fr", ""),
+                    ("alice", "other@zhackathon.fr", "Zh4ckathon!"),
+                    ("taken", "new@zhackathon.fr", "Zh4ckathon!"),
+                    ("carol", "taken@zhackathon.fr", "Zh4ckathon!"),
+                    ("dave", "not an email", "Zh4ckathon!"),
+                    ("eve", "eve@zhackathon.fr", "123"),
+                ]
+            )
+            file.flush()
+            stdout, stderr = StringIO(), StringIO()
+            call_command("import_users", file.name, batch_size=2, workers=2, stdout=stdout, stderr=stderr)
+
+        self.assertIn("7 record(s)", stdout.getvalue())
+        self.assertIn("2 created, 1 duplicates, 2 existing, 2 invalid", stdout.getvalue())
+        self.assertIn("Record 6 (dave): email:", stderr.getvalue())
+        self.assertIn("Record 7 (eve): password:", stderr.getvalue())
+
+        alice = User.objects.get(username="alice")
+        self.assertEqual(alice.email, "alice@zhackathon.fr")
+        self.assertTrue(alice.check_password("Zh4ckathon!"))
+        self.assertTrue(alice.password.startswith("md5$"))
+        self.assertFalse(User.objects.get(username="bob").has_usable_password())
+        self.assertEqual(User.objects.count(), 4)
+
+    def test_batch_endpoint(self):
+        client = APIClient()
+        client.force_authenticate(User.objects.create_user("user"))
+        users = [{"username": "frank", "email": "frank@zhackathon.fr", "password": "Zh4ckathon!"}, {"username": ""}]
+        self.assertEqual(client.post("/api/user/batch/", {"users": users}, format="json").status_code, 403)
+
+        client.force_authenticate(self.admin)
+        response = client.post("/api/user/batch/", {"users": users}, format="json")
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(
+            response.json(),
+            {
+                "created": 1,
+                "duplicates": 0,
+                "existing": 0,
+                "invalid": 1,
+                "errors": [
+                    {
+                        "record": 2,
+                        "username": "",
+                        "messages": ["username: This field cannot be blank.", "email: This field cannot be blank."],
+                    }
+                ],
+            },
+        )
+        self.assertTrue(User.objects.get(username="frank").check_password("Zh4ckathon!"))
+
+        with override_settings(USER_IMPORT_SETTINGS={"WORKERS": 1, "MAX_BATCH_SIZE": 1}):
+            self.assertEqual(client.post("/api/user/batch/", {"users": users}, format="json").status_code, 400)
+
+    def test_users_registered_meanwhile_count_as_existing(self):
+        hash_passwords = UserImporter.hash
+
+        def register_then_hash(importer, users):
+            User.objects.create_user("grace", "other@zhackathon.fr")
+            hash_passwords(importer, users)
+
+        client = APIClient()
+        client.force_authenticate(self.admin)
+        users = [
+            {"username": "grace", "email": "grace@zhackathon.fr", "password": "Zh4ckathon!"},
+            {"username": "heidi", "email": "heidi@zhackathon.fr"},
+        ]
+        with mock.patch.object(UserImporter, "hash", register_then_hash):
+            response = client.post("/api/user/batch/", {"users": users}, format="json")
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()["created"], 1)
+        self.assertEqual(response.json()["existing"], 1)
+        self.assertEqual(User.objects.get(username="grace").email, "other@zhackathon.fr")
+
+
+class FestivalOverviewTestCase(TestCase):
+    def setUp(self):
+        caches[CACHE_ALIAS].clear()
+        self.admin = User.objects.create_superuser("admin", "admin@zhackathon.fr", "admin")
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+        self.festival = Festival.objects.create(id="FEST_1", name="Festival", discipline="Musique")
+        for index, value in enumerate((2, 4, 4)):
+            Rating.objects.create(
+                user=User.objects.create(username=f"user-{index}"), festival=self.festival, rating=value
+            )
+        self.comments = [
+            Comment.objects.create(author=self.admin, festival=self.festival, content=f"Comment {index}")
+            for index in range(4)
+        ]
+        self.comments[-1].like(self.admin)
+        Ticketing.objects.create(name="weekend", festival=self.festival, total_tickets=100)
+        Ticketing.objects.create(name="day", festival=self.festival, total_tickets=10).reserve(3)
+
+    def test_overview(self):
+        # The festival and its comment count, its histogram, its latest comments and its ticketings.
+        with self.assertNumQueries(4):
+            response = self.client.get(f"/api/festivals/{self.festival.pk}/overview/?comments=3")
+
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data["festival"]["id"], "FEST_1")
+        self.assertEqual(
+            data["rating"],
+            {"average": 10 / 3, "count": 3, "histogram": {"0": 0, "1": 0, "2": 1, "3": 0, "4": 2, "5": 0}},
+        )
+        self.assertEqual(data["comment_count"], 4)
+        self.assertEqual(
+            [(comment["content"], comment["like_count"], comment["liked"]) for comment in data["comments"]],
+            [("Comment 3", 1, True), ("Comment 2", 0, False), ("Comment 1", 0, False)],
+        )
+        self.assertEqual(
+            data["ticketings"],
+            [
+                {"name": "day", "available_tickets": 7, "status": "LAST PLACES"},
+                {"name": "weekend", "available_tickets": 100, "status": "OPEN"},
+            ],
+        )
+
+    def test_overview_query_count_does_not_grow(self):
+        festival = Festival.objects.create(id="FEST_2", name="Empty", discipline="Cirque")
+        with self.assertNumQueries(3):
+            response = self.client.get(f"/api/festivals/{festival.pk}/overview/")
+        self.assertEqual(
+            response.json(),
+            {
+                "festival": response.json()["festival"],
+                "rating": None,
+                "comment_count": 0,
+                "comments": [],
+                "ticketings": [],
+            },
+        )
+
+        for index in range(30):
+            Comment.objects.create(author=self.admin, festival=self.festival, content=f"More {index}").like(self.admin)
+            Ticketing.objects.create(name=f"pass-{index}", festival=self.festival, total_tickets=10)
+        with self.assertNumQueries(4):
+            response = self.client.get(f"/api/festivals/{self.festival.pk}/overview/?comments=50")
+        self.assertEqual(response.json()["comment_count"], 34)
+        self.assertEqual(len(response.json()["comments"]), 34)
+        self.assertEqual(len(response.json()["ticketings"]), 32)
+        self.assertEqual(self.client.get(f"/api/festivals/{self.festival.pk}/overview/?comments=51").status_code, 400)
+
+    @override_settings(LIKE_SETTINGS={**settings.LIKE_SETTINGS, "WRITE_BEHIND": True})
+    def test_overview_merges_buffered_likes(self):
+        self.addCleanup(like_buffer.deltas.clear)
+        self.addCleanup(setattr, like_buffer, "pending", {})
+        with mock.patch.object(like_buffer, "start"):
+            self.comments[-1].unlike(self.admin)
+            self.comments[-2].like(self.admin)
+
+        comments = self.client.get(f"/api/festivals/{self.festival.pk}/overview/?comments=2").json()["comments"]
+        self.assertEqual([(comment["like_count"], comment["liked"]) for comment in comments], [(0, False), (1, True)])
+
+
+@override_settings(TICKETING_STREAM_SETTINGS={"INTERVAL": 0.2, "KEEPALIVE": 15, "BRIDGE_DIRECTORY": None})
+class TicketingStreamTestCase(TestCase):
+    def setUp(self):
+        festival = Festival.objects.create(id="FEST_1", name="Festival", discipline="Musique")
+        self.ticketing = Ticketing.objects.create(name="pass-b", festival=festival, total_tickets=20)
+        Ticketing.objects.create(name="pass-a", festival=festival, total_tickets=100)
+
+        self.client = APIClient()
+        self.client.force_login(User.objects.create_superuser("admin", "admin@zhackathon.fr", "admin"))
+
+    @staticmethod
+    def parse(body):
+        return json.loads(body.decode().split("data: ", 1)[1])
+
+    def test_wsgi_clients_get_the_current_state(self):
+        response = self.client.get("/api/festivals/FEST_1/ticketings/stream/", HTTP_ACCEPT="text/event-stream")
+
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+        body = response.getvalue()
+        self.assertTrue(body.startswith(b"retry: 200\nevent: ticketings\n"))
+        self.assertEqual(
+            self.parse(body),
+            [
+                {"name": "pass-a", "available_tickets": 100, "status": "OPEN"},
+                {"name": "pass-b", "available_tickets": 20, "status": "OPEN"},
+            ],
+        )
+        self.assertEqual(self.client.get("/api/festivals/missing/ticketings/stream/").status_code, 404)
+
+    def test_reservations_are_published_on_commit(self):
+        with mock.patch.object(streams.ticketing_broker, "publish") as publish:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.ticketing.reserve(5)
+            self.ticketing.reserve(100)
+
+        publish.assert_called_once_with("FEST_1", [{"name": "pass-b", "available_tickets": 15, "status": "OPEN"}])
+
+    async def test_asgi_streams_coalesced_updates(self):
+        messages, disconnected = asyncio.Queue(), asyncio.Event()
+
+        async def receive():
+            if not hasattr(receive, "started"):
+                receive.started = True
+                return {"type": "http.request", "body": b""}
+            await disconnected.wait()
+            return {"type": "http.disconnect"}
+
+        scope = {
+            "type": "http",
+            "method": "GET",
+            "path": "/api/festivals/FEST_1/ticketings/stream/",
+            "query_string": b"",
+            "server": ("testserver", 80),
+            "headers": [(b"cookie", f"sessionid={self.client.cookies['sessionid'].value}".encode())],
+        }
+        # Like the test client, skips the thread of its own the handler gives each request, which would not see the
+        # test transaction, and keeps its connection open.
+        for signal in (request_started, request_finished):
+            signal.disconnect(close_old_connections)
+            self.addCleanup(signal.connect, close_old_connections)
+        handler = asyncio.ensure_future(streams.ASGIHandler().handle(scope, receive, messages.put))
+
+        start = await asyncio.wait_for(messages.get(), 5)
+        self.assertEqual(start["status"], 200)
+        self.assertIn((b"Content-Type", b"text/event-stream"), start["headers"])
+        self.assertEqual(len(self.parse((await asyncio.wait_for(messages.get(), 5))["body"])), 2)
+
+        streams.ticketing_broker.publish("FEST_1", [{"name": "pass-a", "available_tickets": 99, "status": "OPEN"}])
+        self.assertEqual(self.parse((await asyncio.wait_for(messages.get(), 5))["body"])[0]["available_tickets"], 99)
+
+        started_at = time.monotonic()
+        for available in (98, 97):
+            streams.ticketing_broker.publish(
+                "FEST_1", [{"name": "pass-a", "available_tickets": available, "status": "OPEN"}]
+            )
+        streams.ticketing_broker.publish(
+            "FEST_1", [{"name": "pass-b", "available_tickets": 3, "status": "LAST PLACES"}]
+        )
+        streams.ticketing_broker.publish("FEST_2", [{"name": "other", "available_tickets": 1, "status": "OPEN"}])
+        body = (await asyncio.wait_for(messages.get(), 5))["body"]
+        self.assertGreaterEqual(time.monotonic() - started_at, 0.15)
+        self.assertEqual(
+            self.parse(body),
+            [
+                {"name": "pass-a", "available_tickets": 97, "status": "OPEN"},
+                {"name": "pass-b", "available_tickets": 3, "status": "LAST PLACES"},
+            ],
+        )
+
+        disconnected.set()
+        await asyncio.wait_for(handler, 5)
+        self.assertEqual(await messages.get(), {"type": "http.response.body"})
+        self.assertEqual(streams.ticketing_broker.subscriptions, {})
+
+    async def test_bridge_reaches_the_subscribers_of_other_workers(self):
+        with tempfile.TemporaryDirectory() as directory, self.settings(
+            TICKETING_STREAM_SETTINGS={**settings.TICKETING_STREAM_SETTINGS, "BRIDGE_DIRECTORY": directory}
+        ):
+            subscription = await streams.ticketing_broker.subscribe("FEST_1")
+            # The socket of a worker which died without removing it.
+            with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM) as dead:
+                dead.bind(os.path.join(directory, "0.sock"))
+
+            try:
+                # Another process, which only publishes, e.g. a WSGI worker.
+                streams.TicketingBroker().publish(
+                    "FEST_1", [{"name": "pass-a", "available_tickets": 1, "status": "LAST PLACES"}]
+                )
+                await asyncio.wait_for(subscription.ready.wait(), 5)
+                self.assertEqual(os.listdir(directory), [f"{os.getpid()}.sock"])
+            finally:
+                streams.ticketing_broker.unsubscribe(subscription)
+                streams.ticketing_broker.transport.close()
+
+        self.assertEqual(subscription.changes["pass-a"]["available_tickets"], 1)
+
+
+class ChangeLogTestCase(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_superuser("admin", "admin@zhackathon.fr", "admin")
+        self.festival = Festival.objects.create(id="FEST_1", name="Festival", discipline="Musique")
+        self.ticketing = Ticketing.objects.create(name="pass", festival=self.festival, total_tickets=10)
+        self.comment = Comment.objects.create(festival=self.festival, author=self.admin, content="Great")
+
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def get_changes(self, since=0, **params):
+        response = self.client.get("/api/changes/", {"since": since, **params})
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_changes_are_compacted_per_batch(self):
+        self.comment.content = "Edited"
+        self.comment.save()
+        self.assertEqual(self.client.post("/api/ratings/", {"festival": "FEST_1", "rating": 4}).status_code, 201)
+        self.ticketing.reserve(2)
+
+        feed = self.get_changes()
+        self.assertFalse(feed["more"])
+        self.assertEqual(feed["next"], Change.objects.latest("seq").seq)
+        changes = {(change["model"], change["id"]): change for change in feed["changes"]}
+        self.assertEqual(len(changes), len(feed["changes"]))
+        self.assertEqual(
+            set(changes),
+            {
+                ("festival", "FEST_1"),
+                ("ticketing", "pass"),
+                ("comment", str(self.comment.pk)),
+                ("rating", str(Rating.objects.get().pk)),
+            },
+        )
+        self.assertEqual(changes[("comment", str(self.comment.pk))]["data"]["content"], "Edited")
+        self.assertEqual(changes[("festival", "FEST_1")]["data"]["rating_count"], 1)
+        self.assertEqual(changes[("ticketing", "pass")]["data"]["available_tickets"], 8)
+        self.assertEqual(
+            [change["seq"] for change in feed["changes"]], sorted(change["seq"] for change in feed["changes"])
+        )
+
+        # Batches, which only compact the changes within each of them.
+        first = self.get_changes(limit=2)
+        self.assertTrue(first["more"])
+        rest = self.get_changes(first["next"])
+        self.assertFalse(rest["more"])
+        self.assertLessEqual(
+            {change["seq"] for change in feed["changes"]},
+            {change["seq"] for change in first["changes"] + rest["changes"]},
+        )
+        self.assertEqual(self.get_changes(feed["next"]), {"next": feed["next"], "more": False, "changes": []})
+
+    def test_deletions_leave_tombstones(self):
+        since, comment_id = Change.objects.latest("seq").seq, str(self.comment.pk)
+        self.comment.delete()
+        changes = self.get_changes(since)["changes"]
+        self.assertEqual(
+            [(change["model"], change["id"], change["deleted"], change["data"]) for change in changes],
+            [("comment", comment_id, True, None)],
+        )
+
+        # A festival tombstone stands for its ticketings.
+        since = Change.objects.latest("seq").seq
+        self.festival.delete()
+        changes = self.get_changes(since)["changes"]
+        self.assertEqual(
+            [(change["model"], change["id"], change["deleted"]) for change in changes], [("festival", "FEST_1", True)]
+        )
+
+    def test_compaction(self):
+        for content in ("One", "Two"):
+            self.comment.content = content
+            self.comment.save()
+        Ticketing.objects.create(name="old", festival=self.festival, total_tickets=1).delete()
+        Change.objects.filter(model="ticketing", object_id="old").update(changed_at=timezone.now() - timedelta(days=31))
+        tombstone = Change.objects.get(model="ticketing", object_id="old", deleted=True)
+        before = self.get_changes()
+        since = Change.objects.filter(model="comment").earliest("seq").seq
+
+        stdout = StringIO()
+        call_command("compact_changes", batch_size=2, stdout=stdout)
+
+        self.assertIn(
+            "Deleted 3 superseded change(s), 0 change(s) of deleted festivals and 1 expired tombstone(s)",
+            stdout.getvalue(),
+        )
+        self.assertEqual(Change.objects.filter(model="comment").count(), 1)
+        self.assertFalse(Change.objects.filter(object_id="old").exists())
+        self.assertEqual(ChangeHorizon.get(), tombstone.seq)
+        # The compacted log still leads to the same state.
+        self.assertEqual(
+            {(change["model"], change["id"]): change["data"] for change in self.get_changes()["changes"]},
+            {(change["model"], change["id"]): change["data"] for change in before["changes"] if change["id"] != "old"},
+        )
+        self.assertEqual(self.client.get("/api/changes/", {"since": since}).status_code, 410)
+        self.get_changes(tombstone.seq)
+
+    def test_compaction_drops_the_changes_of_deleted_festivals(self):
+        Festival.objects.create(id="FEST_2", name="Other", discipline="Musique")
+        other = Comment.objects.create(festival_id="FEST_2", author=self.admin, content="Still there")
+        Rating.objects.create(festival=self.festival, user=self.admin, rating=4)
+        self.festival.delete()
+        before = self.get_changes()
+
+        stdout = StringIO()
+        call_command("compact_changes", batch_size=2, stdout=stdout)
+
+        self.assertIn("3 change(s) of deleted festivals", stdout.getvalue())
+        self.assertEqual(
+            set(Change.objects.values_list("model", "object_id", "deleted")),
+            {("festival", "FEST_1", True), ("festival", "FEST_2", False), ("comment", str(other.pk), False)},
+        )
+        self.assertEqual(self.get_changes()["changes"], before["changes"])
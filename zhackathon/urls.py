@@ -3,16 +3,20 @@ from django.urls import include, path
 from drf_spectacular.views import SpectacularAPIView
 from rest_framework.routers import SimpleRouter
 
-from . import views
+from . import metrics, views
 
 router = SimpleRouter(trailing_slash=True)
 router.register(r"festivals", views.FestivalViewSet, basename="festivals")
 router.register(r"comments", views.CommentViewSet, basename="comments")
 router.register(r"ratings", views.RatingViewSet, basename="ratings")
+router.register(r"ticketings", views.TicketingViewSet, basename="ticketings")
+router.register(r"changes", views.ChangeViewSet, basename="changes")
+router.register(r"cache", views.CacheViewSet, basename="cache")
 router.register(r"user", views.UserViewSet, basename="user")
 
 urlpatterns = [
     path(".well-known/openapi.yaml", SpectacularAPIView.as_view(), name="openapi"),
+    path("metrics", metrics.metrics_view, name="metrics"),
     path("admin/", admin.site.urls),
     path("api/", include(router.urls), name="api"),
     # path("logout/", UserView.as_view(), name="logout"),
@@ -0,0 +1,25 @@
+from django.urls import include, path, re_path
+
+from . import urls
+from .urls import router
+
+
+def get_async_urlpatterns():
+    """
+    Routes of the API, in the same order and under the same names, where the GET requests of every read-only action
+    with an async twin go to it.
+    """
+    urlpatterns = []
+    for pattern in router.urls:
+        view = pattern.callback
+        if view.actions.get("get") in view.cls.async_actions:
+            pattern = re_path(str(pattern.pattern), view.cls.as_async_view(view), name=pattern.name)
+        urlpatterns.append(pattern)
+    return urlpatterns
+
+
+# URLconf of the requests served over ASGI (see zhackathon.middleware.AsyncReadPathMiddleware).
+urlpatterns = [
+    path("api/", include(get_async_urlpatterns())) if str(pattern.pattern) == "api/" else pattern
+    for pattern in urls.urlpatterns
+]
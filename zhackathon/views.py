@@ -2,12 +2,22 @@
 
 from typing import Optional
 
+from asgiref.sync import sync_to_async
+from django.conf import settings
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.models import User
-from django.db.models.query import QuerySet
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import transaction
+from django.db.models import Count, Exists, F, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+from django.http import Http404
+from django.utils import timezone
 from django_filters.rest_framework import DjangoFilterBackend
-from drf_spectacular.utils import extend_schema
+from drf_spectacular.types import OpenApiTypes
+from drf_spectacular.utils import OpenApiParameter, extend_schema
+from rest_framework.authtoken.models import Token
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.filters import OrderingFilter, SearchFilter
 from rest_framework.generics import (
     CreateAPIView,
@@ -24,27 +34,167 @@ from rest_framework.status import (
     HTTP_204_NO_CONTENT,
     HTTP_400_BAD_REQUEST,
     HTTP_403_FORBIDDEN,
+    HTTP_409_CONFLICT,
+    HTTP_410_GONE,
 )
 from rest_framework.viewsets import GenericViewSet, ModelViewSet
 
-from . import serializers
-from .filters import CommentFilterSet, RatingFilterSet
-from .models import Comment, Festival, Rating
+from . import exports, geo, metrics, provisioning, search, serializers, streams
+from .cache import cache_response, response_cache
+from .filters import CommentFilterSet, FestivalFilterSet, RatingFilterSet
+from .models import (
+    Change,
+    ChangeHorizon,
+    Comment,
+    Festival,
+    FestivalFacet,
+    FestivalNeighbour,
+    Rating,
+    Ticketing,
+)
+from .pagination import CommentCursorPagination, RatingCursorPagination
+from .renderers import CSVRenderer, EventStreamRenderer, NDJSONRenderer
 
 
 class BaseViewSet(GenericViewSet):
     serializers_class = {}
+    # Maximum number of SQL queries of each action, authentication excluded, whatever the page size (see tests).
+    query_budgets = {}
+    # Read-only actions which also have an async twin, prefixed with "a", served under ASGI (see urls_async).
+    async_actions = ()
+    # List actions fetching values() rows rather than model instances, for the row converter of their serializer
+    # (see serializers.RowListSerializer).
+    values_actions = ()
 
     def get_serializer_class(self):
         return self.serializers_class.get(self.action, self.serializer_class)
 
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        if self.action in self.values_actions:
+            columns, _ = serializers.RowListSerializer.get_converter(self.get_serializer_class())
+            queryset = queryset.values(*columns)
+        return queryset
+
+    def check_permissions(self, request):
+        with metrics.timer("permissions"):
+            super().check_permissions(request)
+
+    def check_object_permissions(self, request, obj):
+        with metrics.timer("permissions"):
+            super().check_object_permissions(request, obj)
+
+    def get_object(self):
+        # Permission checks and the update/destroy mixins both resolve the object: only fetch it once per request.
+        if not hasattr(self, "_object"):
+            self._object = super().get_object()
+        return self._object
+
+    @classmethod
+    def as_async_view(cls, view):
+        """
+        Wraps the view of a route so that its GET requests are served by the async twin of their action (alist for
+        list, ...), which awaits the ORM instead of holding a thread. Other methods still run the sync view.
+        """
+        fallback = sync_to_async(view)
+
+        async def async_view(request, *args, **kwargs):
+            if request.method != "GET":
+                return await fallback(request, *args, **kwargs)
+
+            self = cls(**view.initkwargs)
+            self.action_map = view.actions
+            self.setup(request, *args, **kwargs)
+            request = self.initialize_request(request, *args, **kwargs)
+            self.request = request
+            self.headers = self.default_response_headers
+
+            try:
+                # Authentication and permission classes are sync and may query the database.
+                await sync_to_async(self.initial)(request, *args, **kwargs)
+                response = await getattr(self, f"a{self.action}")(request, *args, **kwargs)
+            except Exception as exc:  # pylint: disable=broad-except
+                response = self.handle_exception(exc)
+
+            self.response = self.finalize_response(request, response, *args, **kwargs)
+            return self.response
+
+        async_view.cls = cls
+        async_view.initkwargs = view.initkwargs
+        async_view.actions = view.actions
+        async_view.csrf_exempt = True
+        return async_view
+
+    async def afilter_queryset(self, queryset):
+        # Filter sets validate model choices against the database.
+        return await sync_to_async(self.filter_queryset)(queryset)
+
+    async def aget_object(self):
+        if not hasattr(self, "_object"):
+            queryset = await self.afilter_queryset(self.get_queryset())
+            lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+            try:
+                obj = await queryset.aget(**{self.lookup_field: self.kwargs[lookup_url_kwarg]})
+            except (queryset.model.DoesNotExist, TypeError, ValueError, DjangoValidationError) as exc:
+                raise Http404 from exc
+
+            self.check_object_permissions(self.request, obj)
+            self._object = obj
+        return self._object
+
+    async def apaginate_queryset(self, queryset):
+        if self.paginator is None:
+            return None
+        return await self.paginator.apaginate_queryset(queryset, self.request, view=self)
+
+    async def alist(self, request, *args, **kwargs):
+        queryset = await self.afilter_queryset(self.get_queryset())
+
+        page = await self.apaginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(self.get_serializer(page, many=True).data)
+        return Response(self.get_serializer([instance async for instance in queryset], many=True).data)
+
+    async def aretrieve(self, request, *args, **kwargs):
+        serializer = self.get_serializer(await self.aget_object())
+        return Response(serializer.data)
+
+
+class ExportMixin:
+    """
+    GET api/{prefix}/export/?format={csv|ndjson}, streaming every row the list action would page through, with the
+    same filters, search and ordering, through the "export" serializer.
+    """
+
+    @extend_schema(
+        parameters=[OpenApiParameter("format", str, enum=["csv", "ndjson"], description="Also negotiated by Accept.")],
+        responses={(200, CSVRenderer.media_type): OpenApiTypes.STR, (200, NDJSONRenderer.media_type): OpenApiTypes.STR},
+        filters=True,
+    )
+    @action(detail=False, methods=["GET"], pagination_class=None, renderer_classes=[CSVRenderer, NDJSONRenderer])
+    def export(self, request, *args, **kwargs):
+        serializer = self.get_serializer()
+        fields = [name for name, field in serializer.fields.items() if not field.write_only]
+        _, convert = serializers.RowListSerializer.get_converter(type(serializer))
 
-class FestivalViewSet(BaseViewSet, ModelViewSet):
+        return exports.stream(request, self.filter_queryset(self.get_queryset()), convert, fields, self.basename)
+
+
+class FestivalViewSet(ExportMixin, BaseViewSet, ModelViewSet):
     """
     GET api/festivals/
     GET api/festivals/{id}/
     GET api/festivals/{id}/rating/
     GET api/festivals/{id}/comments/
+    GET api/festivals/{id}/overview/?comments={count}
+    GET api/festivals/{id}/ticketings/stream/
+    GET api/festivals/facets/
+    GET api/festivals/search/?q={query}
+    GET api/festivals/nearby/?postcode={postcode}&radius_km={radius}
+    GET api/festivals/top/?region={region}&discipline={discipline}&limit={limit}
+    GET api/festivals/trending/?region={region}&discipline={discipline}&limit={limit}
+    GET api/festivals/{id}/similar/?region={region}&discipline={discipline}&limit={limit}
+    GET api/festivals/export/?format={csv|ndjson}
     POST api/festivals/
     PUT api/festivals/{id}/
     PATCH api/festivals/{id}/
@@ -57,33 +207,297 @@ class FestivalViewSet(BaseViewSet, ModelViewSet):
     serializers_class = {
         "rating": serializers.EmptySerializer,
         "comments": serializers.EmptySerializer,
+        "overview": serializers.EmptySerializer,
+        "ticketings_stream": serializers.EmptySerializer,
+        "export": serializers.FestivalSerializer,
     }
 
     permission_classes = (IsAuthenticated, IsAdminUser)
+    query_budgets = {
+        "list": 2,
+        "retrieve": 1,
+        "rating": 2,
+        "comments": 2,
+        "overview": 4,
+        "ticketings_stream": 2,
+        "facets": 4,
+        "search": 3,
+        "nearby": 5,
+        "top": 1,
+        "trending": 1,
+        "similar": 2,
+        "export": 1,
+        "create": 6,
+        "update": 9,
+        "partial_update": 9,
+        "destroy": 15,
+    }
+
+    async_actions = ("list", "retrieve", "rating", "comments")
+    values_actions = ("list", "export")
+
+    filter_backends = [DjangoFilterBackend, OrderingFilter]
+    filterset_class = FestivalFilterSet
+    ordering_fields = ["name", "average_rating", "rating_count"]
+
+    @cache_response("festivals")
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    @cache_response("festival:{pk}")
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
+    @cache_response("festivals")
+    async def alist(self, request, *args, **kwargs):
+        return await super().alist(request, *args, **kwargs)
+
+    @cache_response("festival:{pk}")
+    async def aretrieve(self, request, *args, **kwargs):
+        return await super().aretrieve(request, *args, **kwargs)
 
     @extend_schema(responses={200: serializers.AverageRatingSerializer, 204: serializers.EmptySerializer})
     @action(detail=True, methods=["GET"])
+    @cache_response("festival:{pk}")
     def rating(self, request, *args, **kwargs):
         festival: Festival = self.get_object()
-        average: Optional[int] = festival.get_average_rating()
+        rated = festival.get_average_rating() is not None
+
+        return self.get_rating_response(festival, festival.get_rating_histogram() if rated else None)
+
+    @cache_response("festival:{pk}")
+    async def arating(self, request, *args, **kwargs):
+        festival: Festival = await self.aget_object()
+        rated = festival.get_average_rating() is not None
+
+        return self.get_rating_response(festival, await festival.aget_rating_histogram() if rated else None)
+
+    def get_rating_response(self, festival: Festival, histogram: Optional[dict]):
+        # Shared by rating and arating, the histogram is only fetched for rated festivals.
+        average: Optional[float] = festival.get_average_rating()
 
         if average is None:
             return Response(status=HTTP_204_NO_CONTENT)
 
-        serializer = serializers.AverageRatingSerializer(data={"average": average})
+        serializer = serializers.AverageRatingSerializer(
+            data={
+                "average": average,
+                "count": festival.rating_count,
+                "histogram": histogram,
+            }
+        )
         serializer.is_valid(raise_exception=True)
 
         return Response(status=HTTP_200_OK, data=serializer.data)
 
-    @extend_schema(responses={200: serializers.CommentDetailSerializer})
-    @action(detail=True, methods=["GET"])
+    @extend_schema(responses={200: serializers.CommentDetailSerializer(many=True)})
+    @action(detail=True, methods=["GET"], pagination_class=CommentCursorPagination, filter_backends=[])
+    @cache_response("comments:{pk}")
     def comments(self, request, *args, **kwargs):
         festival: Festival = self.get_object()
-        comments: QuerySet[Comment] = festival.get_comments()
+        comments: list[Comment] = self.paginate_queryset(festival.get_comments())
+
+        return self.get_comments_response(comments)
+
+    @cache_response("comments:{pk}")
+    async def acomments(self, request, *args, **kwargs):
+        festival: Festival = await self.aget_object()
+        comments: list[Comment] = await self.apaginate_queryset(festival.get_comments())
+
+        return self.get_comments_response(comments)
+
+    def get_comments_response(self, comments):
         serializer = serializers.CommentDetailSerializer(comments, many=True)
 
+        return self.get_paginated_response(serializer.data)
+
+    @extend_schema(
+        parameters=[serializers.OverviewQuerySerializer], responses={200: serializers.FestivalOverviewSerializer}
+    )
+    @action(detail=True, methods=["GET"], pagination_class=None, filter_backends=[])
+    def overview(self, request, *args, **kwargs):
+        """
+        Everything the festival page shows, in a fixed number of queries: the festival with its comment count, its
+        rating histogram, its latest comments, with whether the user liked each, and its ticketings. Not cached, since
+        it depends on the user and on the live ticket availability.
+        """
+        query = serializers.OverviewQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+
+        festival: Festival = self.get_object()
+        rating = None
+        if festival.get_average_rating() is not None:
+            rating = {
+                "average": festival.get_average_rating(),
+                "count": festival.rating_count,
+                "histogram": festival.get_rating_histogram(),
+            }
+
+        likes = Comment.liked_by.through.objects.filter(comment=OuterRef("pk"), user=request.user.pk)
+        latest = festival.comments.annotate(liked=Exists(likes)).order_by("-created_at", "-id")
+        comments: list[Comment] = list(latest[: query.validated_data["comments"]])
+        for comment in comments:
+            comment.liked = comment.is_liked_by(request.user, comment.liked)
+
+        serializer = serializers.FestivalOverviewSerializer(
+            {
+                "festival": festival,
+                "rating": rating,
+                "comment_count": festival.comment_count,
+                "comments": comments,
+                # A festival only has a few ticketings, sorted here rather than by the database.
+                "ticketings": sorted(festival.ticketings.all(), key=lambda ticketing: ticketing.name),
+            }
+        )
+
         return Response(status=HTTP_200_OK, data=serializer.data)
 
+    @extend_schema(responses={(200, "text/event-stream"): OpenApiTypes.STR})
+    @action(
+        detail=True,
+        methods=["GET"],
+        url_path="ticketings/stream",
+        pagination_class=None,
+        filter_backends=[],
+        renderer_classes=[EventStreamRenderer],
+    )
+    def ticketings_stream(self, request, *args, **kwargs):
+        """
+        Server-sent "ticketings" events, with the available tickets and status of the ticketings of the festival: all
+        of them first, then those which changed, at most once per TICKETING_STREAM_SETTINGS["INTERVAL"]. Streamed
+        over ASGI only, WSGI clients get the first event and reconnect (see zhackathon.streams).
+        """
+        festival: Festival = self.get_object()
+
+        return streams.EventStreamResponse(festival.pk, festival.ticketings.all())
+
+    @extend_schema(responses={200: serializers.FacetsSerializer})
+    @action(detail=False, methods=["GET"], pagination_class=None)
+    @cache_response("festivals")
+    def facets(self, request, *args, **kwargs):
+        filterset = FestivalFilterSet(request.query_params, queryset=self.get_queryset(), request=request)
+        if not filterset.is_valid():
+            raise ValidationError(filterset.errors)
+
+        filters = {name: value for name, value in filterset.form.cleaned_data.items() if value not in (None, "")}
+        if filters.keys() <= set(FestivalFacet.DIMENSIONS):
+            counts = FestivalFacet.get_counts(**filters)
+        else:
+            counts = FestivalFacet.get_counts(filterset.qs)
+        serializer = serializers.FacetsSerializer(counts)
+
+        return Response(status=HTTP_200_OK, data=serializer.data)
+
+    @extend_schema(
+        parameters=[OpenApiParameter("q", str, description="Words to look for, accents and case are ignored.")],
+        responses={200: serializers.FestivalSerializer(many=True)},
+    )
+    @action(detail=False, methods=["GET"], filter_backends=[])
+    def search(self, request, *args, **kwargs):
+        festival_ids: list[str] = self.paginate_queryset(search.SearchResults(request.query_params.get("q", "")))
+        festivals = Festival.objects.in_bulk(festival_ids)
+        serializer = self.get_serializer([festivals[pk] for pk in festival_ids if pk in festivals], many=True)
+
+        return self.get_paginated_response(serializer.data)
+
+    @extend_schema(
+        parameters=[serializers.NearbyQuerySerializer], responses={200: serializers.NearbyFestivalSerializer(many=True)}
+    )
+    @action(detail=False, methods=["GET"], filter_backends=[])
+    def nearby(self, request, *args, **kwargs):
+        query = serializers.NearbyQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+
+        distances: list[tuple[float, str]] = self.paginate_queryset(
+            geo.festival_index.nearby(
+                query.validated_data["latitude"], query.validated_data["longitude"], query.validated_data["radius_km"]
+            )
+        )
+        festivals = Festival.objects.in_bulk([pk for _, pk in distances])
+        for distance, pk in distances:
+            if pk in festivals:
+                festivals[pk].distance_km = round(distance, 3)
+        serializer = serializers.NearbyFestivalSerializer(
+            [festivals[pk] for _, pk in distances if pk in festivals], many=True
+        )
+
+        return self.get_paginated_response(serializer.data)
+
+    @extend_schema(
+        parameters=[serializers.LeaderboardQuerySerializer],
+        responses={200: serializers.RankedFestivalSerializer(many=True)},
+    )
+    @action(detail=False, methods=["GET"], pagination_class=None, filter_backends=[])
+    @cache_response("festivals")
+    def top(self, request, *args, **kwargs):
+        festivals: list[Festival] = self.get_leaderboard("bayesian_rating")
+        for festival in festivals:
+            festival.score = festival.bayesian_rating
+        serializer = serializers.RankedFestivalSerializer(festivals, many=True)
+
+        return Response(status=HTTP_200_OK, data=serializer.data)
+
+    @extend_schema(
+        parameters=[serializers.LeaderboardQuerySerializer],
+        responses={200: serializers.RankedFestivalSerializer(many=True)},
+    )
+    @action(detail=False, methods=["GET"], pagination_class=None, filter_backends=[])
+    def trending(self, request, *args, **kwargs):
+        festivals: list[Festival] = self.get_leaderboard("trending_key")
+        now = timezone.now()
+        for festival in festivals:
+            festival.score = festival.get_trending_score(now)
+        serializer = serializers.RankedFestivalSerializer(festivals, many=True)
+
+        return Response(status=HTTP_200_OK, data=serializer.data)
+
+    @extend_schema(
+        parameters=[serializers.LeaderboardQuerySerializer],
+        responses={200: serializers.RankedFestivalSerializer(many=True)},
+    )
+    @action(detail=True, methods=["GET"], pagination_class=None, filter_backends=[])
+    @cache_response("festivals")
+    def similar(self, request, *args, **kwargs):
+        festival: Festival = self.get_object()
+        query = serializers.LeaderboardQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+
+        filters = {
+            f"neighbour__{name}": query.validated_data[name]
+            for name in ("region", "discipline")
+            if name in query.validated_data
+        }
+        neighbours = festival.neighbours.filter(**filters).select_related("neighbour").order_by("-similarity")
+        festivals = []
+        for neighbour in neighbours[: query.validated_data["limit"]]:
+            neighbour.neighbour.score = neighbour.similarity
+            festivals.append(neighbour.neighbour)
+        serializer = serializers.RankedFestivalSerializer(festivals, many=True)
+
+        return Response(status=HTTP_200_OK, data=serializer.data)
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action == "overview":
+            comments = Comment.objects.filter(festival=OuterRef("pk")).order_by().values("festival")
+            queryset = queryset.annotate(
+                comment_count=Coalesce(Subquery(comments.annotate(count=Count("pk")).values("count")), 0)
+            )
+        return queryset
+
+    def get_leaderboard(self, key):
+        """
+        Reads the first festivals of an index on the ranking key, so that the cost only grows with the limit.
+        """
+        query = serializers.LeaderboardQuerySerializer(data=self.request.query_params)
+        query.is_valid(raise_exception=True)
+
+        filters = {
+            name: query.validated_data[name] for name in ("region", "discipline") if name in query.validated_data
+        }
+        queryset = Festival.objects.filter(**{f"{key}__isnull": False}, **filters).order_by(f"-{key}", "-id")
+        return list(queryset[: query.validated_data["limit"]])
+
     def create(self, request, *args, **kwargs):
         return self.__has_permission(super().create, request, *args, **kwargs)
 
@@ -102,11 +516,12 @@ class FestivalViewSet(BaseViewSet, ModelViewSet):
         return Response(status=HTTP_403_FORBIDDEN)
 
 
-class CommentViewSet(BaseViewSet, ListCreateAPIView, UpdateAPIView, DestroyAPIView):
+class CommentViewSet(ExportMixin, BaseViewSet, ListCreateAPIView, UpdateAPIView, DestroyAPIView):
     """
     GET /api/comments/?festival={id}/
     GET /api/comments/
     GET /api/comments/{id}/likes/
+    GET /api/comments/export/?festival={id}&format={csv|ndjson}
     POST /api/comments/
     POST /api/comments/{id}/like/
     PUT /api/comments/{id}/
@@ -123,9 +538,24 @@ class CommentViewSet(BaseViewSet, ListCreateAPIView, UpdateAPIView, DestroyAPIVi
         "like": serializers.EmptySerializer,
         "unlike": serializers.EmptySerializer,
         "likes": serializers.EmptySerializer,
+        "export": serializers.CommentExportSerializer,
     }
 
     permission_classes = (IsAuthenticated, IsAdminUser)
+    pagination_class = CommentCursorPagination
+    query_budgets = {
+        "list": 2,
+        "create": 4,
+        "update": 3,
+        "partial_update": 3,
+        "destroy": 4,
+        "like": 6,
+        "unlike": 4,
+        "likes": 1,
+        "export": 2,
+    }
+    async_actions = ("list", "likes")
+    values_actions = ("list", "export")
 
     filter_backends = [DjangoFilterBackend, OrderingFilter, SearchFilter]
     filterset_class = CommentFilterSet
@@ -138,7 +568,7 @@ class CommentViewSet(BaseViewSet, ListCreateAPIView, UpdateAPIView, DestroyAPIVi
         comment: Comment = self.get_object()
         comment.like(self.request.user)
 
-        serializer = serializers.TotalLikesSerializer(data={"likes": comment.total_likes()})
+        serializer = serializers.TotalLikesSerializer(data={"total": comment.get_total_likes()})
         serializer.is_valid(raise_exception=True)
 
         return Response(status=HTTP_201_CREATED, data=serializer.data)
@@ -149,7 +579,7 @@ class CommentViewSet(BaseViewSet, ListCreateAPIView, UpdateAPIView, DestroyAPIVi
         comment: Comment = self.get_object()
         comment.unlike(self.request.user)
 
-        serializer = serializers.TotalLikesSerializer(data={"likes": comment.total_likes()})
+        serializer = serializers.TotalLikesSerializer(data={"total": comment.get_total_likes()})
         serializer.is_valid(raise_exception=True)
 
         return Response(status=HTTP_204_NO_CONTENT, data=serializer.data)
@@ -157,9 +587,13 @@ class CommentViewSet(BaseViewSet, ListCreateAPIView, UpdateAPIView, DestroyAPIVi
     @extend_schema(responses={200: serializers.TotalLikesSerializer})
     @action(detail=True, methods=["GET"])
     def likes(self, request, *args, **kwargs):
-        comment: Comment = self.get_object()
+        return self.get_likes_response(self.get_object())
+
+    async def alikes(self, request, *args, **kwargs):
+        return self.get_likes_response(await self.aget_object())
 
-        serializer = serializers.TotalLikesSerializer(data={"likes": comment.total_likes()})
+    def get_likes_response(self, comment: Comment):
+        serializer = serializers.TotalLikesSerializer(data={"total": comment.get_total_likes()})
         serializer.is_valid(raise_exception=True)
 
         return Response(status=HTTP_200_OK, data=serializer.data)
@@ -175,15 +609,16 @@ class CommentViewSet(BaseViewSet, ListCreateAPIView, UpdateAPIView, DestroyAPIVi
 
     def __has_permission(self, func, request, *args, **kwargs):
         comment: Comment = self.get_object()
-        if comment.author == self.request.user:
+        if comment.author_id == self.request.user.pk:
             return func(request, *args, **kwargs)
         return Response(status=HTTP_403_FORBIDDEN)
 
 
-class RatingViewSet(BaseViewSet, ListCreateAPIView, UpdateAPIView, DestroyAPIView):
+class RatingViewSet(ExportMixin, BaseViewSet, ListCreateAPIView, UpdateAPIView, DestroyAPIView):
     """
     GET api/ratings/
     GET /api/ratings/?festival={id}/
+    GET /api/ratings/export/?festival={id}&format={csv|ndjson}
     POST api/ratings/
     PUT api/ratings/{id}/
     PATCH api/ratings/{id}/
@@ -198,15 +633,42 @@ class RatingViewSet(BaseViewSet, ListCreateAPIView, UpdateAPIView, DestroyAPIVie
         "update": serializers.RatingDetailSerializer,
         "partial_update": serializers.RatingDetailSerializer,
         "has_rated": serializers.RatingListSerializer,
+        "export": serializers.RatingExportSerializer,
     }
 
     permission_classes = (IsAuthenticated, IsAdminUser)
+    pagination_class = RatingCursorPagination
+    query_budgets = {
+        "list": 1,
+        "export": 2,
+        "create": 8,
+        "update": 13,
+        "partial_update": 13,
+        "destroy": 7,
+    }
+    values_actions = ("export",)
 
     filter_backends = [DjangoFilterBackend, OrderingFilter, SearchFilter]
     filterset_class = RatingFilterSet
     search_fields = ["festival"]
     ordering_fields = ["rating"]
 
+    @transaction.atomic
+    def perform_create(self, serializer):
+        # The aggregates are updated by the post_save signal.
+        rating: Rating = serializer.save()
+        Festival.record_activity({rating.festival_id: 1}, "rating")
+
+    @transaction.atomic
+    def perform_update(self, serializer):
+        # The aggregates are updated by the post_save signal.
+        serializer.save()
+
+    @transaction.atomic
+    def perform_destroy(self, instance):
+        # The aggregates are updated by the post_delete signal, which cascades from users too.
+        instance.delete()
+
     def update(self, request, *args, **kwargs):
         return self.__has_permission(super().update, request, *args, **kwargs)
 
@@ -218,17 +680,137 @@ class RatingViewSet(BaseViewSet, ListCreateAPIView, UpdateAPIView, DestroyAPIVie
 
     def __has_permission(self, func, request, *args, **kwargs):
         rating: Rating = self.get_object()
-        if rating.user == self.request.user:
+        if rating.user_id == self.request.user.pk:
             return func(request, *args, **kwargs)
         return Response(status=HTTP_403_FORBIDDEN)
 
 
+class TicketingViewSet(BaseViewSet):
+    """
+    POST /api/ticketings/{name}/reserve/
+    """
+
+    queryset = Ticketing.objects.all()
+
+    serializer_class = serializers.TicketingStatusSerializer
+    serializers_class = {
+        "reserve": serializers.ReservationSerializer,
+    }
+
+    permission_classes = (IsAuthenticated, IsAdminUser)
+    query_budgets = {"reserve": 4}
+
+    @extend_schema(responses={200: serializers.TicketingStatusSerializer, 409: serializers.TicketingStatusSerializer})
+    @action(detail=True, methods=["POST"])
+    def reserve(self, request, *args, **kwargs):
+        ticketing: Ticketing = self.get_object()
+
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        if not ticketing.reserve(serializer.validated_data["quantity"]):
+            return Response(status=HTTP_409_CONFLICT, data=serializers.TicketingStatusSerializer(ticketing).data)
+
+        return Response(status=HTTP_200_OK, data=serializers.TicketingStatusSerializer(ticketing).data)
+
+
+class ChangeViewSet(BaseViewSet):
+    """
+    GET /api/changes/?since={seq}&limit={limit}
+    """
+
+    queryset = Change.objects.all()
+
+    serializer_class = serializers.ChangeFeedSerializer
+    # Model and serializer of the objects of each model name of the change log.
+    change_models = {
+        "festival": (Festival, serializers.FestivalSerializer),
+        "comment": (Comment, serializers.CommentChangeSerializer),
+        "rating": (Rating, serializers.RatingExportSerializer),
+        "ticketing": (Ticketing, serializers.TicketingChangeSerializer),
+    }
+
+    permission_classes = (IsAuthenticated, IsAdminUser)
+    query_budgets = {"list": 6}
+    # Batches are paginated by sequence number.
+    pagination_class = None
+
+    @extend_schema(
+        parameters=[serializers.ChangesQuerySerializer],
+        responses={200: serializers.ChangeFeedSerializer, 410: serializers.EmptySerializer},
+    )
+    def list(self, request, *args, **kwargs):
+        """
+        The changes made after the since sequence number, up to limit of them, with the current representation of
+        each changed object, or a tombstone for a deleted one. Changes of an object superseded by a later one of the
+        same batch are left out. A tombstone of a festival stands for its comments, ratings and ticketings. Start from
+        0, then send the next of each response until more is false; 410 once since predates the compacted tombstones,
+        from when the client must sync again from 0.
+        """
+        query = serializers.ChangesQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        since = query.validated_data["since"]
+        limit = query.validated_data.get("limit", settings.CHANGE_LOG_SETTINGS["PAGE_SIZE"])
+
+        if since and since < ChangeHorizon.get():
+            return Response(status=HTTP_410_GONE)
+
+        rows: list[Change] = list(self.get_queryset().filter(seq__gt=since).order_by("seq")[: limit + 1])
+        more = len(rows) > limit
+        rows = rows[:limit]
+        latest = sorted({(row.model, row.object_id): row for row in rows}.values(), key=lambda row: row.seq)
+
+        representations = {}
+        for name, (model, serializer_class) in self.change_models.items():
+            if object_ids := [row.object_id for row in latest if row.model == name and not row.deleted]:
+                objects = list(model.objects.filter(pk__in=object_ids).order_by())
+                representations[name] = dict(
+                    zip((str(obj.pk) for obj in objects), serializer_class(objects, many=True).data)
+                )
+
+        changes = [
+            {
+                "seq": row.seq,
+                "model": row.model,
+                "id": row.object_id,
+                "deleted": row.deleted,
+                "data": representations[row.model].get(row.object_id) if not row.deleted else None,
+            }
+            for row in latest
+            # An object deleted since, whose tombstone comes later.
+            if row.deleted or row.object_id in representations[row.model]
+        ]
+        serializer = self.get_serializer({"next": rows[-1].seq if rows else since, "more": more, "changes": changes})
+
+        return Response(status=HTTP_200_OK, data=serializer.data)
+
+
+class CacheViewSet(BaseViewSet):
+    """
+    GET /api/cache/stats/
+    """
+
+    serializer_class = serializers.CacheStatsSerializer
+
+    permission_classes = (IsAuthenticated, IsAdminUser)
+    query_budgets = {"stats": 0}
+
+    @action(detail=False, methods=["GET"])
+    def stats(self, request, *args, **kwargs):
+        serializer = self.get_serializer(response_cache.get_stats())
+
+        return Response(status=HTTP_200_OK, data=serializer.data)
+
+
 class UserViewSet(BaseViewSet, CreateAPIView):
     """
     POST /api/user/
     PUT /api/user/login/
     PATCH /api/user/login/
+    POST /api/user/token/
+    POST /api/user/batch/
     DELETE /api/user/logout/
+    GET /api/user/recommendations/?region={region}&discipline={discipline}&limit={limit}
     """
 
     queryset = User.objects.all()
@@ -236,10 +818,14 @@ class UserViewSet(BaseViewSet, CreateAPIView):
     serializer_class = serializers.UserRegisterSerializer
     serializers_class = {
         "login": serializers.UserLoginSerializer,
+        "token": serializers.UserLoginSerializer,
+        "batch": serializers.UserBatchSerializer,
         "logout": serializers.EmptySerializer,
+        "recommendations": serializers.EmptySerializer,
     }
 
     permissions_classes = (AllowAny,)
+    query_budgets = {"create": 3, "login": 5, "token": 3, "batch": 3, "logout": 1, "recommendations": 2}
 
     def create(self, request, *args, **kwargs):
         if self.request.user.is_authenticated:
@@ -248,10 +834,9 @@ class UserViewSet(BaseViewSet, CreateAPIView):
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
 
-        user: User = User.objects.create_user(username=request.data["username"], email=request.data["email"])
-        user.set_password(request.data["password"])
-        user.is_active = True
-        user.save()
+        User.objects.create_user(
+            username=request.data["username"], email=request.data["email"], password=request.data["password"]
+        )
 
         return Response(status=HTTP_201_CREATED, data=serializer.data)
 
@@ -270,12 +855,86 @@ class UserViewSet(BaseViewSet, CreateAPIView):
 
         return Response(status=HTTP_202_ACCEPTED)
 
+    @extend_schema(responses={201: serializers.TokenSerializer})
+    @action(detail=False, methods=["POST"])
+    def token(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        user: User = authenticate(request, **serializer.validated_data)
+
+        if user is None or not user.is_active:
+            return Response(status=HTTP_400_BAD_REQUEST)
+
+        token, _ = Token.objects.get_or_create(user=user)
+
+        return Response(status=HTTP_201_CREATED, data=serializers.TokenSerializer(token).data)
+
+    @extend_schema(responses={201: serializers.UserBatchResultSerializer})
+    @action(detail=False, methods=["POST"], permission_classes=[IsAuthenticated, IsAdminUser])
+    def batch(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        importer = provisioning.UserImporter(provisioning.get_pool(), provisioning.get_workers())
+        importer.import_batch(serializer.validated_data["users"])
+
+        result = serializers.UserBatchResultSerializer(
+            {
+                **importer.counts,
+                "errors": [
+                    {"record": record, "username": username, "messages": messages}
+                    for record, username, messages in importer.errors
+                ],
+            }
+        )
+
+        return Response(status=HTTP_201_CREATED, data=result.data)
+
     @extend_schema(responses={204: serializers.EmptySerializer})
     @action(detail=False, methods=["DELETE"])
     def logout(self, request, *args, **kwargs):
         if not self.request.user.is_authenticated:
             return Response(status=HTTP_403_FORBIDDEN)
 
+        if isinstance(request.auth, Token):
+            Token.objects.filter(key=request.auth.key).delete()
         logout(request)
 
         return Response(status=HTTP_204_NO_CONTENT)
+
+    @extend_schema(
+        parameters=[serializers.LeaderboardQuerySerializer],
+        responses={200: serializers.RankedFestivalSerializer(many=True)},
+    )
+    @action(detail=False, methods=["GET"], permission_classes=[IsAuthenticated], pagination_class=None)
+    def recommendations(self, request, *args, **kwargs):
+        query = serializers.LeaderboardQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+
+        filters = {
+            f"neighbour__{name}": query.validated_data[name]
+            for name in ("region", "discipline")
+            if name in query.validated_data
+        }
+        # Festivals the user did not rate, scored by the sum of their similarities with the festivals the user rated,
+        # each weighted by how much more (or less) than PRIOR_MEAN the user rated it.
+        prior_mean = settings.LEADERBOARD_SETTINGS["PRIOR_MEAN"]
+        scores = (
+            FestivalNeighbour.objects.filter(festival__ratings__user=request.user, **filters)
+            .exclude(neighbour__ratings__user=request.user)
+            .values("neighbour")
+            .annotate(score=Sum(F("similarity") * (F("festival__ratings__rating") - prior_mean)))
+            .filter(score__gt=0)
+            .order_by("-score", "neighbour")
+            .values_list("neighbour", "score")[: query.validated_data["limit"]]
+        )
+        scores = dict(scores)
+        festivals = Festival.objects.in_bulk(scores)
+        for pk, festival in festivals.items():
+            festival.score = scores[pk]
+        serializer = serializers.RankedFestivalSerializer(
+            [festivals[pk] for pk in scores if pk in festivals], many=True
+        )
+
+        return Response(status=HTTP_200_OK, data=serializer.data)